@@ -29,8 +29,27 @@ class Mhx2Config(ExportConfig):
     def __init__(self):
         ExportConfig.__init__(self)
         self.useBinary     = False
+        self.useArrays     = False
+        self.codec         = "gzip"
+        self.compressLevel = 9
+        self.quantiseBits  = 0
 
 
+# Compression of binary files: label, codec. The level is chosen freely,
+# from 1 (fast) to 9 (small).
+CompressionCodecs = [
+    ("gzip compression", "gzip"),
+    ("bzip2 compression", "bz2"),
+    ("xz compression", "lzma"),
+]
+
+# Storage of vertices and UVs: label, bits (0 for text)
+GeometryPresets = [
+    ("Float geometry", 0),
+    ("16-bit geometry", 16),
+    ("32-bit geometry", 32),
+]
+
 class ExporterMhx2(Exporter):
     def __init__(self):
         Exporter.__init__(self)
@@ -39,11 +58,23 @@ class ExporterMhx2(Exporter):
         self.fileExtension = "mhx2"
         self.orderPriority = 80.0
         self.useBinary = False
+        self.useArrays = False
+        self.compression = []
+        self.compressLevel = None
+        self.geometry = []
 
     def build(self, options, taskview):
         import gui
         Exporter.build(self, options, taskview)
         self.useBinary   = options.addWidget(gui.CheckBox("Binary file", False))
+        self.compression = []
+        for label,codec in CompressionCodecs:
+            options.addWidget(gui.RadioButton(self.compression, label, (codec == "gzip")))
+        self.compressLevel = options.addWidget(gui.Slider(value=9, min=1, max=9, label="Compression level: %d"))
+        self.useArrays   = options.addWidget(gui.CheckBox("Memory-mapped arrays", False))
+        self.geometry = []
+        for label,bits in GeometryPresets:
+            options.addWidget(gui.RadioButton(self.geometry, label, (bits == 0)))
         self.useExpressions   = options.addWidget(gui.CheckBox("Expressions", False))
         self.usePoses   = options.addWidget(gui.CheckBox("Poses", False))
         #self.feetOnGround   = options.addWidget(gui.CheckBox("Feet on ground", True))
@@ -60,6 +91,14 @@ class ExporterMhx2(Exporter):
         cfg = Mhx2Config()
         cfg.useTPose          = False
         cfg.useBinary         = self.useBinary.selected
+        cfg.useArrays         = self.useArrays.selected
+        for button,(_label,codec) in zip(self.compression, CompressionCodecs):
+            if button.selected:
+                cfg.codec = codec
+        cfg.compressLevel     = int(round(self.compressLevel.getValue()))
+        for button,(_label,bits) in zip(self.geometry, GeometryPresets):
+            if button.selected:
+                cfg.quantiseBits = bits
         cfg.useExpressions    = self.useExpressions.selected
         cfg.usePoses          = self.usePoses.selected
         cfg.feetOnGround      = self.feetOnGround.selected
@@ -22,6 +22,8 @@
 # changed for triangle-support    by punkduck
 
 Mhx2Version = "0.31"
+Mhx2ArrayVersion = "0.50"
+Mhx2QuantisedVersion = "0.51"
 
 import os
 import sys
@@ -35,7 +37,7 @@ from core import G
 import log
 
 import skeleton
-from .save_json import saveJson
+from .save_json import saveJson, quantiseArray
 from .hm8 import getBaseMesh
 from material import getSkinBlender
 from uuid import uuid4
@@ -72,7 +74,12 @@ def exportMhx2(filepath, cfg):
         rawWeights = None
 
     mhFile = OrderedDict()
-    mhFile["mhx2_version"] = Mhx2Version
+    if cfg.quantiseBits:
+        mhFile["mhx2_version"] = Mhx2QuantisedVersion
+    elif cfg.useArrays:
+        mhFile["mhx2_version"] = Mhx2ArrayVersion
+    else:
+        mhFile["mhx2_version"] = Mhx2Version
     log.message(mhFile)
     #mhFile["basemesh"] = getBaseMesh()
 
@@ -106,7 +113,7 @@ def exportMhx2(filepath, cfg):
         addGeometry(mhGeos, mesh, skel, rawWeights, mats, mname, cfg)
 
     G.app.progress(0.2, text="Writing Json file %s" % filepath)
-    saveJson(mhFile, filepath, cfg.useBinary)
+    saveJson(mhFile, filepath, cfg.useBinary, cfg.useArrays, cfg.codec, cfg.compressLevel)
     G.app.progress(1)
     log.message("%s written" % filepath)
 
@@ -338,18 +345,18 @@ def addGeometry(mhGeos, mesh, skel, rawWeights, mats, mname, cfg):
 
     mhMesh = mhGeo["mesh"] = OrderedDict()
     if pxy and pxy.type == 'Proxymeshes':
-        addMesh(mhMesh, mesh.clone())
+        addMesh(mhMesh, mesh.clone(), cfg.quantiseBits)
     else:
-        addMesh(mhMesh, mesh)
+        addMesh(mhMesh, mesh, cfg.quantiseBits)
     mhSeed = mhGeo["seed_mesh"] = OrderedDict()
     obj = mesh.object
-    addMesh(mhSeed, obj.getSeedMesh())
+    addMesh(mhSeed, obj.getSeedMesh(), cfg.quantiseBits)
 
     if pxy:
         if pxy.type == 'Proxymeshes':
             mhGeo["human"] = True
             mhProxySeed = mhGeo["proxy_seed_mesh"] = OrderedDict()
-            addMesh(mhProxySeed, obj.getProxyMesh())
+            addMesh(mhProxySeed, obj.getProxyMesh(), cfg.quantiseBits)
         else:
             mhGeo["human"] = False
             mhProxySeed = None
@@ -421,9 +428,13 @@ def addWeights(mhMesh, skel, vertexWeights):
             mhWeights[bone.name] = np.array(assoc)
 
 
-def addMesh(mhGeo, mesh):
-    mhGeo["vertices"] = mesh.coord
-    mhGeo["uv_coordinates"] = mesh.texco
+def addMesh(mhGeo, mesh, bits=0):
+    if bits:
+        mhGeo["vertices"] = quantiseArray(mesh.coord, bits)
+        mhGeo["uv_coordinates"] = quantiseArray(mesh.texco, bits)
+    else:
+        mhGeo["vertices"] = mesh.coord
+        mhGeo["uv_coordinates"] = mesh.texco
     #
     # we need to create different output for 3 or 4 vertices
     # otherwise we can trouble in blender for tri-angles
@@ -42,6 +42,10 @@ if "bpy" in locals():
     importlib.reload(error)
     importlib.reload(config)
     importlib.reload(load_json)
+    importlib.reload(cache)
+    importlib.reload(asset_pack)
+    importlib.reload(profiler)
+    importlib.reload(topology)
     importlib.reload(masks)
     importlib.reload(materials)
     importlib.reload(shaders)
@@ -58,6 +62,7 @@ if "bpy" in locals():
     importlib.reload(visemes)
     importlib.reload(merge)
     importlib.reload(importer)
+    importlib.reload(crowd)
 else:
     import bpy
     print("Loading MHX2 importer-runtime v %d.%d" % bl_info["version"])
@@ -65,6 +70,11 @@ else:
     from . import import_props
     from . import buttons28
     from . import armature
+    from . import load_json
+    from . import cache
+    from . import asset_pack
+    from . import profiler
+    from . import topology
     from . import materials
     from . import shaders
     from . import proxy
@@ -79,6 +89,7 @@ else:
     from . import visemes
     from . import merge
     from . import importer
+    from . import crowd
 
 from bpy.props import *
 from .error import *
@@ -90,6 +101,15 @@ Region = "UI"
 #    Setup panel
 #------------------------------------------------------------------------
 
+def drawProfileRecord(layout, record, pad):
+    # Profiles saved before operators were counted have no "operators".
+    layout.label(text="%s%s: %.3f s, %.1f MB, %d/%d" %
+                 (pad, record["name"], record["time"], record["peak_mb"], record["mode_sets"],
+                  record.get("operators", 0)))
+    for child in record["children"]:
+        drawProfileRecord(layout, child, pad+"    ")
+
+
 class MHX_PT_Setup(bpy.types.Panel):
     bl_label = "MHX Setup"
     bl_space_type = "VIEW_3D"
@@ -102,8 +122,18 @@ class MHX_PT_Setup(bpy.types.Panel):
         scn = context.scene
 
         layout.operator("import_scene.makehuman_mhx2")
+        layout.operator("mhx2.build_asset_pack")
         #layout.operator("mhx2.make_skin_shader")
 
+        report = profiler.getProfile(scn)
+        if report:
+            box = layout.box()
+            box.label(text="Import Profile: %.2f s, %d mode switches, %d operators" %
+                      (report["time"], report["mode_sets"], report.get("operators", 0)))
+            for record in report["phases"]:
+                drawProfileRecord(box, record, "")
+
+
         if (ob is None or
             (ob.type == 'MESH' and not ob.MhxUuid) or
             (ob.type == 'ARMATURE' and not ob.MhxRig) or
@@ -567,6 +597,7 @@ classes = [
 
 def menu_func(self, context):
     self.layout.operator(importer.MHX_OT_Import.bl_idname, text="MakeHuman (.mhx2)")
+    self.layout.operator(crowd.MHX_OT_ImportCrowd.bl_idname, text="MakeHuman Crowd (.mhx2)")
 
 def register():
     bpy.types.Object.MhxRig = StringProperty(default="")
@@ -628,6 +659,7 @@ def register():
 
     bpy.types.Scene.MhxUseConservativeMasks = BoolProperty(name="Conservative Masks", description="Only delete faces with two delete-verts", default=True)
     bpy.types.Scene.MhxDesignHuman = StringProperty(default="None")
+    bpy.types.Scene.MhxImportProfile = StringProperty(default="")
 
     bone_drivers.initialize()
     drivers.initialize()
@@ -636,6 +668,7 @@ def register():
     hair.initialize()
     hide.initialize()
     importer.initialize()
+    crowd.initialize()
     layers.initialize()
     materials.initialize()
     merge.initialize()
@@ -660,6 +693,7 @@ def unregister():
     hair.uninitialize()
     hide.uninitialize()
     importer.uninitialize()
+    crowd.uninitialize()
     layers.uninitialize()
     materials.uninitialize()
     merge.uninitialize()
@@ -669,6 +703,12 @@ def unregister():
     #varia.uninitialize()
     visemes.uninitialize()
     armature.rigify.uninitialize()
+    load_json.clearAssetCache()
+    proxy.clearFittingMatrices()
+    topology.clearTopologies()
+    armature.jointplan.clearJointPlans()
+    armature.parser.clearRigTemplates()
+    asset_pack.closeAssetPack()
 
     for cls in classes:
         bpy.utils.unregister_class(cls)
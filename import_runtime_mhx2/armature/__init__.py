@@ -36,6 +36,7 @@ if "bpy" in locals():
     importlib.reload(rig_merge)
     importlib.reload(rig_panel)
     importlib.reload(rig_rigify)
+    importlib.reload(jointplan)
     importlib.reload(parser)
     importlib.reload(constraints)
     importlib.reload(rigify)
@@ -56,6 +57,7 @@ else:
     from . import rig_merge
     from . import rig_panel
     from . import rig_rigify
+    from . import jointplan
     from . import parser
     from . import constraints
     from . import rigify
@@ -24,17 +24,17 @@ import bpy
 from bpy.props import *
 from mathutils import Vector
 from ..utils import *
+from ..profiler import setMode
 from .flags import *
 
 
 def buildRig(mhHuman, mhSkel, cfg, context):
-    from .parser import Parser
+    from .parser import getParser
     from ..bone_drivers import buildAnimation, buildExpressions
     from ..geometries import getScaleOffset
 
     coll = getCollection(context)
-    parser = Parser(mhHuman, mhSkel, cfg)
-    parser.setup(mhHuman, mhSkel)
+    parser = getParser(mhHuman, mhSkel, cfg)
 
     rname = mhHuman["name"].split(":")[0]
     amt = bpy.data.armatures.new(rname)
@@ -49,9 +49,11 @@ def buildRig(mhHuman, mhSkel, cfg, context):
 
     offset = Vector((0,0,0))
 
-    bpy.ops.object.mode_set(mode='EDIT')
+    # Bones get their final names from the start, so everything that
+    # only exists in edit mode is done in a single edit session.
+    setMode('EDIT')
     for bone in parser.bones.values():
-        eb = amt.edit_bones.new(bone.name)
+        eb = amt.edit_bones.new(parser.getFinalName(bone.name))
         eb.head = zup(bone.head)+offset
         eb.tail = zup(bone.tail)+offset
         try:
@@ -67,27 +69,29 @@ def buildRig(mhHuman, mhSkel, cfg, context):
             eb.layers = [True] + 31*[False]
 
     for bone in parser.bones.values():
-        eb = amt.edit_bones[bone.name]
+        eb = amt.edit_bones[parser.getFinalName(bone.name)]
         if bone.parent:
-            eb.parent = amt.edit_bones[bone.parent]
+            eb.parent = amt.edit_bones[parser.getFinalName(bone.parent)]
         elif parser.master and bone.name != parser.master:
-            eb.parent = amt.edit_bones[parser.master]
+            eb.parent = amt.edit_bones[parser.getFinalName(parser.master)]
         eb.use_connect = bone.conn
 
-    bpy.ops.object.mode_set(mode='POSE')
+    # The rest is done through the data API in object mode.
+    setMode('OBJECT')
 
     rotmodes = [
         'QUATERNION', 'XYZ', 'XZY', 'YXZ', 'YZX', 'ZXY', 'ZYX'
     ]
 
     for bone in parser.bones.values():
-        b = amt.bones[bone.name]
+        bname = parser.getFinalName(bone.name)
+        b = amt.bones[bname]
         b.use_deform = bone.deform
         b.use_inherit_scale = bone.scale
         b.show_wire = bone.wire
         b.hide_select = bone.restr
 
-        pb = rig.pose.bones[bone.name]
+        pb = rig.pose.bones[bname]
         pb.lock_location = [bool(i) for i in bone.lockLocation]
         pb.lock_rotation = [bool(i) for i in bone.lockRotation]
         pb.lock_scale = [bool(i) for i in bone.lockScale]
@@ -95,18 +99,16 @@ def buildRig(mhHuman, mhSkel, cfg, context):
 
     if parser.boneGroups:
         for bgname,theme,layer in parser.boneGroups:
-            bpy.ops.pose.group_add()
-            bgrp = rig.pose.bone_groups.active
-            bgrp.name = bgname
+            bgrp = rig.pose.bone_groups.new(name=bgname)
             bgrp.color_set = theme
             for bone in parser.bones.values():
                 if bone.layers & layer != 0:
-                    pb = rig.pose.bones[bone.name]
+                    pb = rig.pose.bones[parser.getFinalName(bone.name)]
                     pb.bone_group = bgrp
 
     for bname,constraints in parser.constraints.items():
         try:
-            pb = rig.pose.bones[bname]
+            pb = rig.pose.bones[parser.getFinalName(bname)]
         except KeyError:
             print("No such bone:", bname)
             continue
@@ -126,13 +128,14 @@ def buildRig(mhHuman, mhSkel, cfg, context):
             gizmo.parent = empty
 
         for bname,gname in parser.customShapes.items():
+            nname = parser.getFinalName(bname)
             if (gname and
-                bname in rig.pose.bones.keys()):
+                nname in rig.pose.bones.keys()):
                 scale = parser.getBoneScale(bname)
                 gizmo = gizmos[gname]
                 if scale is not None:
                     gizmo = rescaleGizmo(gizmo, scale)
-                pb = rig.pose.bones[bname]
+                pb = rig.pose.bones[nname]
                 pb.custom_shape = gizmo
 
     for key,data in cfg.properties.items():
@@ -149,20 +152,10 @@ def buildRig(mhHuman, mhSkel, cfg, context):
         setattr(bpy.types.Object, key, prop)
         setattr(rig, key, default)
 
-    addPropDrivers(rig, parser.lrPropDrivers, ".L", "Mha")
-    addPropDrivers(rig, parser.lrPropDrivers, ".R", "Mha")
-    addPropDrivers(rig, parser.propDrivers, "", "Mha")
-
-    bpy.ops.object.mode_set(mode='EDIT')
-    # Rename bones according to config.
-    # Vertex groups already renamed by parser.
-    # Don't need to worry about deform prefix, because
-    # not used by such rigs
-    for bname,nname in cfg.bones.items():
-        eb = amt.edit_bones[bname]
-        eb.name = nname
+    addPropDrivers(rig, parser, parser.lrPropDrivers, ".L", "Mha")
+    addPropDrivers(rig, parser, parser.lrPropDrivers, ".R", "Mha")
+    addPropDrivers(rig, parser, parser.propDrivers, "", "Mha")
 
-    bpy.ops.object.mode_set(mode='OBJECT')
     if cfg.useRigify:
         from .rigify import rigifyMhx
         rig.MhxRigify = True
@@ -191,12 +184,12 @@ def getLayers(num):
     return layers
 
 
-def addPropDrivers(rig, drvlist, suffix, prefix):
+def addPropDrivers(rig, parser, drvlist, suffix, prefix):
     from ..drivers import addDriver
 
     for drv in drvlist:
         bname,cname,data,expr = drv
-        bname = "%s%s" % (bname, suffix)
+        bname = parser.getFinalName("%s%s" % (bname, suffix))
         data = [(("%s%s%s" % (prefix, prop, suffix)).replace(".","_"), 1) for prop in data]
         pb = rig.pose.bones[bname]
         cns = pb.constraints[cname]
@@ -104,7 +104,7 @@ class CIkConstraint(CConstraint):
     def build(self, pb, rig, parser):
         cns = CConstraint.build(self, pb, rig, parser)
         cns.target = rig
-        cns.subtarget = self.subtar
+        cns.subtarget = parser.getFinalName(self.subtar)
         cns.use_tail = self.useTail
 
         #self.pos_lock Array 1 1 1
@@ -118,7 +118,7 @@ class CIkConstraint(CConstraint):
 
         if self.pole:
             cns.pole_angle = self.angle*D
-            cns.pole_subtarget = self.ptar
+            cns.pole_subtarget = parser.getFinalName(self.ptar)
             cns.pole_target = rig
 
         cns.use_location = self.useLoc
@@ -165,7 +165,7 @@ class CActionConstraint(CConstraint):
         else:
             cns.maximum = self.amax
             cns.minimum = self.amin
-        cns.subtarget = self.subtar
+        cns.subtarget = parser.getFinalName(self.subtar)
         cns.transform_channel = self.channel
 
 
@@ -183,13 +183,13 @@ class CCopyRotConstraint(CConstraint):
         cns.use_x,cns.use_y,cns.use_z = self.use
         cns.invert_x,cns.invert_y,cns.invert_z = self.invert
         if isinstance(self.subtar, tuple):
-            bname1,bname2 = self.subtar
+            bname1,bname2 = [parser.getFinalName(bname) for bname in self.subtar]
             if bname1 in rig.data.bones.keys():
                 cns.subtarget = bname1
             else:
                 cns.subtarget = bname2
         else:
-            cns.subtarget = self.subtar
+            cns.subtarget = parser.getFinalName(self.subtar)
         cns.use_offset = self.useOffs
 
 
@@ -209,7 +209,7 @@ class CCopyLocConstraint(CConstraint):
         cns.use_x,cns.use_y,cns.use_z = self.use
         cns.invert_x,cns.invert_y,cns.invert_z = self.invert
         cns.head_tail = self.head_tail
-        cns.subtarget = self.subtar
+        cns.subtarget = parser.getFinalName(self.subtar)
         cns.use_offset = self.useOffs
 
 
@@ -224,7 +224,7 @@ class CCopyScaleConstraint(CConstraint):
         cns = CConstraint.build(self, pb, rig, parser)
         cns.target = rig
         cns.use_x,cns.use_y,cns.use_z = self.use
-        cns.subtarget = self.subtar
+        cns.subtarget = parser.getFinalName(self.subtar)
         cns.use_offset = self.useOffs
 
 
@@ -238,7 +238,7 @@ class CCopyTransConstraint(CConstraint):
         cns = CConstraint.build(self, pb, rig, parser)
         cns.target = rig
         cns.head_tail = self.head_tail
-        cns.subtarget = self.subtar
+        cns.subtarget = parser.getFinalName(self.subtar)
 
 
 class CLimitRotConstraint(CConstraint):
@@ -325,7 +325,7 @@ class CTransformConstraint(CConstraint):
     def build(self, pb, rig, parser):
         cns = CConstraint.build(self, pb, rig, parser)
         cns.target = rig
-        cns.subtarget = self.subtar
+        cns.subtarget = parser.getFinalName(self.subtar)
         cns.map_from = self.map_from
         cns.from_min_x = self.from_min[0]
         cns.from_min_y = self.from_min[1]
@@ -355,7 +355,7 @@ class CDampedTrackConstraint(CConstraint):
     def build(self, pb, rig, parser):
         cns = CConstraint.build(self, pb, rig, parser)
         cns.target = parser.name
-        cns.subtarget = self.subtar
+        cns.subtarget = parser.getFinalName(self.subtar)
         cns.head_tail = self.headtail
         cns.track_axis = self.track
 
@@ -369,7 +369,7 @@ class CLockedTrackConstraint(CConstraint):
     def build(self, pb, rig, parser):
         cns = CConstraint.build(self, pb, rig, parser)
         cns.target = rig
-        cns.subtarget = self.subtar
+        cns.subtarget = parser.getFinalName(self.subtar)
         cns.track_axis = self.trackAxis
 
 
@@ -407,7 +407,7 @@ class CStretchToConstraint(CConstraint):
         cns.bulge = self.bulge
         cns.head_tail = self.head_tail
         cns.keep_axis = self.axis
-        cns.subtarget = self.subtar
+        cns.subtarget = parser.getFinalName(self.subtar)
         cns.volume = self.volume
         if self.rest_length != None:
             cns.rest_length = self.rest_length*scale
@@ -433,7 +433,7 @@ class CTrackToConstraint(CConstraint):
         cns.head_tail = self.head_tail
         cns.track_axis = self.track_axis
         cns.up_axis = self.up_axis
-        cns.subtarget = self.subtar
+        cns.subtarget = parser.getFinalName(self.subtar)
         cns.use_target_z = self.use_target_z
 
 
@@ -447,7 +447,7 @@ class CLimitDistConstraint(CConstraint):
         cns = CConstraint.build(self, pb, rig, parser)
         cns.target = rig
         cns.limit_mode = self.limit_mode
-        cns.subtarget = self.subtar
+        cns.subtarget = parser.getFinalName(self.subtar)
 
 
 class CChildOfConstraint(CConstraint):
@@ -461,7 +461,7 @@ class CChildOfConstraint(CConstraint):
     def build(self, pb, rig, parser):
         cns = CConstraint.build(self, pb, rig, parser)
         cns.target = rig
-        cns.subtarget = self.subtar
+        cns.subtarget = parser.getFinalName(self.subtar)
         cns.use_location_x = self.locx
         cns.use_location_y = self.locy
         cns.use_location_z = self.locz
@@ -504,7 +504,7 @@ class CFloorConstraint(CConstraint):
         cns.target = rig
         cns.floor_location = self.floor_location
         cns.offset= self.offset
-        cns.subtarget = self.subtar
+        cns.subtarget = parser.getFinalName(self.subtar)
         cns.use_rotation = self.use_rotation
         cns.use_sticky = self.use_sticky
 
@@ -0,0 +1,235 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  Authors:             Thomas Larsson
+#  Script Copyright (C) Thomas Larsson 2014 - 2020
+#  Script Copyright (C) MakeHuman Community 2020
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import hashlib
+import numpy as np
+
+from ..hm8 import FirstJointVert, JointNames, NTotalVerts
+
+#-------------------------------------------------------------------------------
+#   Compiled joint plan.
+#   The symbolic Joints lists of the rig_*.py files are compiled once per
+#   rig configuration into a list of steps, where joint names are replaced
+#   by slot numbers. The first slots hold the joint helper boxes, and each
+#   step adds one slot. Since a step only refers to earlier slots, the
+#   plan can be evaluated for K characters at once, with one K x 3 array
+#   per slot. Parser.setupJoints is the reference for the semantics.
+#-------------------------------------------------------------------------------
+
+theJointPlans = {}
+
+def getJointPlan(joints, planeJoints=[], planes={}):
+    key = repr((list(joints), list(planeJoints), sorted(planes.items())))
+    key = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    if key not in theJointPlans.keys():
+        theJointPlans[key] = JointPlan(joints, planeJoints, planes)
+    return theJointPlans[key]
+
+
+def clearJointPlans():
+    theJointPlans.clear()
+
+
+class JointPlan:
+
+    def __init__(self, joints, planeJoints=[], planes={}):
+        boxNames = JointNames + ["ground"]
+        self.nboxes = len(boxNames)
+        self.steps = []
+        jointLocs = dict([(name, n) for n,name in enumerate(boxNames)])
+        slots = {}
+
+        for (key, type, data) in joints:
+            if type == 'j':
+                slots[key] = slots[data] = jointLocs[data]
+                continue
+            elif type == 'b':
+                slots[key] = jointLocs[key] = slots[data]
+                continue
+            elif type == 'a':
+                step = (type, getFloats(data))
+            elif type == 'v':
+                step = (type, int(data))
+            elif type == 'x':
+                step = (type, getFloats((data[0], data[2], -float(data[1]))))
+            elif type == 'vo':
+                step = (type, int(data[0]), getFloats((data[1], data[3], -float(data[2]))))
+            elif type == 'vl':
+                ((k1, v1), (k2, v2)) = data
+                step = (type, float(k1), int(v1), float(k2), int(v2))
+            elif type == 'f':
+                (raw, head, tail, offs) = data
+                step = (type, slots[raw], slots[head], slots[tail], getFloats(offs))
+            elif type == 'n':
+                step = (type,) + tuple([slots[joint] for joint in data])
+            elif type == 'p':
+                step = (type,) + tuple([slots[joint] for joint in data])
+            elif type == 'vz':
+                step = (type, int(data[0]), slots[data[1]])
+            elif type == 'X':
+                step = (type, slots[data[0]], getFloats(data[1]))
+            elif type == 'l':
+                ((k1, joint1), (k2, joint2)) = data
+                step = (type, float(k1), slots[joint1], float(k2), slots[joint2])
+            elif type == 'o':
+                (joint, offsSym) = data
+                if isinstance(offsSym, str):
+                    step = ('ol', slots[joint], slots[offsSym])
+                else:
+                    step = (type, slots[joint], getFloats(offsSym))
+            else:
+                raise NameError("Unknown %s" % type)
+            slots[key] = self.addStep(step)
+
+        for key,data in planeJoints:
+            p0,plane,dist = data
+            p1,p2,p3 = planes[plane]
+            step = ('plane', slots[p0], slots[p1], slots[p2], slots[p3], float(dist))
+            slots[key] = self.addStep(step)
+
+        self.slots = slots
+
+
+    def addStep(self, step):
+        self.steps.append(step)
+        return self.nboxes + len(self.steps) - 1
+
+
+    def evaluate(self, coords, scales, offsets):
+        """
+        Evaluate the plan for K characters, given the K x N x 3 joint
+        coordinates of their seed meshes, as set up by
+        Parser.defineJointLocations, and their scales and offsets.
+        Returns a dict from joint name to a K x 3 array of locations.
+        """
+        coords = np.asarray(coords, dtype=np.float64)
+        nchars = len(coords)
+        scales = np.broadcast_to(np.asarray(scales, dtype=np.float64).reshape(-1,1), (nchars,1))
+        offsets = np.broadcast_to(np.asarray(offsets, dtype=np.float64).reshape(-1,3), (nchars,3))
+
+        nj = self.nboxes - 1
+        boxes = coords[:, FirstJointVert:FirstJointVert+8*nj].reshape(nchars,nj,8,3).mean(axis=2)
+        ground = coords[:, NTotalVerts-8:NTotalVerts].mean(axis=1)
+        locs = list(boxes.transpose(1,0,2)) + [ground]
+        for step in self.steps:
+            locs.append(StepFunctions[step[0]](locs, coords, scales, offsets, *step[1:]))
+        return dict([(key, locs[slot]) for key,slot in self.slots.items()])
+
+
+def getFloats(data):
+    return np.array([float(x) for x in data], dtype=np.float64)
+
+#-------------------------------------------------------------------------------
+#   Steps. Each step returns a K x 3 array.
+#-------------------------------------------------------------------------------
+
+def dot(a, b):
+    return np.einsum("ki,ki->k", a, b)[:,None]
+
+
+def unit(vec):
+    return vec/np.sqrt(dot(vec, vec))
+
+
+def evalAbsolute(locs, coords, scales, offsets, vec):
+    return vec + offsets
+
+
+def evalVertex(locs, coords, scales, offsets, v):
+    return coords[:,v]
+
+
+def evalConstant(locs, coords, scales, offsets, vec):
+    return np.broadcast_to(vec, (len(coords),3))
+
+
+def evalVertexOffset(locs, coords, scales, offsets, v, offset):
+    return coords[:,v] + scales*offset
+
+
+def evalVertexLinear(locs, coords, scales, offsets, k1, v1, k2, v2):
+    return k1*coords[:,v1] + k2*coords[:,v2]
+
+
+def evalFoot(locs, coords, scales, offsets, raw, head, tail, offs):
+    rloc,hloc,tloc = locs[raw],locs[head],locs[tail]
+    vec = tloc - hloc
+    x = dot(vec, rloc - hloc)/dot(vec, vec)
+    return hloc + x*vec + offs
+
+
+def evalNormalProjection(locs, coords, scales, offsets, raw, j1, j2, j3):
+    rloc,loc1 = locs[raw],locs[j1]
+    n = unit(np.cross(locs[j2] - loc1, locs[j3] - loc1))
+    return rloc - n*dot(rloc - loc1, n)
+
+
+def evalPick(locs, coords, scales, offsets, jx, jy, jz):
+    return np.stack([locs[jx][:,0], locs[jy][:,1], locs[jz][:,2]], axis=1)
+
+
+def evalVertexZ(locs, coords, scales, offsets, v, joint):
+    loc = np.array(locs[joint])
+    loc[:,2] = coords[:,v,2]
+    return loc
+
+
+def evalCross(locs, coords, scales, offsets, joint, vec):
+    return np.cross(locs[joint], vec)
+
+
+def evalLinear(locs, coords, scales, offsets, k1, joint1, k2, joint2):
+    return k1*locs[joint1] + k2*locs[joint2]
+
+
+def evalOffset(locs, coords, scales, offsets, joint, offs):
+    return locs[joint] + scales*offs
+
+
+def evalJointOffset(locs, coords, scales, offsets, joint, offs):
+    return locs[joint] + locs[offs]
+
+
+def evalPlaneJoint(locs, coords, scales, offsets, p0, p1, p2, p3, dist):
+    pvec = unit(locs[p2] - locs[p1])
+    yvec = unit(locs[p3] - locs[p2])
+    n = unit(np.cross(yvec, pvec))
+    vec = unit(locs[p3] - locs[p1])
+    return locs[p0] + scales*dist*np.cross(n, vec)
+
+
+StepFunctions = {
+    'a' :       evalAbsolute,
+    'v' :       evalVertex,
+    'x' :       evalConstant,
+    'vo' :      evalVertexOffset,
+    'vl' :      evalVertexLinear,
+    'f' :       evalFoot,
+    'n' :       evalNormalProjection,
+    'p' :       evalPick,
+    'vz' :      evalVertexZ,
+    'X' :       evalCross,
+    'l' :       evalLinear,
+    'o' :       evalOffset,
+    'ol' :      evalJointOffset,
+    'plane' :   evalPlaneJoint,
+}
@@ -21,8 +21,10 @@
 # ##### END GPL LICENSE BLOCK #####
 
 import os
+import copy
 import math
 import bpy
+import numpy as np
 from mathutils import Vector
 
 from collections import OrderedDict
@@ -31,7 +33,7 @@ from .flags import *
 from ..utils import *
 from .utils import *
 from ..hm8 import *
-from ..load_json import loadJsonRelative
+from ..load_json import loadJsonRelative, thawJson, getPairArrays
 
 from . import rig_joints
 from . import rig_spine
@@ -411,6 +413,7 @@ class Parser:
         if not AutoWeight:
             if mhSkel is None:
                 vgroups = self.readVertexGroupFiles(self.vertexGroupFiles)
+                self.sourceVertexGroups = copyVertexGroups(vgroups)
             else:
                 vgroups = rerig.getVertexGroups(mhHuman, mhSkel)
             addDict(vgroups, self.vertexGroups)
@@ -423,7 +426,28 @@ class Parser:
                 del self.vertexGroups[bname]
                 del self.bones[bname]
 
-        for flag,mergers in [
+        for mergers in self.getMergers():
+            self.mergeBones(mergers)
+
+        if cfg.useDeformNames or cfg.useDeformBones:
+            if cfg.usePenisRig:
+                addDict(rig_spine.PenisArmature, self.deformArmature)
+            if cfg.useDeformBones:
+                self.addDeformBones()
+                #self.renameDeformBones(rig_muscle.Armature)
+                #if cfg.useConstraints:
+                #    self.renameConstraints(rig_muscle.Constraints)
+            self.addDeformVertexGroups(vgroups)
+
+        if cfg.useSplitBones or cfg.useSplitNames:
+            if cfg.useSplitBones:
+                self.addSplitBones()
+            self.addSplitVertexGroups(vgroups)
+
+
+    def getMergers(self):
+        cfg = self.config
+        mergers = [
             (cfg.mergeShoulders, rig_merge.ShoulderMergers),
             (cfg.mergeHips, rig_merge.HipMergers),
             (cfg.mergeSpine, rig_merge.SpineMergers),
@@ -435,26 +459,34 @@ class Parser:
             (cfg.mergeFeet, rig_merge.FeetMergers),
             #(cfg.mergeToes, rig_merge.ToesMergers),
             (cfg.mergePenis, rig_merge.PenisMergers),
-            ]:
-            if flag:
-                self.mergeBones(mergers)
+            (not cfg.useConstraints, rig_merge.ConstraintMergers),
+        ]
+        return [merger for flag,merger in mergers if flag]
 
-        if not cfg.useConstraints:
-            self.mergeBones(rig_merge.ConstraintMergers)
+
+    def bindVertexGroups(self, vgroups):
+        """
+        Redo the vertex group part of createBones, for a parser made from
+        a rig template. The splits depend on the joint locations, so they
+        must be redone for each mesh.
+        """
+        cfg = self.config
+        addDict(vgroups, self.vertexGroups)
+
+        if cfg.mergeShoulders:
+            for bname in ["DEF-deltoid.L", "DEF-deltoid.R"]:
+                vgroup = self.vertexGroups[bname]
+                self.splitVertexGroup(bname, vgroup)
+                del self.vertexGroups[bname]
+
+        for mergers in self.getMergers():
+            for bname, data in mergers.items():
+                self.mergeVertexGroups(bname, data[1])
 
         if cfg.useDeformNames or cfg.useDeformBones:
-            if cfg.usePenisRig:
-                addDict(rig_spine.PenisArmature, self.deformArmature)
-            if cfg.useDeformBones:
-                self.addDeformBones()
-                #self.renameDeformBones(rig_muscle.Armature)
-                #if cfg.useConstraints:
-                #    self.renameConstraints(rig_muscle.Constraints)
             self.addDeformVertexGroups(vgroups)
 
         if cfg.useSplitBones or cfg.useSplitNames:
-            if cfg.useSplitBones:
-                self.addSplitBones()
             self.addSplitVertexGroups(vgroups)
 
 
@@ -463,6 +495,14 @@ class Parser:
             self.bones[bname].parent = parent
 
 
+    def getFinalName(self, bname):
+        """
+        The name of the bone in the built rig, after the renames in the
+        rig settings. Vertex groups are renamed in finishSetup.
+        """
+        return self.config.bones.get(bname, bname)
+
+
     def getRealBoneName(self, bname, raiseError=True):
         try:
             self.bones[bname]
@@ -491,12 +531,19 @@ class Parser:
 
 
     def setup(self, mhHuman, mhSkel):
-        cfg = self.config
+        self.setupLocations()
+        self.createBones(mhHuman, mhSkel)
+        self.finishSetup()
 
+
+    def setupLocations(self):
         self.setupJoints()
         self.setupNormals()
         self.setupPlaneJoints()
-        self.createBones(mhHuman, mhSkel)
+
+
+    def finishSetup(self):
+        cfg = self.config
 
         for bone in self.bones.values():
             headTail = self.headsTails[bone.name]
@@ -571,23 +618,23 @@ class Parser:
         else:
             self.offset = Vector((0,0,0))
 
-        self.coord = dict(
-            [(vn,self.scale*Vector(co) + self.offset)
-                for vn,co in enumerate(mhHuman["seed_mesh"]["vertices"])
-            ])
+        self.coord = transformCoords(mhHuman["seed_mesh"]["vertices"], self.scale, self.offset, useZup=False)
 
-        self.jointLocs = {}
-        vn0 = FirstJointVert
-        for name in JointNames:
-            self.jointLocs[name] = self.calcBox(vn0)
-            vn0 += 8
-        self.jointLocs["ground"] = self.calcBox(NTotalVerts-8)
+        boxes = self.calcBoxes(FirstJointVert, len(JointNames))
+        self.jointLocs = dict(zip(JointNames, map(Vector, boxes)))
+        self.jointLocs["ground"] = Vector(self.calcBoxes(NTotalVerts-8, 1)[0])
 
 
-    def calcBox(self, vn0):
-        vsum = Vector((0,0,0))
-        for n in range(8):
-            vsum += self.coord[vn0+n]
+    def calcBoxes(self, vn0, nboxes):
+        """
+        Return the centres of nboxes consecutive eight-vertex boxes,
+        starting at vertex vn0. The corners are summed in order, like the
+        Vector sum they replace.
+        """
+        corners = self.coord[vn0:vn0+8*nboxes].reshape(nboxes,8,3)
+        vsum = corners[:,0].copy()
+        for n in range(1,8):
+            vsum += corners[:,n]
         return vsum/8
 
 
@@ -609,17 +656,17 @@ class Parser:
                 self.locations[key] = vec + self.offset
             elif type == 'v':
                 v = int(data)
-                self.locations[key] = self.coord[v]
+                self.locations[key] = Vector(self.coord[v])
             elif type == 'x':
                 self.locations[key] = Vector((float(data[0]), float(data[2]), -float(data[1])))
             elif type == 'vo':
                 v = int(data[0])
                 offset = Vector((float(data[1]), float(data[3]), -float(data[2])))
-                self.locations[key] = (self.coord[v] + self.scale*offset)
+                self.locations[key] = (Vector(self.coord[v]) + self.scale*offset)
             elif type == 'vl':
                 ((k1, v1), (k2, v2)) = data
-                loc1 = self.coord[int(v1)]
-                loc2 = self.coord[int(v2)]
+                loc1 = Vector(self.coord[int(v1)])
+                loc2 = Vector(self.coord[int(v2)])
                 self.locations[key] = (k1*loc1 + k2*loc2)
             elif type == 'f':
                 (raw, head, tail, offs) = data
@@ -650,7 +697,7 @@ class Parser:
                 self.locations[key] = Vector((x[0],y[1],z[2]))
             elif type == 'vz':
                 v = int(data[0])
-                z = self.coord[v][2]
+                z = float(self.coord[v,2])
                 loc = self.locations[data[1]]
                 self.locations[key] = Vector((loc[0],loc[1],z))
             elif type == 'X':
@@ -889,7 +936,7 @@ class Parser:
             pbase, pext = splitBoneName(bone.parent)
             if pbase in self.splitBones.keys():
                 npieces = self.splitBones[pbase][0]
-                return self.deformPrefix + pbase + ".0" + str(npieces) + pext
+                return self.deformPrefix + pbase + (".%02d" % npieces) + pext
             else:
                 parbone = self.bones[bone.parent]
                 if (parbone.deform and
@@ -903,7 +950,7 @@ class Parser:
 
     def addSplitBones(self):
         """
-            Split selected bones into two or three parts for better deformation,
+            Split selected bones into two or more parts for better deformation,
             and constrain them to copy the partially.
             E.g. forearm.L => DEF-forearm.01.L, DEF-forearm.02.L, DEF-forearm.03.L
         """
@@ -912,7 +959,8 @@ class Parser:
         for base in self.splitBones.keys():
             for ext in [".L", ".R"]:
                 npieces,target,numAfter,followNext = self.splitBones[base]
-                defName1,defName2,defName3 = splitBonesNames(base, ext, self.deformPrefix, numAfter)
+                defNames = splitBonesNames(base, ext, self.deformPrefix, numAfter, npieces)
+                defName1 = defNames[0]
                 bname = base + ext
                 head,tail = self.headsTails[bname]
                 defParent = self.getDeformParent(bname)
@@ -921,6 +969,7 @@ class Parser:
                 rotMode = P_YZX
 
                 if npieces == 2:
+                    defName2 = defNames[1]
                     self.headsTails[defName1] = (head, ((0.5,head),(0.5,tail)))
                     self.headsTails[defName2] = (((0.5,head),(0.5,tail)), tail)
 
@@ -932,25 +981,27 @@ class Parser:
                     defBone2.fromInfo((bname, defBone1, F_DEF, L_DEF, rotMode))
                     self.addConstraint(defName2, ('CopyRot', C_LOCAL, 1, [target, target+ext, (0,1,0), (0,0,0), True]))
 
-                elif npieces == 3:
-                    self.headsTails[defName1] = (head, ((0.667,head),(0.333,tail)))
-                    self.headsTails[defName2] = (((0.667,head),(0.333,tail)), ((0.333,head),(0.667,tail)))
-                    self.headsTails[defName3] = (((0.333,head),(0.667,tail)), tail)
-
-                    defBone1 = self.bones[defName1] = Bone(self, defName1)
-                    defBone1.fromInfo((bname, defParent, F_DEF+F_CON, L_DEF, rotMode))
-                    defBone2 = self.bones[defName2] = Bone(self, defName2)
-                    defBone2.fromInfo((bname, defName1, F_DEF+F_CON, L_DEF, rotMode))
-                    defBone3 = self.bones[defName3] = Bone(self, defName3)
-                    defBone3.fromInfo((bname, defName2, F_DEF+F_CON, L_DEF, rotMode))
+                else:
+                    # Each piece adds an equal share of the twist.
+                    joints = [head]
+                    for n in range(1, npieces):
+                        k = round(n/npieces, 3)
+                        joints.append(((round(1-k, 3),head),(k,tail)))
+                    joints.append(tail)
+
+                    parent = defParent
+                    for n,defName in enumerate(defNames):
+                        self.headsTails[defName] = (joints[n], joints[n+1])
+                        defBone = self.bones[defName] = Bone(self, defName)
+                        defBone.fromInfo((bname, parent, F_DEF+F_CON, L_DEF, rotMode))
+                        parent = defName
 
                     self.addConstraint(defName1, ('IK', 0, 1, ['IK', target+ext, 1, None, (True, False,True)]))
-                    if followNext:
-                        self.addConstraint(defName2, ('CopyRot', C_LOCAL, 0.5, [target, target+ext, (0,1,0), (0,0,0), True]))
-                        self.addConstraint(defName3, ('CopyRot', C_LOCAL, 0.5, [target, target+ext, (0,1,0), (0,0,0), True]))
-                    else:
-                        self.addConstraint(defName2, ('CopyRot', 0, 0.5, [bname, bname, (1,1,1), (0,0,0), False]))
-                        self.addConstraint(defName3, ('CopyRot', 0, 1.0, [bname, bname, (1,1,1), (0,0,0), False]))
+                    for n,defName in enumerate(defNames[1:]):
+                        if followNext:
+                            self.addConstraint(defName, ('CopyRot', C_LOCAL, 1/(npieces-1), [target, target+ext, (0,1,0), (0,0,0), True]))
+                        else:
+                            self.addConstraint(defName, ('CopyRot', 0, (n+1)/(npieces-1), [bname, bname, (1,1,1), (0,0,0), False]))
 
                 defname = self.deformPrefix + base + ext
                 for bone in self.bones.values():
@@ -989,9 +1040,9 @@ class Parser:
             vglist = loadJsonRelative(filepath)
             for key,data in vglist:
                 try:
-                    vgroups[key] += data
+                    vgroups[key] += thawJson(data)
                 except KeyError:
-                    vgroups[key] = data
+                    vgroups[key] = thawJson(data)
             #readVertexGroups(filepath, vgroups, vgroups)
         return vgroups
 
@@ -1009,60 +1060,31 @@ class Parser:
 
     def splitVertexGroup(self, bname, vgroup):
         """
-        Splits a vertex group into two or three, with weights distributed
+        Splits a vertex group into two or more, with weights distributed
         linearly along the bone.
         """
 
         base,ext = splitBoneName(bname)
         if base in self.splitBones.keys():
             npieces,_target,numAfter,_followNext = self.splitBones[base]
-            defName1,defName2,defName3 = splitBonesNames(base, ext, self.deformPrefix, numAfter)
+            defNames = splitBonesNames(base, ext, self.deformPrefix, numAfter, npieces)
         else:
             npieces = 2
-            defName1 = base + "-1" + ext
-            defName2 = base + "-2" + ext
+            defNames = [base + "-1" + ext, base + "-2" + ext]
 
         head,tail = self.headsTails[bname]
         vec = self.locations[tail] - self.locations[head]
         vec /= vec.dot(vec)
         orig = self.locations[head] + self.origin
 
-        vgroup1 = []
-        vgroup2 = []
-        vgroup3 = []
-
-        #print(bname,vgroup)
-
-        if npieces == 2:
-            for vn,w in vgroup:
-                y = self.coord[vn] - orig
-                x = vec.dot(y)
-                if x < 0:
-                    vgroup1.append([vn,w])
-                elif x < 1:
-                    vgroup1.append([vn, (1-x)*w])
-                    vgroup2.append([vn, x*w])
-                else:
-                    vgroup2.append([vn,w])
-            self.vertexGroups[defName1] = vgroup1
-            self.vertexGroups[defName2] = vgroup2
-        elif npieces == 3:
-            for vn,w in vgroup:
-                y = self.coord[vn] - orig
-                x = vec.dot(y)
-                if x < 0:
-                    vgroup1.append([vn,w])
-                elif x < 0.5:
-                    vgroup1.append([vn, (1-2*x)*w])
-                    vgroup2.append([vn, (2*x)*w])
-                elif x < 1:
-                    vgroup2.append([vn, (2-2*x)*w])
-                    vgroup3.append([vn, (2*x-1)*w])
-                else:
-                    vgroup3.append([vn,w])
-            self.vertexGroups[defName1] = vgroup1
-            self.vertexGroups[defName2] = vgroup2
-            self.vertexGroups[defName3] = vgroup3
+        vnums,weights = getPairArrays(vgroup)
+        y = self.coord[vnums] - np.array(orig, dtype=np.float32)
+        y = y.astype(np.float64)
+        xs = (y[:,0]*vec[0] + y[:,1]*vec[1]) + y[:,2]*vec[2]
+
+        pieces = splitWeights(vnums, weights, xs, npieces)
+        for defName,(pvnums,pweights) in zip(defNames, pieces):
+            self.vertexGroups[defName] = [[vn,w] for vn,w in zip(pvnums.tolist(), pweights.tolist())]
 
 
     def mergeBones(self, mergers):
@@ -1072,18 +1094,13 @@ class Parser:
             _,tail = self.headsTails[tname]
             self.headsTails[bname] = head,tail
 
-            if bname in self.vertexGroups.keys():
-                vgroup = self.vertexGroups[bname]
-            else:
-                vgroup = []
+            if bname not in self.vertexGroups.keys():
                 bone = self.bones[bname]
                 bone.deform = True
+            self.mergeVertexGroups(bname, merged)
 
             for mbone in merged:
                 if mbone != bname:
-                    if mbone in self.vertexGroups.keys():
-                        vgroup += self.vertexGroups[mbone]
-                        del self.vertexGroups[mbone]
                     if mbone in self.bones.keys():
                         del self.bones[mbone]
                     for child in self.bones.values():
@@ -1093,7 +1110,17 @@ class Parser:
                             if chead != tail:
                                 child.conn = False
 
-            self.vertexGroups[bname] = mergeWeights(vgroup)
+
+    def mergeVertexGroups(self, bname, merged):
+        if bname in self.vertexGroups.keys():
+            vgroup = self.vertexGroups[bname]
+        else:
+            vgroup = []
+        for mbone in merged:
+            if mbone != bname and mbone in self.vertexGroups.keys():
+                vgroup += self.vertexGroups[mbone]
+                del self.vertexGroups[mbone]
+        self.vertexGroups[bname] = mergeWeights(vgroup)
 
 
     def setupRotationBones(self, rotBones):
@@ -1135,6 +1162,163 @@ class Parser:
                 self.addConstraint(bname, cns)
 
 
+def splitWeights(vnums, weights, xs, npieces):
+    """
+    Distribute the weights over npieces pieces, given the position x of
+    each vertex along the bone, from 0 at the head to 1 at the tail.
+    Inside the bone, each vertex is shared between the two nearest
+    pieces, with weights that are linear in x. Returns the vertex numbers
+    and weights of each piece, in the order of the input.
+    """
+    nsegs = npieces - 1
+    nverts = len(xs)
+    weights = np.asarray(weights, dtype=np.float64)
+    inside = (xs >= 0) & (xs < 1)
+    t = np.where(inside, xs, 0)*nsegs
+    seg = np.minimum(np.floor(t), nsegs-1)
+    frac = t - seg
+    seg = seg.astype(np.int32)
+
+    # Each vertex goes to one piece, and vertices inside the bone also to
+    # the next one.
+    first = np.where(xs < 0, 0, np.where(inside, seg, nsegs))
+    pieces = np.concatenate([first, seg[inside]+1])
+    order = np.concatenate([np.arange(nverts), np.flatnonzero(inside)])
+    pweights = np.concatenate([np.where(inside, (1-frac)*weights, weights),
+                               frac[inside]*weights[inside]])
+    sort = np.lexsort((order, pieces))
+    starts = np.searchsorted(pieces[sort], np.arange(npieces+1))
+    pvnums = np.asarray(vnums)[order[sort]]
+    pweights = pweights[sort]
+    return [(pvnums[starts[n]:starts[n+1]], pweights[starts[n]:starts[n+1]])
+            for n in range(npieces)]
+
+#-------------------------------------------------------------------------------
+#   Rig templates.
+#   Most of the parser only depends on the rig settings: the bones and their
+#   flags, layers, constraints, custom shapes and drivers, and the vertex
+#   groups read from file. This part is cached as a template for each rig
+#   configuration, after createBones. A parser made from a template only
+#   computes the joint locations, vertex group splits and bone positions
+#   of the new mesh. The joint locations come from the compiled joint
+#   plan, evaluated once for all humans passed to getParsers. Rigs from an
+#   exported skeleton are never cached.
+#-------------------------------------------------------------------------------
+
+MaxRigTemplates = 4
+
+theRigTemplates = OrderedDict()
+
+def getParser(mhHuman, mhSkel, cfg):
+    """
+    Return a parser that is set up for the human.
+    """
+    if mhSkel is not None:
+        parser = Parser(mhHuman, mhSkel, cfg)
+        parser.setup(mhHuman, mhSkel)
+        return parser
+    return getParsers([mhHuman], cfg)[0]
+
+
+def getParsers(mhHumans, cfg):
+    """
+    Return parsers set up for several humans with the same rig settings.
+    The joint locations of all humans are evaluated in one batch.
+    """
+    key = cfg.getRigKey()
+    if key in theRigTemplates.keys():
+        theRigTemplates.move_to_end(key)
+        template = theRigTemplates[key]
+        parsers = []
+    else:
+        parser = Parser(mhHumans[0], None, cfg)
+        fitJoints([parser])
+        parser.createBones(mhHumans[0], None)
+        template = theRigTemplates[key] = RigTemplate(parser)
+        while len(theRigTemplates) > MaxRigTemplates:
+            theRigTemplates.popitem(last=False)
+        parsers = [parser]
+        mhHumans = mhHumans[1:]
+
+    if mhHumans:
+        instances = [template.instantiate(mhHuman, cfg) for mhHuman in mhHumans]
+        fitJoints(instances)
+        for parser in instances:
+            parser.bindVertexGroups(copyVertexGroups(parser.sourceVertexGroups))
+        parsers += instances
+
+    for parser in parsers:
+        parser.finishSetup()
+    return parsers
+
+
+def fitJoints(parsers):
+    """
+    Set the joint locations and plane normals of parsers that share a rig
+    configuration, as setupLocations does. The joint expressions are
+    compiled once, see jointplan.py, and evaluated for all parsers at once.
+    """
+    from .jointplan import getJointPlan
+    parser = parsers[0]
+    plan = getJointPlan(parser.joints, parser.planeJoints, parser.planes)
+    coords = np.array([parser.coord for parser in parsers])
+    scales = [parser.scale for parser in parsers]
+    offsets = [list(parser.offset) for parser in parsers]
+    locations = plan.evaluate(coords, scales, offsets)
+    for n,parser in enumerate(parsers):
+        parser.locations = dict([(key, Vector(locs[n])) for key,locs in locations.items()])
+        parser.setupNormals()
+
+
+def clearRigTemplates():
+    theRigTemplates.clear()
+
+
+def copyVertexGroups(vgroups):
+    # Merging extends and sorts the lists in place, so copy them.
+    return OrderedDict([(bname, list(vgroup)) for bname,vgroup in vgroups.items()])
+
+
+class RigTemplate:
+
+    # Attributes that depend on the mesh.
+    ShapeAttributes = ["config", "coord", "scale", "offset", "jointLocs",
+                       "locations", "normals", "vertexGroups"]
+    # Attributes that are never changed after createBones.
+    SharedAttributes = ["joints", "planes", "planeJoints", "gizmos", "sourceVertexGroups"]
+    # Attributes that are changed in place later. Building the rig stores
+    # the Blender constraints in the constraint objects.
+    OwnedAttributes = ["bones", "constraints"]
+
+    def __init__(self, parser):
+        state = dict([(key,value) for key,value in vars(parser).items()
+                      if key not in self.ShapeAttributes + self.SharedAttributes])
+        # Bones refer to their parser, which is not part of the template.
+        self.state = copy.deepcopy(state, {id(parser): None})
+        self.shared = dict([(key, getattr(parser, key)) for key in self.SharedAttributes
+                            if hasattr(parser, key)])
+
+
+    def instantiate(self, mhHuman, cfg):
+        # The other containers only get new items.
+        parser = Parser.__new__(Parser)
+        memo = {}
+        for key,value in self.state.items():
+            if key in self.OwnedAttributes:
+                value = copy.deepcopy(value, memo)
+            elif isinstance(value, (dict, list)):
+                value = copy.copy(value)
+            setattr(parser, key, value)
+        vars(parser).update(self.shared)
+        parser.config = cfg
+        parser.locations = {}
+        parser.normals = {}
+        parser.vertexGroups = OrderedDict()
+        for bone in parser.bones.values():
+            bone.parser = parser
+        parser.defineJointLocations(mhHuman, cfg)
+        return parser
+
 #-------------------------------------------------------------------------------
 #   Bone class
 #-------------------------------------------------------------------------------
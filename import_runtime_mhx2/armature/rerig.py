@@ -22,6 +22,7 @@
 
 from .flags import *
 from collections import OrderedDict
+from ..profiler import setMode
 import bpy
 
 Joints = [
@@ -409,6 +410,8 @@ def getVertexGroups(mhHuman, mhSkel):
         nname,known,idx = getNewName(bname, hasToes)
         if nname is None:
             continue
+        if hasattr(weight, "tolist"):
+            weight = weight.tolist()
         if nname in vgroups.keys():
             vgroups[nname] = mergeWeights(vgroups[nname] + weight)
         else:
@@ -440,7 +443,7 @@ def makeBonesPosable(rig, useMhx):
                 nname = words[0] + "-1." + words[1]
             posableBones.append((b.name,nname))
         
-    bpy.ops.object.mode_set(mode='EDIT')
+    setMode('EDIT')
     children = {}
     for bname,nname in posableBones:
         eb = rig.data.edit_bones[bname]
@@ -460,7 +463,7 @@ def makeBonesPosable(rig, useMhx):
             for cb in childs:
                 cb.parent = nb
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    setMode('OBJECT')
     for bname,nname in posableBones:
         pb = rig.pose.bones[bname]
         nb = rig.pose.bones[nname]
@@ -32,6 +32,7 @@ import bpy
 import os
 from bpy.props import *
 from ..error import *
+from ..profiler import setMode, callOperator
 from .utils import *
 
 if bpy.app.version < (2, 79, 0):
@@ -169,7 +170,7 @@ def rigifyMhx(context, parser, taken={}):
 
     # Setup info about MHX bones
     bones = OrderedDict()
-    bpy.ops.object.mode_set(mode='EDIT')
+    setMode('EDIT')
 
     for eb in rig.data.edit_bones:
         bone = bones[eb.name] = RigifyBone(eb)
@@ -177,7 +178,7 @@ def rigifyMhx(context, parser, taken={}):
             bone.parent = eb.parent.name
             bones[bone.parent].child = eb.name
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    setMode('OBJECT')
 
     for pb in rig.pose.bones:
         bone = bones[pb.name]
@@ -191,18 +192,18 @@ def rigifyMhx(context, parser, taken={}):
 
     # Create metarig
     try:
-        bpy.ops.object.armature_human_metarig_add()
+        callOperator(bpy.ops.object.armature_human_metarig_add)
     except AttributeError:
         raise MhxError("The Rigify add-on is not enabled. It is found under rigging.")
-    bpy.ops.object.location_clear()
-    bpy.ops.object.rotation_clear()
-    bpy.ops.object.scale_clear()
-    bpy.ops.transform.resize(value=(100, 100, 100))
-    bpy.ops.object.transform_apply(location=False, rotation=False, scale=True)
+    callOperator(bpy.ops.object.location_clear)
+    callOperator(bpy.ops.object.rotation_clear)
+    callOperator(bpy.ops.object.scale_clear)
+    callOperator(bpy.ops.transform.resize, value=(100, 100, 100))
+    callOperator(bpy.ops.object.transform_apply, location=False, rotation=False, scale=True)
 
     # Fit metarig to default MHX rig
     meta = context.object
-    bpy.ops.object.mode_set(mode='EDIT')
+    setMode('EDIT')
     deleteHead(meta)
     extra = []
     for bone in bones.values():
@@ -235,13 +236,13 @@ def rigifyMhx(context, parser, taken={}):
         eb.layers = list(child.layers)
 
     # Add rigify properties to extra bones
-    bpy.ops.object.mode_set(mode='OBJECT')
+    setMode('OBJECT')
     for bname in extra:
         pb = meta.pose.bones[bname]
         pb["rigify_type"] = ""
 
     # Generate rigify rig
-    bpy.ops.pose.rigify_generate()
+    callOperator(bpy.ops.pose.rigify_generate)
     gen = context.object
     print("Generated", gen)
     deleteObject(context, meta)
@@ -251,7 +252,7 @@ def rigifyMhx(context, parser, taken={}):
             setBoneName(bone, gen)
 
     # Add extra bone to generated rig
-    bpy.ops.object.mode_set(mode='EDIT')
+    setMode('EDIT')
     for bone in bones.values():
         if not bone.original:
             try:
@@ -298,7 +299,7 @@ def rigifyMhx(context, parser, taken={}):
             eb = gen.data.edit_bones[bname]
             eb.parent = gen.data.edit_bones[Parents[bname]]
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    setMode('OBJECT')
     for bone in bones.values():
         if not bone.original:
             pb = gen.pose.bones[bone.realname]
@@ -383,7 +384,7 @@ def rigifyMhx(context, parser, taken={}):
     name = rig.name
     deleteObject(context, rig)
     gen.name = name
-    bpy.ops.object.mode_set(mode='POSE')
+    setMode('POSE')
     print("MHX rig %s successfully rigified" % name)
     return gen
 
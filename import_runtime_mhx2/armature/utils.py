@@ -55,16 +55,11 @@ def getIkName(base, ext):
     return (base + ".ik" + ext)
 
 
-def splitBonesNames(base, ext, prefix, numAfter):
+def splitBonesNames(base, ext, prefix, numAfter, npieces=3):
     if numAfter:
-        defname1 = prefix+base+ext+".01"
-        defname2 = prefix+base+ext+".02"
-        defname3 = prefix+base+ext+".03"
+        return [prefix+base+ext+(".%02d" % (n+1)) for n in range(npieces)]
     else:
-        defname1 = prefix+base+".01"+ext
-        defname2 = prefix+base+".02"+ext
-        defname3 = prefix+base+".03"+ext
-    return defname1, defname2, defname3
+        return [prefix+base+(".%02d" % (n+1))+ext for n in range(npieces)]
 
 
 def csysBoneName(bname, infix):
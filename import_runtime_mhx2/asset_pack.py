@@ -0,0 +1,238 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  Authors:             Thomas Larsson
+#  Script Copyright (C) Thomas Larsson 2014 - 2020
+#  Script Copyright (C) MakeHuman Community 2020
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import os
+import io
+import json
+import struct as pystruct
+import numpy as np
+
+from .load_json import *
+
+#------------------------------------------------------------------------
+#   Asset pack.
+#   The bundled assets under data/hm8 and armature/data are packed into a
+#   single file, data/assets.mhxpak. The header is an index from relative
+#   path to the entry's source size and the location of its document.
+#   Documents are parsed only when the entry is requested, and the large
+#   arrays (targets, fittings, vertex group weights, mesh data) are stored
+#   as aligned typed blocks that are mapped from the file, so only the
+#   pages actually touched are read.
+#
+#   Build the pack after changing any asset, e.g. with the Build Asset
+#   Pack button, or from the command line with
+#   blender -b --python-expr "import import_runtime_mhx2.asset_pack as p; p.buildAssetPack()"
+#
+#   An entry whose source file has changed since the pack was built is
+#   ignored, and the source file is parsed instead.
+#------------------------------------------------------------------------
+
+PackMagic = b"MHX2PAK\0"
+PackVersion = 1
+PackName = "data/assets.mhxpak"
+PackFolders = ["data/hm8", "armature/data"]
+PackExtensions = [".json", ".mxa"]
+
+# Zip archives store modification times with two seconds resolution.
+MtimeSlack = 2.0
+
+TARGETS = "TARGETS"
+VGROUPS = "VGROUPS"
+
+thePack = None
+
+def getAddonFolder():
+    return os.path.dirname(__file__)
+
+
+def getPackPath():
+    return os.path.join(getAddonFolder(), PackName)
+
+#------------------------------------------------------------------------
+#   Loading
+#------------------------------------------------------------------------
+
+def loadPackedAsset(filepath):
+    """
+    Return the frozen asset at filepath from the pack, or None if the
+    file is not packed or has changed since the pack was built.
+    """
+    global thePack
+    folder = os.path.realpath(getAddonFolder())
+    relpath = os.path.relpath(os.path.realpath(filepath), folder).replace(os.sep, "/")
+    if relpath.startswith(".."):
+        return None
+    packpath = getPackPath()
+    if not os.path.exists(packpath):
+        return None
+    if thePack is None or thePack.mtime != os.path.getmtime(packpath):
+        try:
+            thePack = AssetPack(packpath)
+        except (OSError, ValueError) as err:
+            print("Could not open asset pack %s: %s" % (packpath, err))
+            return None
+    return thePack.load(relpath, filepath)
+
+
+def closeAssetPack():
+    global thePack
+    thePack = None
+
+
+class AssetPack:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        with open(filepath, "rb") as fp:
+            if fp.read(len(PackMagic)) != PackMagic:
+                raise ValueError("Not an asset pack")
+            hlen, = pystruct.unpack("<Q", fp.read(8))
+            header = json.loads(fp.read(hlen))
+        if header["version"] != PackVersion:
+            raise ValueError("Asset pack version %s not supported" % header["version"])
+        self.entries = header["entries"]
+        self.start = alignSize(len(PackMagic) + 8 + hlen)
+        self.mtime = os.path.getmtime(filepath)
+        self.raw = np.memmap(filepath, dtype=np.uint8, mode='r')
+
+
+    def load(self, relpath, filepath):
+        if relpath not in self.entries.keys():
+            return None
+        entry = self.entries[relpath]
+        stat = os.stat(filepath)
+        if stat.st_size != entry["size"] or stat.st_mtime > self.mtime + MtimeSlack:
+            return None
+        offset = self.start + entry["offset"]
+        doc = json.loads(self.raw[offset:offset+entry["length"]].tobytes())
+        return self.resolve(doc)
+
+
+    def resolve(self, data):
+        if isinstance(data, dict):
+            if len(data) == 1 and "$block" in data.keys():
+                offset,descr,shape = data["$block"]
+                dtype = getBlockType(descr)
+                shape = tuple(shape)
+                offset += self.start
+                nbytes = dtype.itemsize * int(np.prod(shape))
+                return self.raw[offset:offset+nbytes].view(dtype).reshape(shape)
+            return FrozenDict([(key, self.resolve(value)) for key,value in data.items()])
+        elif isinstance(data, list):
+            return tuple([self.resolve(elt) for elt in data])
+        else:
+            return data
+
+#------------------------------------------------------------------------
+#   Building
+#------------------------------------------------------------------------
+
+def buildAssetPack(filepath=None):
+    if filepath is None:
+        filepath = getPackPath()
+    folder = getAddonFolder()
+    body = io.BytesIO()
+    entries = {}
+    for relpath in getPackFiles(folder):
+        srcpath = os.path.join(folder, relpath)
+        struct = loadJson(srcpath)
+        if "vertexgroups" in relpath:
+            kind = VGROUPS
+        else:
+            kind = None
+        doc = json.dumps(packData(struct, body, kind)).encode("utf-8")
+        entries[relpath] = {
+            "size" : os.path.getsize(srcpath),
+            "offset" : body.tell(),
+            "length" : len(doc),
+        }
+        body.write(doc)
+        body.write(bytes(alignSize(body.tell()) - body.tell()))
+
+    header = json.dumps({"version" : PackVersion, "entries" : entries}).encode("utf-8")
+    closeAssetPack()
+    with open(filepath + ".tmp", "wb") as fp:
+        fp.write(PackMagic)
+        fp.write(pystruct.pack("<Q", len(header)))
+        fp.write(header)
+        fp.write(bytes(alignSize(fp.tell()) - fp.tell()))
+        fp.write(body.getbuffer())
+    os.replace(filepath + ".tmp", filepath)
+    print("Packed %d assets into %s" % (len(entries), filepath))
+    return len(entries)
+
+
+def getPackFiles(folder):
+    relpaths = []
+    for subfolder in PackFolders:
+        for root,dirs,files in os.walk(os.path.join(folder, subfolder)):
+            dirs.sort()
+            for file in sorted(files):
+                if os.path.splitext(file)[1] in PackExtensions:
+                    path = os.path.relpath(os.path.join(root, file), folder)
+                    relpaths.append(path.replace(os.sep, "/"))
+    return relpaths
+
+
+def packData(data, body, kind):
+    if kind == TARGETS and isinstance(data, dict):
+        return dict([(key, packBlock(makeTargetArray(*getTargetArrays(value)), body)) for key,value in data.items()])
+    elif kind == VGROUPS and isinstance(data, list):
+        return [[key, packData(value, body, PAIRS)] for key,value in data]
+    elif kind in (COORDS, INDICES, PAIRS, FITTING):
+        try:
+            block = makeArray(np.asarray(data, dtype=np.float64), kind)
+        except (ValueError, TypeError):
+            block = None
+        if block is not None and len(block) > 0:
+            return packBlock(block, body)
+
+    if isinstance(data, dict):
+        if kind in (GROUPS, VGROUPS):
+            return dict([(key, packData(value, body, PAIRS)) for key,value in data.items()])
+        struct = {}
+        for key,value in data.items():
+            if key == "targets":
+                struct[key] = packData(value, body, TARGETS)
+            else:
+                struct[key] = packData(value, body, ArrayKinds.get(key))
+        return struct
+    elif isinstance(data, list):
+        return [packData(elt, body, None) for elt in data]
+    else:
+        return data
+
+
+def packBlock(block, body):
+    if len(block) == 0:
+        return []
+    if block.dtype.names:
+        descr = block.dtype.descr
+    else:
+        descr = block.dtype.str
+    offset = body.tell()
+    body.write(np.ascontiguousarray(block).tobytes())
+    body.write(bytes(alignSize(body.tell()) - body.tell()))
+    return {"$block" : [offset, descr, list(block.shape)]}
+
+
+def alignSize(size):
+    return (size + BlockAlign - 1) // BlockAlign * BlockAlign
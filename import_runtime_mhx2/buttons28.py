@@ -39,6 +39,9 @@ class Mhx2Import(ImportHelper):
     useHelpers : BoolProperty(name="Helper Geometry", description="Keep helper geometry", default=False)
     useOffset : BoolProperty(name="Offset", description="Add offset for feet on ground", default=True)
     useOverride : BoolProperty(name="Override Exported Data", description="Override rig and mesh definitions in mhx2 file", default=False)
+    useCache : BoolProperty(name="Parse Cache", description="Keep decoded files in a cache folder, so that reimporting an unchanged file skips parsing", default=False)
+    useProfiler : BoolProperty(name="Profile Import", description="Record time, peak memory and mode switches of each import phase", default=False)
+    useStreaming : BoolProperty(name="Streaming Loader", description="Decode mesh, uv, weight and fitting data directly into arrays. Reduces memory use for large files", default=False)
 
     useCustomShapes : BoolProperty(name="Custom Shapes", description="Custom bone shapes", default=True)
     useFaceShapes : BoolProperty(name="Face Shapes", description="Face shapes", default=False)
@@ -0,0 +1,194 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  Authors:             Thomas Larsson
+#  Script Copyright (C) Thomas Larsson 2014 - 2020
+#  Script Copyright (C) MakeHuman Community 2020
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+from .load_json import *
+
+#------------------------------------------------------------------------
+#   Parse cache.
+#   Decoded .mhx2 files are stored as array containers in the user cache
+#   folder. Entries are named by the content hash of the source file. The
+#   index maps source paths to size, mtime and hash, so an unchanged file
+#   is found without rehashing. Least recently used entries are evicted
+#   when the cache grows beyond MaxCacheSize.
+#------------------------------------------------------------------------
+
+MaxCacheSize = 2 << 30
+
+theCacheStats = {"hits" : 0, "misses" : 0}
+
+def getCacheFolder():
+    if os.name == 'nt' and "LOCALAPPDATA" in os.environ.keys():
+        root = os.environ["LOCALAPPDATA"]
+    elif "XDG_CACHE_HOME" in os.environ.keys():
+        root = os.environ["XDG_CACHE_HOME"]
+    else:
+        root = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(root, "mhx2")
+
+
+def getCacheStats():
+    return theCacheStats["hits"], theCacheStats["misses"]
+
+
+def loadCachedJson(filepath, loader):
+    if isArrayContainer(filepath):
+        return loader(filepath)
+
+    folder = getCacheFolder()
+    index = loadIndex(folder)
+    path = os.path.realpath(filepath)
+    stat = os.stat(path)
+    info = index["files"].get(path)
+    if info and info["size"] == stat.st_size and info["mtime"] == stat.st_mtime_ns:
+        digest = info["hash"]
+    else:
+        digest = getContentHash(path)
+
+    entrypath = os.path.join(folder, digest + ".mhx2c")
+    struct = None
+    if digest in index["entries"].keys() and os.path.exists(entrypath):
+        try:
+            struct = loadArrayContainer(entrypath)
+        except (OSError, ValueError) as err:
+            print("Could not read cache entry %s: %s" % (entrypath, err))
+
+    if struct is None:
+        theCacheStats["misses"] += 1
+        struct = loader(filepath)
+        try:
+            nbytes = saveCacheEntry(struct, entrypath)
+            struct = loadArrayContainer(entrypath)
+        except (OSError, ValueError) as err:
+            print("Could not write cache entry %s: %s" % (entrypath, err))
+            return resolveArrays(struct)
+        index["entries"][digest] = {"bytes" : nbytes}
+    else:
+        theCacheStats["hits"] += 1
+
+    index["files"][path] = {"size" : stat.st_size, "mtime" : stat.st_mtime_ns, "hash" : digest}
+    index["entries"][digest]["atime"] = time.time()
+    evictEntries(folder, index, MaxCacheSize)
+    saveIndex(folder, index)
+    return struct
+
+
+def resolveArrays(struct):
+    """
+    Convert struct to the arrays a cache hit returns, without the file.
+    """
+    blocks = []
+    data = splitBlocks(struct, blocks, None)
+    return resolveBlocks(data, blocks)
+
+
+def getContentHash(filepath):
+    sha = hashlib.sha1()
+    with open(filepath, "rb") as fp:
+        while True:
+            chunk = fp.read(1 << 20)
+            if not chunk:
+                break
+            sha.update(chunk)
+    return sha.hexdigest()
+
+#------------------------------------------------------------------------
+#   Index
+#------------------------------------------------------------------------
+
+def loadIndex(folder):
+    filepath = os.path.join(folder, "index.json")
+    try:
+        with open(filepath, "r", encoding="utf-8") as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return {"files" : {}, "entries" : {}}
+
+
+def saveIndex(folder, index):
+    filepath = os.path.join(folder, "index.json")
+    try:
+        with replaceFile(filepath, "w", encoding="utf-8") as fp:
+            json.dump(index, fp)
+    except OSError as err:
+        print("Could not write cache index %s: %s" % (filepath, err))
+
+
+def evictEntries(folder, index, maxsize):
+    entries = index["entries"]
+    total = sum([entry["bytes"] for entry in entries.values()])
+    lru = sorted(entries.keys(), key=lambda digest: entries[digest]["atime"])
+    for digest in lru:
+        if total <= maxsize:
+            break
+        try:
+            os.remove(os.path.join(folder, digest + ".mhx2c"))
+        except FileNotFoundError:
+            pass
+        except OSError:
+            # E.g. still mapped by an open file on Windows.
+            continue
+        total -= entries[digest]["bytes"]
+        del entries[digest]
+    index["files"] = dict([(path,info) for path,info in index["files"].items()
+                           if info["hash"] in entries.keys()])
+
+
+def clearCache():
+    folder = getCacheFolder()
+    index = loadIndex(folder)
+    evictEntries(folder, index, 0)
+    saveIndex(folder, index)
+
+#------------------------------------------------------------------------
+#   Write entries.
+#   Files are written to a unique temporary file in the cache folder and
+#   moved into place, so concurrent imports never see partial files.
+#------------------------------------------------------------------------
+
+def saveCacheEntry(struct, filepath):
+    with replaceFile(filepath, "wb") as fp:
+        writeArrayContainer(struct, fp)
+        return fp.tell()
+
+
+@contextmanager
+def replaceFile(filepath, mode, **kwargs):
+    folder = os.path.dirname(filepath)
+    os.makedirs(folder, exist_ok=True)
+    fd,tmppath = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, **kwargs) as fp:
+            yield fp
+        os.replace(tmppath, filepath)
+    except BaseException:
+        try:
+            os.remove(tmppath)
+        except OSError:
+            pass
+        raise
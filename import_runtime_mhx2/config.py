@@ -21,6 +21,7 @@
 # ##### END GPL LICENSE BLOCK #####
 
 import os
+import json
 
 Attributes = [
     "useHelpers", "useOffset", "useOverride", "useHumanType",
@@ -29,7 +30,13 @@ Attributes = [
     "hairType", "hairColor", "useHairOnProxy", "useDeflector", "useHairDynamics",
     "mergeBodyParts", "mergeToProxy", "mergeMaxType",
     "useFaceShapes", "useFacePanel", "useFaceShapeDrivers", "useFaceRigDrivers",
-    "useMasks", "useConservativeMasks"
+    "useMasks", "useConservativeMasks", "useStreaming", "useCache",
+    "useProfiler"
+]
+
+NonRigAttributes = [
+    "scale", "folder", "name", "description", "deleteHelpers",
+    "useStreaming", "useCache", "useProfiler", "useSharedImages"
 ]
 
 class Config:
@@ -38,6 +45,10 @@ class Config:
         self.scale = 1.0
         self.deleteHelpers = False
         self.folder = ""
+        self.useStreaming = False
+        self.useCache = False
+        self.useProfiler = False
+        self.useSharedImages = False
         self.setDefaults()
 
     def __repr__(self):
@@ -46,6 +57,15 @@ class Config:
             string += "  %s: %s\n" % (attr, getattr(self, attr))
         return string + ">"
 
+    def getRigKey(self):
+        """
+        Key for the settings that affect the rig, i.e. everything except
+        file and loader options.
+        """
+        settings = dict([(key,value) for key,value in vars(self).items()
+                         if key not in NonRigAttributes])
+        return json.dumps(settings, sort_keys=True, default=str)
+
     def getMeshType(self):
         if self.useHelpers:
             return "seed_mesh"
@@ -139,11 +159,11 @@ class Config:
 
 
     def loadPreset(self, filepath):
-        from .load_json import loadJsonRelative
+        from .load_json import loadJsonRelative, thawJson
         struct = loadJsonRelative(filepath)
         for key in ["name", "description", "bones", "merge", "properties", "terminals"]:
             if key in struct.keys():
-                setattr(self, key, struct[key])
+                setattr(self, key, thawJson(struct[key]))
         try:
             settings = struct["settings"]
         except KeyError:
@@ -0,0 +1,168 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  Authors:             Thomas Larsson
+#  Script Copyright (C) Thomas Larsson 2014 - 2020
+#  Script Copyright (C) MakeHuman Community 2020
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import os
+import bpy
+import json
+import time
+from bpy.props import StringProperty, BoolProperty, CollectionProperty
+from bpy_extras.io_utils import ImportHelper
+
+from .error import *
+from .utils import *
+
+#------------------------------------------------------------------------
+#   Crowd import.
+#   Imports many characters as static meshes with materials, e.g.
+#   from a script with
+#   importCrowd(["a.mhx2", "b.mhx2"], bpy.context)
+#   Only the data API is used, so there are no mode switches, selection
+#   or active object changes. Only the geometry and material sections
+#   are read. Materials with identical settings and texture folder are
+#   built once and shared between characters, and images are reused.
+#------------------------------------------------------------------------
+
+CrowdGeometryKeys = ["name", "uuid", "human", "offset", "scale", "material", "mesh"]
+
+def importCrowd(filepaths, context, useOffset=True, useStreaming=False, useCache=False,
+                useSharedMaterials=True, collection=None):
+    """
+    Import the mhx2 files as static meshes into one collection. Returns
+    a list with the list of mesh objects of each character.
+    """
+    from .config import Config
+    from .importer import importMhx2Json
+
+    scn = context.scene
+    cfg = Config()
+    cfg.useOffset = useOffset
+    cfg.useSharedImages = useSharedMaterials
+    if collection is None:
+        collection = bpy.data.collections.new("Crowd")
+        scn.collection.children.link(collection)
+    scn['MHCollection'] = collection
+
+    mats = {}
+    characters = []
+    time1 = time.perf_counter()
+    try:
+        for filepath in filepaths:
+            filepath = os.path.expanduser(filepath)
+            cfg.folder = os.path.dirname(filepath)
+            struct,_time = importMhx2Json(filepath, useStreaming, useCache,
+                sections=["materials", "geometries"], geometryKeys=CrowdGeometryKeys)
+            characters.append(buildCharacter(struct, mats, context, cfg, useSharedMaterials))
+    finally:
+        del scn['MHCollection']
+    time2 = time.perf_counter()
+
+    nchars = len(characters)
+    print("Imported %d characters in %.2f s (%.2f characters/s)" %
+          (nchars, time2-time1, nchars/max(time2-time1, 1e-6)))
+    return characters
+
+
+def buildCharacter(struct, mats, context, cfg, useSharedMaterials):
+    from .geometries import addMeshToScene, getScaleOffset
+    from .materials import buildMaterial
+
+    scn = context.scene
+    cmats = {}
+    for mhMaterial in struct["materials"]:
+        if useSharedMaterials:
+            key = getMaterialKey(mhMaterial, cfg)
+            if key not in mats.keys():
+                mats[key] = buildMaterial(mhMaterial, scn, cfg)[1]
+            cmats[mhMaterial["name"]] = mats[key]
+        else:
+            mname,mat = buildMaterial(mhMaterial, scn, cfg)
+            cmats[mname] = mat
+
+    obs = []
+    for mhGeo in struct["geometries"]:
+        mhMesh = mhGeo["mesh"]
+        scale,offset = getScaleOffset(mhGeo, cfg, False)
+        verts = transformCoords(mhMesh["vertices"], scale, offset)
+        ob = addMeshToScene(verts, mhGeo["name"], mhMesh, context)
+        ob.MhxUuid = mhGeo["uuid"]
+        if mhGeo["material"] in cmats.keys():
+            ob.data.materials.append(cmats[mhGeo["material"]])
+        obs.append(ob)
+    return obs
+
+
+def getMaterialKey(mhMaterial, cfg):
+    """
+    Materials are equal if all settings except the name are equal.
+    Texture paths are relative to the file, so the folder is included.
+    """
+    settings = dict([(key,value) for key,value in mhMaterial.items() if key != "name"])
+    return (cfg.folder, json.dumps(settings, sort_keys=True, default=str))
+
+#------------------------------------------------------------------------
+#   Operator
+#------------------------------------------------------------------------
+
+class MHX_OT_ImportCrowd(bpy.types.Operator, ImportHelper):
+    """Import several MHX2 files as static meshes"""
+    bl_idname = "import_scene.makehuman_mhx2_crowd"
+    bl_label = "Import MHX2 Crowd"
+    bl_description = "Import several MHX2 files as static meshes with shared materials"
+    bl_options = {'UNDO'}
+
+    filename_ext = ".mhx2"
+    filter_glob : StringProperty(default="*.mhx2", options={'HIDDEN'})
+    files : CollectionProperty(type=bpy.types.OperatorFileListElement, options={'HIDDEN', 'SKIP_SAVE'})
+    directory : StringProperty(subtype='DIR_PATH')
+
+    useOffset : BoolProperty(name="Offset", description="Add offset for feet on ground", default=True)
+    useSharedMaterials : BoolProperty(name="Shared Materials", description="Share identical materials and images between characters", default=True)
+    useStreaming : BoolProperty(name="Streaming Loader", description="Decode mesh, uv, weight and fitting data directly into arrays. Reduces memory use for large files", default=False)
+    useCache : BoolProperty(name="Parse Cache", description="Keep decoded files in a cache folder, so that reimporting an unchanged file skips parsing", default=False)
+
+    def execute(self, context):
+        filepaths = [os.path.join(self.directory, file.name) for file in self.files if file.name]
+        if not filepaths:
+            filepaths = [self.filepath]
+        try:
+            importCrowd(filepaths, context, self.useOffset, self.useStreaming, self.useCache,
+                        self.useSharedMaterials)
+        except MhxError:
+            handleMhxError(context)
+        return {'FINISHED'}
+
+#----------------------------------------------------------
+#   Initialize
+#----------------------------------------------------------
+
+classes = [
+    MHX_OT_ImportCrowd,
+]
+
+def initialize():
+    for cls in classes:
+        bpy.utils.register_class(cls)
+
+
+def uninitialize():
+    for cls in classes:
+        bpy.utils.unregister_class(cls)
@@ -21,8 +21,15 @@
 # ##### END GPL LICENSE BLOCK #####
 
 import bpy
+import numpy as np
 from .utils import *
 from .hm8 import *
+from .topology import getFaceLoops
+
+try:
+    import scipy.sparse
+except ImportError:
+    scipy = None
 
 # ---------------------------------------------------------------------
 #
@@ -104,7 +111,7 @@ def meshVertexGroups(mhMesh, parser, cfg):
 def buildMesh(mhGeo, mhMesh, gname, context, cfg, useSeedMesh):
     scale,offset = getScaleOffset(mhGeo, cfg, useSeedMesh)
     print("BUILD", mhGeo["name"], mhGeo["scale"], scale, offset)
-    verts = [scale*zup(co)+offset for co in mhMesh["vertices"]]
+    verts = transformCoords(mhMesh["vertices"], scale, offset)
     ob = addMeshToScene(verts, gname, mhMesh, context)
     ob.MhxScale = mhGeo["scale"]
     ob.MhxOffset = str(list(zup(mhGeo["offset"])))
@@ -112,25 +119,36 @@ def buildMesh(mhGeo, mhMesh, gname, context, cfg, useSeedMesh):
 
 
 def addMeshToScene(verts, gname, mhMesh, context):
+    """
+    Build the mesh from flat arrays with foreach_set. Faces may be a
+    mix of triangles and quads.
+    """
     me = bpy.data.meshes.new(gname)
-    try:
-        faces = mhMesh["faces"]
-        edges = []
-    except KeyError:
-        edges = mhMesh["edges"]
-        faces = []
-    me.from_pydata(verts, edges, faces)
-
-    for f in me.polygons:
-        f.use_smooth = True
-
-    uvlayer = makeNewUvloop(me)
-    uvcoords = mhMesh["uv_coordinates"]
-    n = 0
-    for f in mhMesh["uv_faces"]:
-        for vn in f:
-            uvlayer.data[n].uv = uvcoords[vn]
-            n += 1
+    coords = np.asarray(verts, dtype=np.float32).reshape(-1)
+    me.vertices.add(len(coords)//3)
+    me.vertices.foreach_set("co", coords)
+
+    if "faces" in mhMesh.keys():
+        loopVerts,loopStarts,loopTotals = getFaceLoops(mhMesh["faces"])
+        me.loops.add(len(loopVerts))
+        me.polygons.add(len(loopStarts))
+        me.polygons.foreach_set("loop_start", loopStarts)
+        if bpy.app.version < (4,0,0):
+            me.polygons.foreach_set("loop_total", loopTotals)
+        me.loops.foreach_set("vertex_index", loopVerts)
+        me.polygons.foreach_set("use_smooth", np.ones(len(loopStarts), dtype=bool))
+        me.update(calc_edges=True)
+
+        uvlayer = makeNewUvloop(me)
+        uvcoords = np.asarray(mhMesh["uv_coordinates"], dtype=np.float32).reshape(-1,2)
+        uvLoops,_starts,_totals = getFaceLoops(mhMesh["uv_faces"])
+        uvlayer.data.foreach_set("uv", uvcoords[uvLoops].reshape(-1))
+    else:
+        edges = np.asarray(mhMesh["edges"], dtype=np.int32).reshape(-1)
+        me.edges.add(len(edges)//2)
+        me.edges.foreach_set("vertices", edges)
+        me.update()
+        makeNewUvloop(me)
 
     ob = bpy.data.objects.new(gname, me)
     coll = getCollection(context)
@@ -148,6 +166,7 @@ def makeNewUvloop(me):
 
 
 def buildVertexGroups(vweights, ob, rig):
+    from .load_json import getPairArrays
     mod = ob.modifiers.new('ARMATURE', 'ARMATURE')
     mod.use_vertex_groups = True
     mod.use_bone_envelopes = False
@@ -155,16 +174,97 @@ def buildVertexGroups(vweights, ob, rig):
 
     for vgname,data in vweights.items():
         vgrp = ob.vertex_groups.new(name=vgname)
-        for vn,w in data:
-            vgrp.add([vn], w, 'REPLACE')
+        vnums,weights = getPairArrays(data)
+        addWeights(vgrp, vnums, weights)
+
+
+def addWeights(vgrp, vnums, weights):
+    """
+    Assign weights with one add() call per distinct weight. Vertex groups
+    store float32 weights, so equal float32 values share a call. As with
+    one call per pair, the last weight of a repeated vertex wins.
+    """
+    if len(vnums) == 0:
+        return
+    weights = np.asarray(weights, dtype=np.float32)
+    vnums,last = np.unique(vnums[::-1], return_index=True)
+    weights = weights[::-1][last]
+    order = np.argsort(weights, kind="stable")
+    weights = weights[order]
+    vnums = vnums[order].tolist()
+    starts = np.flatnonzero(np.r_[True, weights[1:] != weights[:-1]])
+    ends = np.append(starts[1:], len(vnums))
+    for first,last,w in zip(starts.tolist(), ends.tolist(), weights[starts].tolist()):
+        vgrp.add(vnums[first:last], w, 'REPLACE')
 
 
 def getVertexGroupsFromObject(ob):
-    vgrps = dict([(vgrp.index, (vgrp.name, [])) for vgrp in ob.vertex_groups])
+    return dict([(gname, list(zip(data["index"].tolist(), data["weight"].tolist())))
+                 for gname,data in getVertexGroupArrays(ob).items()])
+
+
+def getVertexGroupEntries(ob):
+    """
+    Return the vertex group entries of ob as arrays of vertex numbers,
+    group indices and weights, in vertex order. There is no bulk RNA
+    access to vertex group weights, so the vertices are walked once.
+    """
+    vnums = []
+    gnums = []
+    weights = []
     for v in ob.data.vertices:
         for g in v.groups:
-            vgrps[g.group][1].append((v.index, g.weight))
-    return dict(vgrps.values())
+            vnums.append(v.index)
+            gnums.append(g.group)
+            weights.append(g.weight)
+    return (np.array(vnums, dtype=np.int32),
+            np.array(gnums, dtype=np.int32),
+            np.array(weights, dtype=np.float64))
+
+
+def getVertexGroupArrays(ob):
+    """
+    Return the vertex groups of ob as a dict of PairType arrays sorted by
+    vertex, which buildVertexGroups and proxifyVertexGroups take directly.
+    """
+    from .load_json import makePairArray
+    vnums,gnums,weights = getVertexGroupEntries(ob)
+    order = np.argsort(gnums, kind="stable")
+    bounds = np.searchsorted(gnums[order], np.arange(len(ob.vertex_groups)+1))
+    vnums = vnums[order]
+    weights = weights[order]
+    vgrps = {}
+    for vgrp in ob.vertex_groups:
+        first,last = bounds[vgrp.index],bounds[vgrp.index+1]
+        vgrps[vgrp.name] = makePairArray(vnums[first:last], weights[first:last])
+    return vgrps
+
+
+def getVertexGroupMatrix(ob):
+    """
+    Return the vertex groups of ob as a sparse V x G weight matrix, in
+    scipy CSR form if scipy is available and as (rows, cols, values)
+    otherwise, together with the list of group names.
+    """
+    vnums,gnums,weights = getVertexGroupEntries(ob)
+    shape = (len(ob.data.vertices), len(ob.vertex_groups))
+    names = [vgrp.name for vgrp in ob.vertex_groups]
+    if scipy:
+        return scipy.sparse.csr_matrix((weights, (vnums, gnums)), shape=shape), names
+    else:
+        return (vnums, gnums, weights), names
+
+
+def selectVertexGroup(ob, vgrp, vgrps=None):
+    """
+    Select the vertices in vgrp, in addition to those already selected.
+    """
+    if vgrps is None:
+        vgrps = getVertexGroupArrays(ob)
+    select = np.empty(len(ob.data.vertices), dtype=bool)
+    ob.data.vertices.foreach_get("select", select)
+    select[vgrps[vgrp.name]["index"]] = True
+    ob.data.vertices.foreach_set("select", select)
 
 
 def getScaleOffset(struct, cfg, useSeedMesh):
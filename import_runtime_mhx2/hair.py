@@ -24,6 +24,7 @@ import bpy
 from mathutils import Vector
 from .error import *
 from .utils import *
+from .profiler import setMode, callOperator
 
 
 def isHairStruct(struct):
@@ -34,16 +35,17 @@ def getHairCoords(mhHuman, mhGeo):
     from .proxy import fitProxy
 
     mhProxy = mhGeo["proxy"]
-    offset = Vector(zup(mhHuman["offset"]))
+    offset = zup(mhHuman["offset"])
     coords = []
     for mhSystem in mhGeo["particle_systems"]:
         pverts,scales = fitProxy(mhHuman, mhSystem["fitting"], mhProxy["bounding_box"])
+        pverts = transformCoords(pverts, offset=offset)
         hlist = mhSystem["hairs"]
         nhairs = int(len(hlist))
         hlen = int(len(hlist[0]))
         coord = []
         for m in range(nhairs):
-            coord.append( [Vector(zup(v)) + offset for v in pverts[m*hlen:(m+1)*hlen]] )
+            coord.append( [Vector(v) for v in pverts[m*hlen:(m+1)*hlen]] )
         coords.append(coord)
     return mhGeo,coords,scales
 
@@ -56,7 +58,7 @@ def addHair(ob, struct, hcoords, scn, cfg=None, override={}):
 
     nsys = len(ob.particle_systems)
     for n in range(nsys):
-        bpy.ops.object.particle_system_remove()
+        callOperator(bpy.ops.object.particle_system_remove)
     #if nsys > 0:
     #    ob.data.materials.pop()
 
@@ -85,7 +87,7 @@ def addHair(ob, struct, hcoords, scn, cfg=None, override={}):
 
     for n,mhSystem in enumerate(struct["particle_systems"]):
         hcoord = hcoords[n]
-        bpy.ops.object.particle_system_add()
+        callOperator(bpy.ops.object.particle_system_add)
         psys = ob.particle_systems.active
         psys.name = mhSystem["name"]
         for key,val in mhSystem["particles"].items():
@@ -132,14 +134,14 @@ def addHair(ob, struct, hcoords, scn, cfg=None, override={}):
         ccset.tip_width = 0
         ccset.radius_scale = 0.01*ob.MhxScale
 
-        bpy.ops.object.mode_set(mode='PARTICLE_EDIT')
+        setMode('PARTICLE_EDIT')
         pedit = scn.tool_settings.particle_edit
         pedit.use_emitter_deflect = False
         pedit.use_preserve_length = False
         pedit.use_preserve_root = False
         ob.data.use_mirror_x = False
         pedit.select_mode = 'POINT'
-        bpy.ops.transform.translate()
+        callOperator(bpy.ops.transform.translate)
 
         for m,hair in enumerate(psys.particles):
             verts = hcoord[m]
@@ -148,7 +150,7 @@ def addHair(ob, struct, hcoords, scn, cfg=None, override={}):
                 v.co = verts[n]
                 pass
 
-        bpy.ops.object.mode_set(mode='OBJECT')
+        setMode('OBJECT')
 
         if not useHairDynamics:
             psys.use_hair_dynamics = False
@@ -236,29 +238,19 @@ def particlifyHair(context):
         return
 
     activateObject(context, human)
-    bpy.ops.object.mode_set(mode='OBJECT')
+    setMode('OBJECT')
     activateObject(context, hair)
-    bpy.ops.object.mode_set(mode='OBJECT')
-
-    vedges = dict([(n,[]) for n in range(len(hair.data.vertices))])
-    for e in hair.data.edges:
-        vn1,vn2 = e.vertices
-        vedges[vn1].append(e.index)
-        vedges[vn2].append(e.index)
-
-    efaces = dict([(n,[]) for n in range(len(hair.data.edges))])
-    fedges = dict([(n,[]) for n in range(len(hair.data.polygons))])
-    for f in hair.data.polygons:
-        for vn1,vn2 in f.edge_keys:
-            for en in vedges[vn1]:
-                if en in vedges[vn2]:
-                    efaces[en].append(f.index)
-                    fedges[f.index].append(en)
-                    break
+    setMode('OBJECT')
+
+    from .topology import getObjectTopology
+    topo = getObjectTopology(hair.data)
+    vedges = topo.vertEdges
+    efaces = topo.edgeFaces
+    fedges = topo.faceEdges
 
     print("Collecting rings")
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_mode(use_extend=False, use_expand=False, type='EDGE')
+    setMode('EDIT')
+    callOperator(bpy.ops.mesh.select_mode, use_extend=False, use_expand=False, type='EDGE')
     rings = []
     rcoords = {}
     nRings = 0
@@ -268,13 +260,13 @@ def particlifyHair(context):
         if taken[en]:
             continue
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='DESELECT')
-        bpy.ops.object.mode_set(mode='OBJECT')
+        setMode('EDIT')
+        callOperator(bpy.ops.mesh.select_all, action='DESELECT')
+        setMode('OBJECT')
         hair.data.edges[en].select = True
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.loop_multi_select(ring=True)
-        bpy.ops.object.mode_set(mode='OBJECT')
+        setMode('EDIT')
+        callOperator(bpy.ops.mesh.loop_multi_select, ring=True)
+        setMode('OBJECT')
         ring = []
         for en1 in taken.keys():
             e1 = hair.data.edges[en1]
@@ -305,14 +297,14 @@ def particlifyHair(context):
     nGroups = 0
     for rn,ring in enumerate(rings):
         if groups[rn] < 0:
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.select_all(action='DESELECT')
-            bpy.ops.object.mode_set(mode='OBJECT')
+            setMode('EDIT')
+            callOperator(bpy.ops.mesh.select_all, action='DESELECT')
+            setMode('OBJECT')
             en = ring[0]
             hair.data.edges[en].select = True
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.select_linked()
-            bpy.ops.object.mode_set(mode='OBJECT')
+            setMode('EDIT')
+            callOperator(bpy.ops.mesh.select_linked)
+            setMode('OBJECT')
 
             lsum = 0
             nrings = 0
@@ -29,10 +29,11 @@ from mathutils import Vector, Matrix, Quaternion
 from .hm8 import *
 from .error import *
 from .utils import *
+from .profiler import setMode, callOperator
 from .buttons28 import Mhx2Import
 
 LowestVersion = 22
-HighestVersion = 49
+HighestVersion = 51
 
 # ---------------------------------------------------------------------
 #   Import button
@@ -65,6 +66,9 @@ class MHX_OT_Import(bpy.types.Operator, Mhx2Import):
 
     def draw(self, context):
         layout = self.layout
+        layout.prop(self, "useStreaming")
+        layout.prop(self, "useCache")
+        layout.prop(self, "useProfiler")
         layout.prop(self, "useOverride")
         if not self.useOverride:
             return
@@ -136,16 +140,30 @@ class MHX_OT_Import(bpy.types.Operator, Mhx2Import):
 # ---------------------------------------------------------------------
 
 def importMhx2File(filepath, cfg, context):
+    from .profiler import ImportProfiler, saveProfile
     filepath = os.path.expanduser(filepath)
     cfg.folder = os.path.dirname(filepath)
-    struct, time1 = importMhx2Json(filepath)
-    build(struct, cfg, context)
+    profiler = ImportProfiler(cfg.useProfiler)
+    profiler.start()
+    try:
+        with profiler.phase("load"):
+            struct, time1 = importMhx2Json(filepath, cfg.useStreaming, cfg.useCache)
+        build(struct, cfg, context, profiler)
+    finally:
+        profiler.stop()
     time2 = time.perf_counter()
-    print("File %s loaded in %g s" % (filepath, time2-time1))
+    if cfg.useProfiler:
+        profiler.printReport()
+        saveProfile(context.scene, profiler.getReport(filepath))
+    if cfg.useCache:
+        from .cache import getCacheStats
+        print("File %s loaded in %g s (parse cache: %d hits, %d misses)" % ((filepath, time2-time1) + getCacheStats()))
+    else:
+        print("File %s loaded in %g s" % (filepath, time2-time1))
 
 
-def importMhx2Json(filepath):
-    from .load_json import loadJson
+def importMhx2Json(filepath, useStreaming=False, useCache=False, sections=None, geometries=None, geometryKeys=None):
+    from .load_json import loadJson, loadJsonStream, loadJsonSections, selectSections, dequantiseMeshes
 
     if os.path.splitext(filepath)[1].lower() != ".mhx2":
         print("Error: Not a mhx2 file: %s" % filepath.encode('utf-8', 'strict'))
@@ -153,7 +171,21 @@ def importMhx2Json(filepath):
     print( "Opening MHX2 file %s " % filepath.encode('utf-8', 'strict') )
 
     time1 = time.perf_counter()
-    struct = loadJson(filepath)
+    if useStreaming:
+        loader = loadJsonStream
+    else:
+        loader = loadJson
+    if sections:
+        sections = ["mhx2_version"] + list(sections)
+    if useCache:
+        from .cache import loadCachedJson
+        struct = loadCachedJson(filepath, loader)
+        if sections:
+            struct = selectSections(struct, sections, geometries, geometryKeys)
+    elif sections:
+        struct = loadJsonSections(filepath, sections, geometries, geometryKeys, useStreaming)
+    else:
+        struct = loader(filepath)
 
     try:
         vstring = struct["mhx2_version"]
@@ -175,17 +207,21 @@ def importMhx2Json(filepath):
             "0.%d and 0.%d" % (LowestVersion, HighestVersion))
             )
 
+    dequantiseMeshes(struct)
     return struct, time1
 
 
-def build(struct, cfg, context):
+def build(struct, cfg, context, profiler=None):
     from .armature.build import buildRig
     from .armature.rigify import checkRigifyEnabled
     from .materials import buildMaterial
     from .geometries import buildGeometry, getScaleOffset
     from .proxy import setMhHuman
+    from .profiler import ImportProfiler
 
     scn = context.scene
+    if profiler is None:
+        profiler = ImportProfiler(False)
 
     if (cfg.useOverride and
         cfg.rigType == 'RIGIFY' and
@@ -195,9 +231,10 @@ def build(struct, cfg, context):
         #raise MhxError("The Rigify add-on is not enabled. It is found under rigging.")
 
     mats = {}
-    for mhMaterial in struct["materials"]:
-        mname,mat = buildMaterial(mhMaterial, scn, cfg)
-        mats[mname] = mat
+    with profiler.phase("materials"):
+        for mhMaterial in struct["materials"]:
+            mname,mat = buildMaterial(mhMaterial, scn, cfg)
+            mats[mname] = mat
 
     mhHuman = None
     for mhGeo in struct["geometries"]:
@@ -213,26 +250,27 @@ def build(struct, cfg, context):
 
     parser = None
     rig = None
-    if cfg.useOverride:
-        if cfg.useRig:
-            if cfg.rigType == 'EXPORTED':
-                if "skeleton" in struct.keys():
-                    mhSkel = struct["skeleton"]
-                    rig = buildSkeleton(mhSkel, context, cfg)
-            elif cfg.rigType in ['EXPORTED_MHX', 'EXPORTED_RIGIFY']:
-                from .armature.rerig import isDefaultRig
-                if "skeleton" in struct.keys():
-                    mhSkel = struct["skeleton"]
-                    if isDefaultRig(mhSkel):
-                        rig,parser = buildRig(mhHuman, mhSkel, cfg, context)
-                    else:
-                        print("Can only build %s rig if the Default rig (with or without toes) was exported from MakeHuman." % cfg.rigType)
+    with profiler.phase("rig"):
+        if cfg.useOverride:
+            if cfg.useRig:
+                if cfg.rigType == 'EXPORTED':
+                    if "skeleton" in struct.keys():
+                        mhSkel = struct["skeleton"]
                         rig = buildSkeleton(mhSkel, context, cfg)
-            else:
-                rig,parser = buildRig(mhHuman, None, cfg, context)
-    elif "skeleton" in struct.keys():
-        mhSkel = struct["skeleton"]
-        rig = buildSkeleton(mhSkel, context, cfg)
+                elif cfg.rigType in ['EXPORTED_MHX', 'EXPORTED_RIGIFY']:
+                    from .armature.rerig import isDefaultRig
+                    if "skeleton" in struct.keys():
+                        mhSkel = struct["skeleton"]
+                        if isDefaultRig(mhSkel):
+                            rig,parser = buildRig(mhHuman, mhSkel, cfg, context)
+                        else:
+                            print("Can only build %s rig if the Default rig (with or without toes) was exported from MakeHuman." % cfg.rigType)
+                            rig = buildSkeleton(mhSkel, context, cfg)
+                else:
+                    rig,parser = buildRig(mhHuman, None, cfg, context)
+        elif "skeleton" in struct.keys():
+            mhSkel = struct["skeleton"]
+            rig = buildSkeleton(mhSkel, context, cfg)
 
     if rig:
         rig.MhxScale = mhHuman["scale"]
@@ -244,32 +282,34 @@ def build(struct, cfg, context):
     human = None
     proxies = []
     proxy = None
-    for mhGeo in struct["geometries"]:
-        if "proxy" in mhGeo.keys():
-            mhProxy = mhGeo["proxy"]
-            if mhGeo["human"]:
-                if cfg.useHelpers:
-                    if cfg.useHumanType != 'BASE':
-                        proxy = buildGeometry(mhGeo, mats, rig, parser, context, cfg, "proxy_seed_mesh")
-                        proxy.MhxHuman = True
-                    if cfg.useHumanType != 'PROXY':
-                        human = buildGeometry(mhGeo, mats, rig, parser, context, cfg, "seed_mesh")
-                        human.MhxHuman = True
-                else:
-                    proxy = buildGeometry(mhGeo, mats, rig, parser, context, cfg, "mesh")
-                    proxy.MhxHuman = True
-                if proxy:
-                    proxies.append((mhGeo, proxy))
-            elif mhProxy["type"] == "Hair" and cfg.hairType != 'NONE':
-                pass
-            elif mhProxy["type"] == "Genitals" and cfg.genitalia != 'NONE':
-                pass
-            else:
-                ob = buildGeometry(mhGeo, mats, rig, parser, context, cfg, cfg.getMeshType())
-                proxies.append((mhGeo, ob))
-        elif mhGeo["human"]:
-            human = buildGeometry(mhGeo, mats, rig, parser, context, cfg, cfg.getMeshType())
-            human.MhxHuman = True
+    with profiler.phase("geometries"):
+        for mhGeo in struct["geometries"]:
+            with profiler.phase(mhGeo["name"]):
+                if "proxy" in mhGeo.keys():
+                    mhProxy = mhGeo["proxy"]
+                    if mhGeo["human"]:
+                        if cfg.useHelpers:
+                            if cfg.useHumanType != 'BASE':
+                                proxy = buildGeometry(mhGeo, mats, rig, parser, context, cfg, "proxy_seed_mesh")
+                                proxy.MhxHuman = True
+                            if cfg.useHumanType != 'PROXY':
+                                human = buildGeometry(mhGeo, mats, rig, parser, context, cfg, "seed_mesh")
+                                human.MhxHuman = True
+                        else:
+                            proxy = buildGeometry(mhGeo, mats, rig, parser, context, cfg, "mesh")
+                            proxy.MhxHuman = True
+                        if proxy:
+                            proxies.append((mhGeo, proxy))
+                    elif mhProxy["type"] == "Hair" and cfg.hairType != 'NONE':
+                        pass
+                    elif mhProxy["type"] == "Genitals" and cfg.genitalia != 'NONE':
+                        pass
+                    else:
+                        ob = buildGeometry(mhGeo, mats, rig, parser, context, cfg, cfg.getMeshType())
+                        proxies.append((mhGeo, ob))
+                elif mhGeo["human"]:
+                    human = buildGeometry(mhGeo, mats, rig, parser, context, cfg, cfg.getMeshType())
+                    human.MhxHuman = True
 
     if proxy:
         proxy.MhxUuid = mhHuman["uuid"]
@@ -277,66 +317,75 @@ def build(struct, cfg, context):
     groupName = mhHuman["name"].split(":",1)[0]
 
     if cfg.useOverride and cfg.genitalia != "NONE":
-        genitalia = addMeshProxy("genitalia", cfg.genitalia, mhHuman, mats, rig, parser, context, cfg)
-        proxies.append(genitalia)
+        with profiler.phase("genitalia"):
+            genitalia = addMeshProxy("genitalia", cfg.genitalia, mhHuman, mats, rig, parser, context, cfg)
+            proxies.append(genitalia)
 
     if cfg.useOverride and cfg.useDeflector:
         from .hair import makeDeflector
-        deflHead = addMeshProxy("deflector", "deflector_head", mhHuman, mats, None, None, context, cfg)
-        makeDeflector(deflHead, rig, ["head"], cfg)
-        proxies.append(deflHead)
-        deflTorso = addMeshProxy("deflector", "deflector_torso", mhHuman, mats, None, None, context, cfg)
-        makeDeflector(deflTorso, rig, ["chest-1","chest"], cfg)
-        proxies.append(deflTorso)
+        with profiler.phase("deflector"):
+            deflHead = addMeshProxy("deflector", "deflector_head", mhHuman, mats, None, None, context, cfg)
+            makeDeflector(deflHead, rig, ["head"], cfg)
+            proxies.append(deflHead)
+            deflTorso = addMeshProxy("deflector", "deflector_torso", mhHuman, mats, None, None, context, cfg)
+            makeDeflector(deflTorso, rig, ["chest-1","chest"], cfg)
+            proxies.append(deflTorso)
 
     if cfg.useOverride and cfg.useRigify and cfg.finalizeRigify and rig:
         from .armature.rigify import fixRigifyMeshes
-        fixRigifyMeshes(rig.children)
+        with profiler.phase("rigify meshes"):
+            fixRigifyMeshes(rig.children)
 
     if cfg.useOverride and cfg.hairType != "NONE":
         from .proxy import getProxyCoordinates
         folder = os.path.dirname(__file__)
         filepath = os.path.join(folder, "data/hm8/hair", cfg.hairType)
-        hair,hcoords,_scales = getProxyCoordinates(mhHuman, filepath)
+        with profiler.phase("hair coordinates"):
+            hair,hcoords,_scales = getProxyCoordinates(mhHuman, filepath)
 
     if cfg.useOverride and cfg.useFaceShapes:
         from .shapekeys import addShapeKeys
         path = "data/hm8/faceshapes/faceshapes.mxa"
         proxyTypes = ["Proxymeshes", "Eyebrows", "Eyelashes", "Teeth", "Tongue"]
-        addShapeKeys(human, path, mhHuman=mhHuman, proxies=proxies, proxyTypes=proxyTypes)
-
-        if cfg.useFaceShapeDrivers:
-            from .shapekeys import addShapeKeyDriversToAll
-            meshes = [human] + [ob for (_,ob) in proxies]
-            addShapeKeyDriversToAll(rig, meshes, "Mhf")
-        elif parser and parser.boneDrivers:
-            from .drivers import addBoneShapeDrivers
-            addBoneShapeDrivers(rig, human, parser.boneDrivers, proxies=proxies, proxyTypes=proxyTypes)
+        with profiler.phase("shapekeys"):
+            addShapeKeys(human, path, mhHuman=mhHuman, proxies=proxies, proxyTypes=proxyTypes)
+
+        with profiler.phase("shapekey drivers"):
+            if cfg.useFaceShapeDrivers:
+                from .shapekeys import addShapeKeyDriversToAll
+                meshes = [human] + [ob for (_,ob) in proxies]
+                addShapeKeyDriversToAll(rig, meshes, "Mhf")
+            elif parser and parser.boneDrivers:
+                from .drivers import addBoneShapeDrivers
+                addBoneShapeDrivers(rig, human, parser.boneDrivers, proxies=proxies, proxyTypes=proxyTypes)
 
     deselectAll(human, proxies, context)
 
     if cfg.useOverride and cfg.useHelpers:
         from .masks import addMasks, selectAllMaskVGroups
         proxyTypes = ["Proxymeshes", "Genitals"]
-        if cfg.useMasks == 'MODIFIER':
-            addMasks(mhHuman, human, proxies, proxyTypes, cfg.useConservativeMasks)
-        elif cfg.useMasks == 'APPLY':
-            addMasks(mhHuman, human, proxies, proxyTypes, cfg.useConservativeMasks)
-            selectAllMaskVGroups(human, proxies)
-        elif cfg.useMasks == 'IGNORE':
-            pass
+        with profiler.phase("masks"):
+            if cfg.useMasks == 'MODIFIER':
+                addMasks(mhHuman, human, proxies, proxyTypes, cfg.useConservativeMasks)
+            elif cfg.useMasks == 'APPLY':
+                addMasks(mhHuman, human, proxies, proxyTypes, cfg.useConservativeMasks)
+                selectAllMaskVGroups(human, proxies)
+            elif cfg.useMasks == 'IGNORE':
+                pass
 
     if (cfg.useOverride and cfg.useRig and cfg.useFaceRigDrivers and
         cfg.rigType in ['EXPORTED_MHX', 'EXPORTED_RIGIFY']):
         from .armature.rerig import makeBonesPosable
-        setActiveObject(context, rig)
-        makeBonesPosable(rig, cfg.useMhx)
+        with profiler.phase("face rig drivers"):
+            setActiveObject(context, rig)
+            makeBonesPosable(rig, cfg.useMhx)
 
-    if cfg.deleteHelpers:
-        selectHelpers(human)
+    with profiler.phase("delete helpers"):
+        if cfg.deleteHelpers:
+            selectHelpers(human)
 
-    if cfg.useOverride:
-        deleteAllSelected(human, proxies, context)
+        if cfg.useOverride:
+            deleteAllSelected(human, proxies, context)
 
     if cfg.useOverride and cfg.mergeBodyParts:
         from .merge import mergeBodyParts
@@ -347,24 +396,26 @@ def build(struct, cfg, context):
             proxyTypes += ['Hair', 'Clothes']
         ob = getEffectiveHuman(human, proxy, cfg.mergeToProxy)
         if ob:
-            mergeBodyParts(ob, proxies, context, proxyTypes=proxyTypes)
+            with profiler.phase("merge"):
+                mergeBodyParts(ob, proxies, context, proxyTypes=proxyTypes)
 
     if cfg.useOverride and cfg.hairType != "NONE":
         from .hair import addHair
         ob = getEffectiveHuman(human, proxy, cfg.useHairOnProxy)
         if ob:
-            activateObject(context, ob)
-            addHair(ob, hair, hcoords, scn, cfg)
+            with profiler.phase("hair"):
+                activateObject(context, ob)
+                addHair(ob, hair, hcoords, scn, cfg)
 
     if rig:
         activateObject(context, rig)
-        bpy.ops.object.mode_set(mode='POSE')
+        setMode('POSE')
     elif human:
         activateObject(context, human)
-        bpy.ops.object.mode_set(mode='OBJECT')
+        setMode('OBJECT')
     elif proxy:
         activateObject(context, proxy)
-        bpy.ops.object.mode_set(mode='OBJECT')
+        setMode('OBJECT')
 
     if 'MHCollection' in scn:
         del scn['MHCollection']
@@ -408,7 +459,7 @@ def buildSkeleton(mhSkel, context, cfg):
     activateObject(context, rig)
 
     scale,offset = getScaleOffset(mhSkel, cfg, True)
-    bpy.ops.object.mode_set(mode='EDIT')
+    setMode('EDIT')
     for mhBone in mhSkel["bones"]:
         eb = amt.edit_bones.new(mhBone["name"])
         eb.head = zup(mhBone["head"])+offset
@@ -423,7 +474,7 @@ def buildSkeleton(mhSkel, context, cfg):
         if "parent" in mhBone.keys():
             eb.parent = amt.edit_bones[mhBone["parent"]]
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+    setMode('OBJECT')
     for mhBone in mhSkel["bones"]:
         pb = rig.pose.bones[mhBone["name"]]
         if pb.parent:
@@ -445,27 +496,27 @@ def deselectMesh(ob):
 def deselectAll(human, proxies, context):
     if human:
         activateObject(context, human)
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='DESELECT')
-        bpy.ops.object.mode_set(mode='OBJECT')
+        setMode('EDIT')
+        callOperator(bpy.ops.mesh.select_all, action='DESELECT')
+        setMode('OBJECT')
     for _,pxy in proxies:
         activateObject(context, pxy)
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='DESELECT')
-        bpy.ops.object.mode_set(mode='OBJECT')
+        setMode('EDIT')
+        callOperator(bpy.ops.mesh.select_all, action='DESELECT')
+        setMode('OBJECT')
 
 
 def deleteAllSelected(human, proxies, context):
     if human:
         activateObject(context, human)
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.delete(type='VERT')
-        bpy.ops.object.mode_set(mode='OBJECT')
+        setMode('EDIT')
+        callOperator(bpy.ops.mesh.delete, type='VERT')
+        setMode('OBJECT')
     for _,pxy in proxies:
         activateObject(context, pxy)
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.delete(type='VERT')
-        bpy.ops.object.mode_set(mode='OBJECT')
+        setMode('EDIT')
+        callOperator(bpy.ops.mesh.delete, type='VERT')
+        setMode('OBJECT')
 
 
 def selectHelpers(human):
@@ -478,9 +529,14 @@ def selectHelpers(human):
 #   Design human
 #------------------------------------------------------------------------
 
+# Parts of the human used by addMxa and the other design human tools
+DesignHumanKeys = ["name", "uuid", "human", "offset", "scale", "material", "seed_mesh"]
+
 def setDesignHuman(filepath, context):
     filepath = os.path.expanduser(filepath)
-    struct, _time1 = importMhx2Json(filepath)
+    struct, _time1 = importMhx2Json(filepath, sections=["geometries"],
+                                    geometries=(lambda info: info["human"]),
+                                    geometryKeys=DesignHumanKeys)
     for mhGeo in struct["geometries"]:
         if mhGeo["human"]:
             mhHuman = mhGeo
@@ -519,6 +575,24 @@ class MHX_OT_ClearDesignHuman(bpy.types.Operator):
         context.scene.MhxDesignHuman = "None"
         return{'FINISHED'}
 
+
+class MHX_OT_BuildAssetPack(bpy.types.Operator):
+    bl_idname = "mhx2.build_asset_pack"
+    bl_label = "Build Asset Pack"
+    bl_description = "Pack the bundled assets into one indexed file for faster loading"
+
+    def execute(self, context):
+        from .asset_pack import buildAssetPack
+        from .load_json import clearAssetCache
+        try:
+            npacked = buildAssetPack()
+        except OSError as err:
+            self.report({'ERROR'}, "Could not build asset pack: %s" % err)
+            return{'CANCELLED'}
+        clearAssetCache()
+        self.report({'INFO'}, "Packed %d assets" % npacked)
+        return{'FINISHED'}
+
 #----------------------------------------------------------
 #   Initialize
 #----------------------------------------------------------
@@ -527,6 +601,7 @@ classes = [
     MHX_OT_Import,
     MHX_OT_SetDesignHuman,
     MHX_OT_ClearDesignHuman,
+    MHX_OT_BuildAssetPack,
 ]
 
 def initialize():
@@ -22,13 +22,26 @@
 
 import json
 import gzip
+import zlib
+import lzma
+import bz2
 import os
+import io
+import base64
+import re
+import bisect
+import struct as pystruct
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 def loadJson(filepath):
-    try:
-        with gzip.open(filepath, 'rb') as fp:
-            bytes = fp.read()
-    except IOError:
+    if isArrayContainer(filepath):
+        return loadArrayContainer(filepath)
+    codec = getCodec(filepath)
+    if codec:
+        bytes = readCompressed(filepath, codec)
+    else:
         bytes = None
 
     if bytes:
@@ -47,5 +60,929 @@ def loadJson(filepath):
 def loadJsonRelative(filepath):
     folder = os.path.dirname(__file__)
     filepath = os.path.join(folder, filepath)
-    return loadJson(filepath)
+    return loadAsset(filepath)
+
+#------------------------------------------------------------------------
+#   Asset cache.
+#   Bundled assets (proxies, targets, presets, vertex groups, gizmos) are
+#   parsed once per session and shared between imports. Shared data is
+#   frozen: dicts become FrozenDicts, lists become tuples and arrays are
+#   read-only, and assets found in the asset pack are mapped from it
+#   rather than parsed. Callers that
+#   modify an asset wrap it in copyOnWrite, or take a mutable copy with
+#   thawJson. Entries are keyed by real path and checked against size and
+#   mtime, and the least recently used entries are dropped when the summed
+#   file size exceeds MaxAssetCacheSize. Only files inside the add-on
+#   folder are cached; user files are loaded afresh every time.
+#------------------------------------------------------------------------
+
+MaxAssetCacheSize = 64 << 20
+
+theAssetCache = OrderedDict()
+
+def loadAsset(filepath):
+    path = os.path.realpath(filepath)
+    if not isBundledAsset(path):
+        return loadJson(path)
+    stat = os.stat(path)
+    stamp = (stat.st_size, stat.st_mtime_ns)
+    if path in theAssetCache.keys():
+        entry = theAssetCache[path]
+        if entry[0] == stamp:
+            theAssetCache.move_to_end(path)
+            return entry[1]
+        del theAssetCache[path]
+
+    from .asset_pack import loadPackedAsset
+    struct = loadPackedAsset(path)
+    if struct is None:
+        struct = freezeJson(loadJson(path))
+    theAssetCache[path] = (stamp, struct)
+    total = sum([entry[0][0] for entry in theAssetCache.values()])
+    while total > MaxAssetCacheSize and len(theAssetCache) > 1:
+        _,entry = theAssetCache.popitem(last=False)
+        total -= entry[0][0]
+    return struct
+
+
+def isBundledAsset(path):
+    folder = os.path.realpath(os.path.dirname(__file__))
+    try:
+        return (os.path.commonpath([folder, path]) == folder)
+    except ValueError:
+        return False
+
+
+def clearAssetCache():
+    theAssetCache.clear()
+
+
+class FrozenDict(dict):
+    def readOnly(self, *args, **kwargs):
+        raise TypeError("Shared asset data is read-only. Use copyOnWrite or thawJson to modify it.")
+
+    __setitem__ = __delitem__ = readOnly
+    clear = pop = popitem = setdefault = update = readOnly
+
+
+class CowDict(dict):
+    """Writable overlay on a FrozenDict. Nested dicts are wrapped when first
+    accessed, so only the parts of the asset that are modified get copied."""
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, FrozenDict):
+            value = CowDict(value)
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+
+def copyOnWrite(struct):
+    if isinstance(struct, FrozenDict):
+        return CowDict(struct)
+    return struct
+
+
+def freezeJson(data):
+    if isinstance(data, dict):
+        return FrozenDict([(key, freezeJson(value)) for key,value in data.items()])
+    elif isinstance(data, list):
+        return tuple([freezeJson(elt) for elt in data])
+    elif isinstance(data, np.ndarray):
+        data = data.view()
+        data.flags.writeable = False
+        return data
+    else:
+        return data
+
+
+def thawJson(data):
+    if isinstance(data, dict):
+        return dict([(key, thawJson(value)) for key,value in data.items()])
+    elif isinstance(data, (list, tuple)):
+        return [thawJson(elt) for elt in data]
+    elif isinstance(data, np.ndarray):
+        return thawJson(data.tolist())
+    else:
+        return data
+
+#------------------------------------------------------------------------
+#   Streaming loader.
+#   The document is read in chunks and walked token by token. The large
+#   leaf arrays listed in ArrayKinds are decoded directly into typed
+#   numpy arrays, other numeric and boolean arrays by json in one call.
+#------------------------------------------------------------------------
+
+COORDS = "COORDS"
+INDICES = "INDICES"
+PAIRS = "PAIRS"
+FITTING = "FITTING"
+GROUPS = "GROUPS"
+
+ArrayKinds = {
+    "vertices" : COORDS,
+    "uv_coordinates" : COORDS,
+    "faces" : INDICES,
+    "uv_faces" : INDICES,
+    "weights" : GROUPS,
+    "fitting" : FITTING,
+}
+
+PairType = np.dtype([("index", "<i4"), ("weight", "<f4")])
+TargetType = np.dtype([("index", "<i4"), ("delta", "<f4", (3,))])
+FittingType = np.dtype([("vnums", "<i4", (3,)), ("weights", "<f4", (3,)), ("offsets", "<f4", (3,))])
+
+def loadJsonStream(filepath):
+    if isArrayContainer(filepath):
+        return loadArrayContainer(filepath)
+    codec = getCodec(filepath)
+    if codec:
+        fp = CodecModules[codec].open(filepath, "rb")
+    else:
+        fp = open(filepath, "rb")
+    try:
+        struct = JsonStream(fp).parse()
+    finally:
+        fp.close()
+
+    if not struct:
+        print("Could not load %s" % filepath)
+
+    return struct
+
+
+class JsonStream:
+
+    ChunkSize = 1 << 20
+
+    WhiteSpace = re.compile(rb"[ \t\n\r]*")
+    String = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"')
+    Scalar = re.compile(rb"-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?|true|false|null")
+    Opening = re.compile(rb"(?:\[[ \t\n\r]*)+")
+    Delimiter = re.compile(rb"[ \t\n\r,:\]}]")
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.buf = bytearray()
+        self.pos = 0
+        self.eof = False
+
+
+    def parse(self, kind=None):
+        value = self.parseValue(kind)
+        if self.peek() is not None:
+            raise ValueError("Extra data at position %d" % self.pos)
+        return value
+
+
+    def fill(self):
+        if self.eof:
+            return False
+        if self.pos > self.ChunkSize:
+            del self.buf[:self.pos]
+            self.pos = 0
+        chunk = self.fp.read(self.ChunkSize)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf += chunk
+        return True
+
+
+    def peek(self):
+        while True:
+            self.pos = self.WhiteSpace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            elif not self.fill():
+                return None
+
+
+    def expect(self, char):
+        if self.peek() != ord(char):
+            raise ValueError("Expected '%s' at position %d" % (char, self.pos))
+        self.pos += 1
+
+
+    def match(self, regex):
+        """
+        Match a string or scalar. A match is only complete if a delimiter
+        follows, since e.g. "0." at the end of the buffer may continue.
+        """
+        self.peek()
+        while True:
+            m = regex.match(self.buf, self.pos)
+            if m and (self.Delimiter.match(self.buf, m.end()) or self.eof):
+                self.pos = m.end()
+                return bytes(m.group())
+            elif not self.fill() and not m:
+                raise ValueError("Unexpected end of data at position %d" % self.pos)
+
+
+    def parseValue(self, kind):
+        char = self.peek()
+        if char == ord("{"):
+            return self.parseObject(kind)
+        elif char == ord("["):
+            return self.parseArray(kind)
+        elif char == ord('"'):
+            return json.loads(self.match(self.String))
+        elif char is None:
+            raise ValueError("Unexpected end of data")
+        else:
+            return json.loads(self.match(self.Scalar))
+
+
+    def parseObject(self, kind):
+        struct = {}
+        self.expect("{")
+        if self.peek() == ord("}"):
+            self.pos += 1
+            return struct
+        while True:
+            key = json.loads(self.match(self.String))
+            self.expect(":")
+            if kind == GROUPS:
+                struct[key] = self.parseValue(PAIRS)
+            else:
+                struct[key] = self.parseValue(ArrayKinds.get(key))
+            char = self.peek()
+            self.pos += 1
+            if char == ord("}"):
+                return struct
+            elif char != ord(","):
+                raise ValueError("Expected ',' or '}' at position %d" % (self.pos-1))
+
+
+    def parseArray(self, kind):
+        data = self.findLeafArray()
+        if data is not None:
+            if kind in (COORDS, INDICES, PAIRS, FITTING):
+                try:
+                    return decodeArray(data, kind)
+                except ValueError:
+                    pass
+            try:
+                return json.loads(data)
+            except ValueError:
+                self.pos -= len(data)
+
+        array = []
+        self.expect("[")
+        if self.peek() == ord("]"):
+            self.pos += 1
+            return array
+        while True:
+            array.append(self.parseValue(None))
+            char = self.peek()
+            self.pos += 1
+            if char == ord("]"):
+                return array
+            elif char != ord(","):
+                raise ValueError("Expected ',' or ']' at position %d" % (self.pos-1))
+
+
+    def findLeafArray(self):
+        """
+        Return the raw bytes of the array at the current position if it only
+        contains numbers, booleans and null, and advance past it.
+        An array with leading depth d ends at the first run of d closing brackets.
+        """
+        while True:
+            m = self.Opening.match(self.buf, self.pos)
+            if m.end() < len(self.buf) or not self.fill():
+                break
+        if m.end() >= len(self.buf) or self.buf[m.end()] in (ord('"'), ord("{")):
+            return None
+
+        depth = m.group().count(b"[")
+        closing = re.compile(rb"\]" + (depth-1)*rb"[ \t\n\r]*\]")
+        offset = m.end() - self.pos
+        while True:
+            end = closing.search(self.buf, self.pos + offset)
+            if end:
+                break
+            offset = max(offset, self.buf.rfind(b",", self.pos) - self.pos)
+            if not self.fill():
+                return None
+
+        data = bytes(self.buf[self.pos:end.end()])
+        if b'"' in data or b"{" in data:
+            return None
+        self.pos = end.end()
+        return data
+
+#------------------------------------------------------------------------
+#   Decode numeric arrays
+#------------------------------------------------------------------------
+
+def decodeArray(data, kind):
+    flat = data.translate(None, b"[] \t\n\r")
+    if not flat:
+        return json.loads(data)
+    values = parseNumbers(flat)
+    nvals = len(values)
+    width,nrows,ngroups = getRowStructure(data)
+    if width is None or width*nrows != nvals:
+        raise ValueError("Ragged array")
+
+    if kind == FITTING:
+        if width != 3 or nrows != 3*ngroups:
+            raise ValueError("Not a fitting array")
+        return makeArray(values.reshape(ngroups, 3, 3), kind)
+    else:
+        return makeArray(values.reshape(nrows, width), kind)
+
+
+def parseNumbers(flat):
+    """
+    Parse a comma-separated list of json numbers to a float64 array.
+    """
+    if flat.translate(None, b"0123456789+-.eE,"):
+        raise ValueError("Not a numeric array")
+    values = np.array(json.loads(b"[" + flat + b"]"))
+    if values.ndim != 1 or values.dtype.kind not in "iuf":
+        raise ValueError("Not a numeric array")
+    return values.astype(np.float64)
+
+
+def makeArray(values, kind):
+    """
+    Convert a float64 array of rows to the typed array used for kind.
+    """
+    if kind == FITTING:
+        if values.ndim != 3 or values.shape[1:] != (3,3):
+            raise ValueError("Not a fitting array")
+        array = np.empty(len(values), dtype=FittingType)
+        array["vnums"] = values[:,0]
+        array["weights"] = values[:,1]
+        array["offsets"] = values[:,2]
+        return array
+    elif values.ndim != 2:
+        raise ValueError("Not an array of rows")
+    elif kind == COORDS:
+        return values.astype(np.float32)
+    elif kind == INDICES:
+        return values.astype(np.int32)
+    elif kind == PAIRS:
+        if values.shape[1] != 2:
+            raise ValueError("Not a weight array")
+        array = np.empty(len(values), dtype=PairType)
+        array["index"] = values[:,0]
+        array["weight"] = values[:,1]
+        return array
+
+
+def getPairArrays(data):
+    """
+    Return the vertex numbers and weights of a vertex group, given as a
+    PairType array or a sequence of (vn, w) pairs.
+    """
+    if isinstance(data, np.ndarray) and data.dtype.names:
+        return data["index"], data["weight"]
+    pairs = np.array(list(data), dtype=np.float64).reshape(-1,2)
+    return pairs[:,0].astype(np.int32), pairs[:,1]
+
+
+def makePairArray(vnums, weights):
+    array = np.empty(len(vnums), dtype=PairType)
+    array["index"] = vnums
+    array["weight"] = weights
+    return array
+
+
+def getTargetArrays(data):
+    """
+    Return the vertex numbers and deltas of a shape target, given as a
+    TargetType array or a sequence of (vn, delta) pairs.
+    """
+    if isinstance(data, np.ndarray) and data.dtype.names:
+        return data["index"], data["delta"]
+    vnums = np.array([vn for vn,_delta in data], dtype=np.int32)
+    deltas = np.array([delta for _vn,delta in data], dtype=np.float64).reshape(-1,3)
+    return vnums, deltas
+
+
+def makeTargetArray(vnums, deltas):
+    array = np.empty(len(vnums), dtype=TargetType)
+    array["index"] = vnums
+    array["delta"] = deltas
+    return array
+
+
+def getRowStructure(data):
+    """
+    Return the common length of the innermost rows, the number of innermost
+    rows, and the number of closing brackets one level up.
+    """
+    chars = np.frombuffer(data, dtype=np.uint8)
+    brackets = np.flatnonzero((chars == ord("[")) | (chars == ord("]")))
+    isOpen = (chars[brackets] == ord("["))
+    inner = np.flatnonzero(isOpen[:-1] & ~isOpen[1:])
+    if len(inner) == 0:
+        return None,0,0
+    commas = np.flatnonzero(chars == ord(","))
+    lengths = (np.searchsorted(commas, brackets[inner+1]) -
+               np.searchsorted(commas, brackets[inner]) + 1)
+    if (lengths != lengths[0]).any():
+        return None,0,0
+    ngroups = int((~isOpen).sum()) - len(inner) - 1
+    return int(lengths[0]), len(inner), ngroups
+
+#------------------------------------------------------------------------
+#   Array container.
+#   A json header holding the document and an offset table, followed by
+#   raw little-endian array blocks. The blocks are memory-mapped.
+#   The writer is used by the parse cache and matches saveArrayContainer
+#   in the exporter.
+#------------------------------------------------------------------------
+
+ContainerMagic = b"MHX2ARR\0"
+BlockAlign = 16
+
+def isArrayContainer(filepath):
+    with open(filepath, "rb") as fp:
+        return (fp.read(len(ContainerMagic)) == ContainerMagic)
+
+
+def loadArrayContainer(filepath):
+    with open(filepath, "rb") as fp:
+        fp.seek(len(ContainerMagic))
+        hlen, = pystruct.unpack("<Q", fp.read(8))
+        header = json.loads(fp.read(hlen))
+    start = alignSize(len(ContainerMagic) + 8 + hlen)
+
+    table = header["blocks"]
+    if table and os.path.getsize(filepath) > start:
+        raw = np.memmap(filepath, dtype=np.uint8, mode='c', offset=start)
+    else:
+        raw = None
+    blocks = []
+    for entry in table:
+        dtype = getBlockType(entry["dtype"])
+        shape = tuple(entry["shape"])
+        nbytes = dtype.itemsize * int(np.prod(shape))
+        if nbytes == 0:
+            blocks.append(np.zeros(shape, dtype=dtype))
+        else:
+            offset = entry["offset"]
+            blocks.append(raw[offset:offset+nbytes].view(dtype).reshape(shape))
+    return resolveBlocks(header["data"], blocks)
+
+
+def writeArrayContainer(struct, fp):
+    blocks = []
+    data = splitBlocks(struct, blocks, None)
+    table = []
+    offset = 0
+    for block in blocks:
+        if block.dtype.names:
+            dtype = block.dtype.descr
+        else:
+            dtype = block.dtype.str
+        table.append({"offset" : offset, "dtype" : dtype, "shape" : list(block.shape)})
+        offset += alignSize(block.nbytes)
+
+    header = json.dumps({"blocks" : table, "data" : data}).encode("utf-8")
+    fp.write(ContainerMagic)
+    fp.write(pystruct.pack("<Q", len(header)))
+    fp.write(header)
+    fp.write(bytes(alignSize(fp.tell()) - fp.tell()))
+    for block in blocks:
+        block.tofile(fp)
+        fp.write(bytes(alignSize(block.nbytes) - block.nbytes))
+
+
+def alignSize(size):
+    return (size + BlockAlign - 1) // BlockAlign * BlockAlign
+
+
+def splitBlocks(data, blocks, kind):
+    if kind in (COORDS, INDICES, PAIRS, FITTING):
+        if isinstance(data, np.ndarray) and data.dtype.names:
+            block = data
+        else:
+            try:
+                block = makeArray(np.asarray(data, dtype=np.float64), kind)
+            except (ValueError, TypeError):
+                block = None
+        if block is not None and len(block) > 0:
+            blocks.append(np.ascontiguousarray(block))
+            return {"$block" : len(blocks)-1}
+
+    if isinstance(data, dict):
+        if kind == GROUPS:
+            return dict([(key, splitBlocks(value, blocks, PAIRS)) for key,value in data.items()])
+        else:
+            return dict([(key, splitBlocks(value, blocks, ArrayKinds.get(key))) for key,value in data.items()])
+    elif isinstance(data, list):
+        return [splitBlocks(elt, blocks, None) for elt in data]
+    elif isinstance(data, np.ndarray):
+        return data.tolist()
+    else:
+        return data
+
+
+def getBlockType(descr):
+    if isinstance(descr, str):
+        return np.dtype(descr)
+    else:
+        return np.dtype([tuple(field) for field in descr])
+
+
+def resolveBlocks(data, blocks):
+    if isinstance(data, dict):
+        if len(data) == 1 and "$block" in data.keys():
+            return blocks[data["$block"]]
+        for key,value in data.items():
+            data[key] = resolveBlocks(value, blocks)
+    elif isinstance(data, list):
+        for n,elt in enumerate(data):
+            data[n] = resolveBlocks(elt, blocks)
+    return data
+
+#------------------------------------------------------------------------
+#   Compressed files.
+#   Binary files may consist of several independently compressed members.
+#   The member boundaries are found without decompressing: gzip members
+#   written by the exporter carry their size in an "MX" extra subfield,
+#   xz streams are walked backwards from their footers. The members are
+#   then decompressed in parallel. Files with a single member, or where the
+#   boundaries cannot be trusted, are decompressed in one go. bzip2 streams
+#   carry no size, so the stream magic only gives candidate boundaries.
+#   They are decompressed in parallel, and a candidate is accepted only if
+#   the decompressor reaches the end of the stream exactly there.
+#   Otherwise the streams are walked one after the other, each starting
+#   in the unused data of the one before.
+#------------------------------------------------------------------------
+
+CodecModules = {"gzip" : gzip, "lzma" : lzma, "bz2" : bz2}
+
+def getCodec(filepath):
+    with open(filepath, "rb") as fp:
+        magic = fp.read(6)
+    if magic[0:2] == b"\x1f\x8b":
+        return "gzip"
+    elif magic == b"\xfd7zXZ\x00":
+        return "lzma"
+    elif magic[0:3] == b"BZh":
+        return "bz2"
+    else:
+        return None
+
+
+def readCompressed(filepath, codec):
+    with open(filepath, "rb") as fp:
+        data = fp.read()
+    module = CodecModules[codec]
+    if codec == "gzip":
+        members = splitGzipMembers(data)
+    elif codec == "lzma":
+        members = splitXzStreams(data)
+    else:
+        return decompressBz2Streams(data)
+    if members is None or len(members) < 2:
+        return module.decompress(data)
+    try:
+        with ThreadPoolExecutor(os.cpu_count()) as pool:
+            return b"".join(pool.map(module.decompress, members))
+    except (OSError, ValueError, EOFError, zlib.error, lzma.LZMAError):
+        return module.decompress(data)
+
+
+def splitGzipMembers(data):
+    members = []
+    pos = 0
+    while pos < len(data):
+        if data[pos:pos+2] != b"\x1f\x8b" or not data[pos+3] & 4:
+            return None
+        xlen, = pystruct.unpack_from("<H", data, pos+10)
+        extra = pos + 12
+        size = None
+        while extra < pos + 12 + xlen:
+            si, slen = pystruct.unpack_from("<2sH", data, extra)
+            if si == b"MX" and slen == 4:
+                size, = pystruct.unpack_from("<I", data, extra+4)
+            extra += 4 + slen
+        if size is None:
+            return None
+        members.append(data[pos:pos+size])
+        pos += size
+    return members
+
+
+def splitXzStreams(data):
+    members = []
+    pos = len(data)
+    while pos > 0:
+        while pos >= 4 and data[pos-4:pos] == bytes(4):
+            pos -= 4
+        if pos < 24 or data[pos-2:pos] != b"YZ":
+            return None
+        backward, = pystruct.unpack_from("<I", data, pos-8)
+        isize = (backward+1)*4
+        index = pos - 12 - isize
+        if index < 12 or data[index] != 0:
+            return None
+        nrecords,ipos = readVarint(data, index+1)
+        blocks = 0
+        for n in range(nrecords):
+            unpadded,ipos = readVarint(data, ipos)
+            _uncompressed,ipos = readVarint(data, ipos)
+            blocks += (unpadded + 3) // 4 * 4
+        start = index - blocks - 12
+        if start < 0 or data[start:start+6] != b"\xfd7zXZ\x00":
+            return None
+        members.append(data[start:pos])
+        pos = start
+    members.reverse()
+    return members
+
+
+def readVarint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            return value,pos
+
+
+def decompressBz2Streams(data):
+    starts = [match.start() for match in re.finditer(rb"BZh[1-9]1AY&SY", data)]
+    if len(starts) > 1 and starts[0] == 0:
+        starts.append(len(data))
+        members = [data[starts[n]:starts[n+1]] for n in range(len(starts)-1)]
+        with ThreadPoolExecutor(os.cpu_count()) as pool:
+            parts = list(pool.map(decompressBz2Member, members))
+        if None not in parts:
+            return b"".join(parts)
+
+    parts = []
+    while data:
+        decomp = bz2.BZ2Decompressor()
+        parts.append(decomp.decompress(data))
+        if not decomp.eof:
+            raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+        data = decomp.unused_data
+    return b"".join(parts)
+
+
+def decompressBz2Member(member):
+    decomp = bz2.BZ2Decompressor()
+    try:
+        data = decomp.decompress(member)
+    except OSError:
+        return None
+    if decomp.eof and not decomp.unused_data:
+        return data
+    return None
+
+#------------------------------------------------------------------------
+#   Partial loading.
+#   Files written by recent exporters end with a section index, mapping
+#   section paths to byte ranges in the uncompressed text, and a trailer
+#   of fixed size holding the offset of the index. loadJsonSections
+#   reads only the wanted sections and decodes nothing else. Compressed
+#   files written in blocks are only decompressed where the wanted ranges
+#   are. Files without an index are loaded fully and then filtered.
+#------------------------------------------------------------------------
+
+IndexOffsetKey = b',\n    "section_index_offset" : '
+IndexTrailerSize = len(IndexOffsetKey) + 20 + 2
+
+def loadJsonSections(filepath, sections, geometries=None, geometryKeys=None, useStreaming=False):
+    """
+    Load the top-level sections listed in sections. A name like
+    "skeleton.bones" loads only that part of a top-level dict. If
+    geometries is given, it is called with the index entry (name, human,
+    type) of each geometry, and only the geometries for which it returns
+    True are loaded. If geometryKeys is given, only those keys of each
+    geometry are loaded.
+    """
+    if isArrayContainer(filepath):
+        struct = loadArrayContainer(filepath)
+        return selectSections(struct, sections, geometries, geometryKeys)
+
+    reader = RangeReader(filepath)
+    index = reader.getSectionIndex()
+    if index is None:
+        if useStreaming:
+            struct = loadJsonStream(filepath)
+        else:
+            struct = loadJson(filepath)
+        return selectSections(struct, sections, geometries, geometryKeys)
+
+    ranges = index["sections"]
+
+    def decode(path):
+        start,end = ranges[path]
+        data = reader.read(start, end)
+        if useStreaming:
+            key = path.rsplit(".", 1)[-1]
+            if key == "weights":
+                kind = GROUPS
+            else:
+                kind = ArrayKinds.get(key)
+            return JsonStream(io.BytesIO(data)).parse(kind)
+        else:
+            return json.loads(data)
+
+    struct = {}
+    for name in sections:
+        if name == "geometries" and "geometries" in ranges.keys():
+            mhGeos = struct["geometries"] = []
+            for n,info in enumerate(index["geometries"]):
+                if geometries and not geometries(info):
+                    continue
+                path = "geometries.%d" % n
+                if geometryKeys:
+                    mhGeo = {}
+                    for key in geometryKeys:
+                        if "%s.%s" % (path, key) in ranges.keys():
+                            mhGeo[key] = decode("%s.%s" % (path, key))
+                    mhGeos.append(mhGeo)
+                else:
+                    mhGeos.append(decode(path))
+        elif name in ranges.keys():
+            if "." in name:
+                key,child = name.split(".", 1)
+                if key not in struct.keys():
+                    struct[key] = {}
+                struct[key][child] = decode(name)
+            else:
+                struct[name] = decode(name)
+    return struct
+
+
+def selectSections(struct, sections, geometries=None, geometryKeys=None):
+    selected = {}
+    for name in sections:
+        if name == "geometries" and "geometries" in struct.keys():
+            mhGeos = selected["geometries"] = []
+            for mhGeo in struct["geometries"]:
+                if geometries and not geometries(getGeometryInfo(mhGeo)):
+                    continue
+                if geometryKeys:
+                    mhGeo = dict([(key, mhGeo[key]) for key in geometryKeys if key in mhGeo.keys()])
+                mhGeos.append(mhGeo)
+        elif "." in name:
+            key,child = name.split(".", 1)
+            if key in struct.keys() and child in struct[key].keys():
+                if key not in selected.keys():
+                    selected[key] = {}
+                selected[key][child] = struct[key][child]
+        elif name in struct.keys():
+            selected[name] = struct[name]
+    return selected
+
+
+def getGeometryInfo(mhGeo):
+    info = {"name" : mhGeo.get("name"), "human" : bool(mhGeo.get("human", False)), "type" : None}
+    if "proxy" in mhGeo.keys():
+        info["type"] = mhGeo["proxy"].get("type")
+    return info
+
+
+class RangeReader:
+    """
+    Read byte ranges of the uncompressed text of an .mhx2 file. Plain files
+    are read directly and gzip files written in blocks member by member.
+    Other compressed files are decompressed once and sliced.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.codec = getCodec(filepath)
+        self.data = None
+        self.members = None
+        if self.codec is None:
+            self.size = os.path.getsize(filepath)
+            return
+        if self.codec == "gzip":
+            self.members = getGzipMemberTable(filepath)
+        if self.members:
+            self.starts = [member[0] for member in self.members]
+            start,_offset,_csize,usize = self.members[-1]
+            self.size = start + usize
+        else:
+            self.data = readCompressed(filepath, self.codec)
+            self.size = len(self.data)
+
+
+    def read(self, start, end):
+        start = max(start, 0)
+        end = min(end, self.size)
+        if self.data is not None:
+            return self.data[start:end]
+        with open(self.filepath, "rb") as fp:
+            if self.members is None:
+                fp.seek(start)
+                return fp.read(end-start)
+            first = bisect.bisect_right(self.starts, start) - 1
+            last = bisect.bisect_left(self.starts, end)
+            parts = []
+            for _start,offset,csize,_usize in self.members[first:last]:
+                fp.seek(offset)
+                parts.append(gzip.decompress(fp.read(csize)))
+            data = b"".join(parts)
+            base = self.members[first][0]
+            return data[start-base:end-base]
+
+
+    def getSectionIndex(self):
+        first = max(self.size - IndexTrailerSize - 8, 0)
+        tail = self.read(first, self.size).rstrip()
+        pos = tail.rfind(IndexOffsetKey)
+        if pos < 0 or not tail.endswith(b"}"):
+            return None
+        try:
+            start = int(tail[pos+len(IndexOffsetKey):-1])
+            return json.loads(self.read(start, first+pos))
+        except ValueError:
+            return None
+
+
+def getGzipMemberTable(filepath):
+    """
+    Return (uncompressed start, file offset, compressed size, uncompressed
+    size) for each member of a gzip file written in blocks, or None for other gzip files.
+    """
+    members = []
+    start = 0
+    offset = 0
+    size = os.path.getsize(filepath)
+    with open(filepath, "rb") as fp:
+        while offset < size:
+            fp.seek(offset)
+            header = fp.read(12)
+            if len(header) < 12 or header[0:2] != b"\x1f\x8b" or not header[3] & 4:
+                return None
+            xlen, = pystruct.unpack_from("<H", header, 10)
+            extra = fp.read(xlen)
+            csize = None
+            pos = 0
+            while pos + 4 <= xlen:
+                si, slen = pystruct.unpack_from("<2sH", extra, pos)
+                if si == b"MX" and slen == 4:
+                    csize, = pystruct.unpack_from("<I", extra, pos+4)
+                pos += 4 + slen
+            if csize is None:
+                return None
+            fp.seek(offset + csize - 4)
+            usize, = pystruct.unpack("<I", fp.read(4))
+            members.append((start, offset, csize, usize))
+            start += usize
+            offset += csize
+    return members
+
+#------------------------------------------------------------------------
+#   Quantised arrays.
+#   Exporters may store vertices and UV coordinates as base64 encoded
+#   unsigned integers q with a per-column scale and offset. They decode
+#   to q*scale + offset, which is within scale/2 of the exported value,
+#   rounded to float32 like the coordinates of the other loaders.
+#------------------------------------------------------------------------
+
+QuantTypes = {16 : np.dtype("<u2"), 32 : np.dtype("<u4")}
+QuantisedMeshes = ["mesh", "seed_mesh", "proxy_seed_mesh"]
+QuantisedArrays = ["vertices", "uv_coordinates"]
+
+def isQuantised(data):
+    return isinstance(data, dict) and "quantised" in data.keys()
+
+
+def decodeQuantised(data):
+    dtype = QuantTypes[data["quantised"]]
+    quant = np.frombuffer(base64.b64decode(data["data"]), dtype=dtype)
+    quant = quant.reshape(data["shape"])
+    scale = np.array([float(x) for x in data["scale"]])
+    offset = np.array([float(x) for x in data["offset"]])
+    return (quant*scale + offset).astype(np.float32)
+
 
+def dequantiseMeshes(struct):
+    if "geometries" not in struct.keys():
+        return
+    for mhGeo in struct["geometries"]:
+        for mkey in QuantisedMeshes:
+            if mkey not in mhGeo.keys():
+                continue
+            mhMesh = mhGeo[mkey]
+            for key in QuantisedArrays:
+                if key in mhMesh.keys() and isQuantised(mhMesh[key]):
+                    mhMesh[key] = decodeQuantised(mhMesh[key])
@@ -20,8 +20,10 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
+import numpy as np
 from .utils import *
 from .hm8 import *
+from .topology import getFaceLoops, getMeshTopology
 
 #------------------------------------------------------------------------
 #   Masking
@@ -70,7 +72,9 @@ def selectMaskVGroups(ob):
     if not ob:
         return
 
+    from .geometries import getVertexGroupArrays, selectVertexGroup
     delMods = []
+    vgrps = None
     for mod in ob.modifiers:
         if mod.type == 'MASK':
             delMods.append(mod)
@@ -78,12 +82,11 @@ def selectMaskVGroups(ob):
                 vgrp = ob.vertex_groups[mod.vertex_group]
             except KeyError:
                 vgrp = None
-                print("Did not find vertex group %s" % grpname)
+                print("Did not find vertex group %s" % mod.vertex_group)
             if vgrp:
-                for v in ob.data.vertices:
-                    for g in v.groups:
-                        if g.group == vgrp.index:
-                            v.select = True
+                if vgrps is None:
+                    vgrps = getVertexGroupArrays(ob)
+                selectVertexGroup(ob, vgrp, vgrps)
                 ob.vertex_groups.remove(vgrp)
     for mod in delMods:
         ob.modifiers.remove(mod)
@@ -102,55 +105,60 @@ def getDeleteVerts(mhHuman, mhProxy, useConservativeMasks):
         return vnums
 
     mhMesh = mhHuman["seed_mesh"]
-    nVerts = len(mhMesh["vertices"])
-    nFaces = len(mhMesh["faces"])
-    vertsFaces = dict([(vn, []) for vn in range(nVerts)])
-    facesVerts = {}
-    for fn,f in enumerate(mhMesh["faces"]):
-        facesVerts[fn] = f
-        for vn in f:
-            vertsFaces[vn].append(fn)
-
-    nFaceVerts = dict([(fn,0) for fn in range(nFaces)])
-    for vn in vnums:
-        for fn in vertsFaces[vn]:
-            nFaceVerts[fn] += 1
-
-    delVerts = dict([(vn,True) for vn in range(nVerts)])
-    for fn,ndel in nFaceVerts.items():
-        if ndel <= 2:
-            for vn in facesVerts[fn]:
-                delVerts[vn] = False
-
-    vnums = [vn for vn,delete in delVerts.items() if delete]
-    return vnums
+    topo = getMeshTopology(mhMesh["faces"])
+    nVerts = max(len(mhMesh["vertices"]), topo.nverts)
+    deleted = np.zeros(nVerts, dtype=bool)
+    deleted[vnums] = True
+
+    # Keep the vertices of faces with at most two deleted vertices.
+    nFaceVerts = topo.countFaceVerts(deleted)
+    keepLoops = (nFaceVerts <= 2)[topo.loopFaces]
+    delVerts = np.ones(nVerts, dtype=bool)
+    delVerts[topo.faceVerts.values[keepLoops]] = False
+    return np.flatnonzero(delVerts[:len(mhMesh["vertices"])]).tolist()
 
 # ---------------------------------------------------------------------
 #   Proxify masks
 # ---------------------------------------------------------------------
 
 def proxifyMask(mhProxy, mhMesh, vnums):
-    from .proxy import proxifyVertexGroups
-
-    vgrps = { "Mask" : [(vn,1.0) for vn in vnums] }
-    mhHuman = {
-        "seed_mesh" : {
-            "weights" : vgrps
-        }
-    }
-    ngrps = proxifyVertexGroups(mhProxy, mhHuman)
-
-    if "Mask" in ngrps.keys():
-        nverts = len(mhMesh["vertices"])
-        vmask = dict([(vn,0) for vn in range(nverts)])
-        for vn,w in ngrps["Mask"]:
-            vmask[vn] = w
-        vclear = dict([(vn,False) for vn in range(nverts)])
-        for f in mhMesh["faces"]:
-            if vmask[f[0]]*vmask[f[1]]*vmask[f[2]]*vmask[f[3]] < 0.5:
-                vclear[f[0]] = vclear[f[1]] = vclear[f[2]] = vclear[f[3]] = True
-        pvnums = [vn for vn,test in vclear.items() if not test]
-        pvnums.sort()
-    else:
-        pvnums = []
-    return pvnums
+    """
+    Return the proxy vertices that are masked, i.e. all vertices except
+    those of faces where the product of the transferred mask is below 0.5.
+    """
+    from .proxy import getFittingMatrix, MinProxyWeight
+
+    matrix = getFittingMatrix(mhProxy)
+    mask = np.zeros(matrix.ncols, dtype=np.float64)
+    mask[np.asarray(vnums, dtype=np.int32)] = 1.0
+    weights = matrix.transferValues(mask)
+    weights[weights <= MinProxyWeight] = 0.0
+    if not weights.any():
+        return []
+
+    # The extra last vertex has weight 1 and pads short faces.
+    nverts = len(mhMesh["vertices"])
+    vmask = np.zeros(nverts+1, dtype=np.float64)
+    nfit = min(nverts, len(weights))
+    vmask[:nfit] = weights[:nfit]
+    vmask[nverts] = 1.0
+    faces = getPaddedFaces(mhMesh["faces"], nverts)
+    cleared = faces[np.prod(vmask[faces], axis=1) < 0.5]
+    vclear = np.zeros(nverts+1, dtype=bool)
+    vclear[cleared.reshape(-1)] = True
+    return np.flatnonzero(~vclear[:nverts]).tolist()
+
+
+def getPaddedFaces(faces, pad):
+    """
+    Return the faces as an array with one row per face, with short faces
+    padded with the index pad.
+    """
+    if isinstance(faces, np.ndarray) and faces.ndim == 2:
+        return faces
+    loopVerts,loopStarts,loopTotals = getFaceLoops(faces)
+    width = int(loopTotals.max()) if len(loopTotals) else 0
+    padded = np.full((len(loopTotals), width), pad, dtype=np.int32)
+    cols = np.arange(len(loopVerts)) - np.repeat(loopStarts, loopTotals)
+    padded[np.repeat(np.arange(len(loopTotals)), loopTotals), cols] = loopVerts
+    return padded
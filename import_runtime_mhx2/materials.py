@@ -302,7 +302,7 @@ def setTransparent(mat, scn):
 def loadImage(filepath, cfg, color_space=None):
     abspath = os.path.join(cfg.folder, filepath)
     try:
-        img = bpy.data.images.load(abspath)
+        img = bpy.data.images.load(abspath, check_existing=cfg.useSharedImages)
     except RuntimeError:
         print("Unable to load \"%s\"" % abspath)
         return None
@@ -22,17 +22,19 @@
 
 import os
 import bpy
+import numpy as np
 from .error import *
 from .utils import *
+from .profiler import setMode, callOperator
 
 #------------------------------------------------------------------------
 #
 #------------------------------------------------------------------------
 
 def deleteHiddenVerts(human, clo):
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='DESELECT')
-    bpy.ops.object.mode_set(mode='OBJECT')
+    setMode('EDIT')
+    callOperator(bpy.ops.mesh.select_all, action='DESELECT')
+    setMode('OBJECT')
 
     grpname = getDeleteName(clo)
     try:
@@ -41,14 +43,12 @@ def deleteHiddenVerts(human, clo):
         print("Did not find vertex group %s" % grpname)
         return
 
-    for v in human.data.vertices:
-        for g in v.groups:
-            if g.group == vgrp.index:
-                v.select = True
+    from .geometries import selectVertexGroup
+    selectVertexGroup(human, vgrp)
 
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.delete(type='VERT')
-    bpy.ops.object.mode_set(mode='OBJECT')
+    setMode('EDIT')
+    callOperator(bpy.ops.mesh.delete, type='VERT')
+    setMode('OBJECT')
     human.vertex_groups.remove(vgrp)
 
 
@@ -82,30 +82,17 @@ def mergeSelectedObjects(context):
 
 
 def selectBoundaries(ob):
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='DESELECT')
-    bpy.ops.object.mode_set(mode='OBJECT')
-
-    vertpairs = dict([(vn,[]) for vn in range(len(ob.data.vertices))])
-    for f in ob.data.polygons:
-        for vn1,vn2 in f.edge_keys:
-            vertpairs[vn1].append(vn2)
-
-    select = []
-    for vn,vlist in vertpairs.items():
-        vlist.sort()
-        while vlist:
-            if len(vlist) == 1:
-                select += [vn, vlist[0]]
-                vlist = []
-            elif vlist[0] == vlist[1]:
-                vlist = vlist[2:]
-            else:
-                select += [vn, vlist[0]]
-                vlist = vlist[1:]
+    setMode('EDIT')
+    callOperator(bpy.ops.mesh.select_all, action='DESELECT')
+    setMode('OBJECT')
 
-    for vn in select:
-        ob.data.vertices[vn].select = True
+    # Select the edges used by an odd number of faces.
+    from .topology import getObjectTopology
+    topo = getObjectTopology(ob.data)
+    edges = topo.edges[topo.edgeValence % 2 == 1]
+    select = np.zeros(len(ob.data.vertices), dtype=bool)
+    select[edges.reshape(-1)] = True
+    ob.data.vertices.foreach_set("select", select)
 
 
 def mergeObjects(human, clothes):
@@ -133,11 +120,11 @@ def mergeObjects(human, clothes):
         #renameShapekeys(clo)
 
     firstCloVert = len(human.data.vertices)
-    bpy.ops.object.join()
+    callOperator(bpy.ops.object.join)
     selectBoundaries(human)
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.remove_doubles(threshold=1e-3*human.MhxScale)
-    bpy.ops.object.mode_set(mode='OBJECT')
+    setMode('EDIT')
+    callOperator(bpy.ops.mesh.remove_doubles, threshold=1e-3*human.MhxScale)
+    setMode('OBJECT')
     lastCloVert = len(human.data.vertices)
 
     for vgrp in human.vertex_groups:
@@ -154,10 +141,10 @@ def mergeObjects(human, clothes):
 
 
 def changeMaterial(human, mn):
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_mode(use_extend=False, use_expand=False, type='FACE')
-    bpy.ops.mesh.select_all(action='DESELECT')
-    bpy.ops.object.mode_set(mode='OBJECT')
+    setMode('EDIT')
+    callOperator(bpy.ops.mesh.select_mode, use_extend=False, use_expand=False, type='FACE')
+    callOperator(bpy.ops.mesh.select_all, action='DESELECT')
+    setMode('OBJECT')
 
     uvfaces = {}
     n = 0
@@ -171,10 +158,10 @@ def changeMaterial(human, mn):
         n += nverts
 
     human.data.uv_textures.active_index = 0
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.uv_texture_remove()
-    bpy.ops.uv.unwrap(method='ANGLE_BASED', margin=0.001)
-    bpy.ops.object.mode_set(mode='OBJECT')
+    setMode('EDIT')
+    callOperator(bpy.ops.mesh.uv_texture_remove)
+    callOperator(bpy.ops.uv.unwrap, method='ANGLE_BASED', margin=0.001)
+    setMode('OBJECT')
 
     uvlayer = human.data.uv_layers[0]
     n = 0
@@ -187,9 +174,9 @@ def changeMaterial(human, mn):
                 uvlayer.data[n+k].uv = uvs[k]
         n += nverts
 
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.object.mode_set(mode='OBJECT')
+    setMode('EDIT')
+    callOperator(bpy.ops.mesh.select_all, action='SELECT')
+    setMode('OBJECT')
 
 
 def mergeBodyParts(human, proxies, context, proxyTypes=[]):
@@ -199,8 +186,8 @@ def mergeBodyParts(human, proxies, context, proxyTypes=[]):
         if mhGeo["proxy"]["type"] in proxyTypes:
             clothes.append(ob)
             setSelected(ob, True)
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.object.mode_set(mode='OBJECT')
+    setMode('EDIT')
+    setMode('OBJECT')
     matnums = mergeObjects(human, clothes)
     for mn in matnums:
         changeMaterial(human, mn)
@@ -0,0 +1,164 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  Authors:             Thomas Larsson
+#  Script Copyright (C) Thomas Larsson 2014 - 2020
+#  Script Copyright (C) MakeHuman Community 2020
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import bpy
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+#------------------------------------------------------------------------
+#   Import profiler.
+#   Records wall time, peak traced memory, the number of object mode
+#   switches and the number of operator calls for each phase of an import.
+#   Phases can be nested, e.g. one phase per geometry inside the geometry
+#   phase. A disabled profiler only runs the phases. The import code
+#   switches modes with setMode and calls other operators with
+#   callOperator, which count them in the running profiler, if any. Mode
+#   switches are operator calls too.
+#------------------------------------------------------------------------
+
+theProfiler = None
+
+def setMode(mode):
+    if theProfiler:
+        theProfiler.modeSets += 1
+    callOperator(bpy.ops.object.mode_set, mode=mode)
+
+
+def callOperator(op, **kwargs):
+    if theProfiler:
+        theProfiler.operators += 1
+    return op(**kwargs)
+
+
+class ImportProfiler:
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.phases = []
+        self.stack = []
+        self.modeSets = 0
+        self.operators = 0
+        self.ownTracing = False
+        self.time0 = 0
+        self.total = 0.0
+
+
+    def start(self):
+        global theProfiler
+        if not self.enabled:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.ownTracing = True
+        theProfiler = self
+        self.time0 = time.perf_counter()
+
+
+    def stop(self):
+        global theProfiler
+        if not self.enabled:
+            return
+        self.total = time.perf_counter() - self.time0
+        if theProfiler is self:
+            theProfiler = None
+        if self.ownTracing:
+            tracemalloc.stop()
+            self.ownTracing = False
+
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        current,_peak = tracemalloc.get_traced_memory()
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        record = {
+            "name" : name,
+            "time" : 0.0,
+            "peak_mb" : 0.0,
+            "mode_sets" : 0,
+            "operators" : 0,
+            "children" : [],
+        }
+        if self.stack:
+            self.stack[-1][0]["children"].append(record)
+        else:
+            self.phases.append(record)
+        self.stack.append((record, current, self.modeSets, self.operators))
+        time1 = time.perf_counter()
+        try:
+            yield
+        finally:
+            record,current,modeSets,operators = self.stack.pop()
+            record["time"] = time.perf_counter() - time1
+            record["mode_sets"] = self.modeSets - modeSets
+            record["operators"] = self.operators - operators
+            _current,peak = tracemalloc.get_traced_memory()
+            peak = max([(peak - current)/1e6] + [child["peak_mb"] for child in record["children"]])
+            record["peak_mb"] = peak
+            if self.stack:
+                # Children reset the peak, so pass it on to the parent.
+                parent = self.stack[-1][0]
+                parent["peak_mb"] = max(parent["peak_mb"], peak)
+
+
+    def getReport(self, filepath=""):
+        return {
+            "file" : filepath,
+            "time" : self.total,
+            "mode_sets" : self.modeSets,
+            "operators" : self.operators,
+            "phases" : self.phases,
+        }
+
+
+    def printReport(self):
+        print("Import profile:")
+        for record in self.phases:
+            printRecord(record, "  ")
+        print("  Total: %.3f s, %d mode switches, %d operators" %
+              (self.total, self.modeSets, self.operators))
+
+
+def printRecord(record, pad):
+    print("%s%-30s %8.3f s %8.1f MB %4d mode switches %4d operators" %
+          (pad, record["name"], record["time"], record["peak_mb"], record["mode_sets"],
+           record["operators"]))
+    for child in record["children"]:
+        printRecord(child, pad+"  ")
+
+
+def saveProfile(scn, report):
+    scn.MhxImportProfile = json.dumps(report)
+
+
+def getProfile(scn):
+    if not scn.MhxImportProfile:
+        return None
+    try:
+        return json.loads(scn.MhxImportProfile)
+    except ValueError:
+        return None
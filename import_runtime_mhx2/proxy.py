@@ -21,6 +21,8 @@
 # ##### END GPL LICENSE BLOCK #####
 
 import bpy
+import hashlib
+from collections import OrderedDict
 from mathutils import Vector
 from .error import *
 from .utils import *
@@ -36,10 +38,10 @@ else:
 # ---------------------------------------------------------------------
 
 def addProxy(filepath, mhHuman, mats, context, cfg):
-    from .load_json import loadJsonRelative
+    from .load_json import loadJsonRelative, copyOnWrite
     from .materials import getMaterial, buildMaterial
 
-    mhGeo = loadJsonRelative(filepath)
+    mhGeo = copyOnWrite(loadJsonRelative(filepath))
     mhProxy = mhGeo["proxy"]
     pxyGeo = mhGeo
     pxyGeo["human"] = False
@@ -63,15 +65,23 @@ def addProxy(filepath, mhHuman, mats, context, cfg):
 def fitProxy(mhHuman, mhFitting, mhScale):
     from .shapekeys import getScales
     scales = getScales(None, mhScale, mhHuman)
-    scale = mhHuman["scale"]
-    hverts = [scale*Vector(co) for co in mhHuman["seed_mesh"]["vertices"]]
-    pverts = []
-    for vnums,weights,offset in mhFitting:
-        pco = (weights[0]*hverts[vnums[0]] +
-               weights[1]*hverts[vnums[1]] +
-               weights[2]*hverts[vnums[2]])
-        pverts.append(Vector([pco[n]+scales[n]*offset[n] for n in range(3)]))
-    return pverts,scales
+    hverts = transformCoords(mhHuman["seed_mesh"]["vertices"], mhHuman["scale"], useZup=False)
+    vnums,weights,offsets = getFittingArrays(mhFitting)
+    weights = weights.astype(np.float32)
+    pcos = (hverts[vnums[:,0]]*weights[:,0,None] +
+            hverts[vnums[:,1]]*weights[:,1,None] +
+            hverts[vnums[:,2]]*weights[:,2,None])
+    # The offsets are added in double precision, as by the Vector code.
+    pverts = pcos + np.array(scales, dtype=np.float32).astype(np.float64)*offsets
+    return pverts.astype(np.float32),scales
+
+
+def getFittingArrays(mhFitting):
+    if isinstance(mhFitting, np.ndarray) and mhFitting.dtype.names:
+        return (mhFitting["vnums"], mhFitting["weights"].astype(np.float64),
+                mhFitting["offsets"].astype(np.float64))
+    fitting = np.asarray(mhFitting, dtype=np.float64).reshape(-1,3,3)
+    return fitting[:,0].astype(np.int32), fitting[:,1], fitting[:,2]
 
 # ---------------------------------------------------------------------
 #   Vertex groups
@@ -97,36 +107,178 @@ def proxifyVertexGroups(mhProxy, mhHuman, parser=None):
         else:
             return {}
 
-    mhFitting = mhProxy["fitting"]
-    ngrps = {}
-    for gname,ogrp in vgrps.items():
-        grp0 = dict([(vn,0.0) for vn in range(NTotalVerts)])
-        for vn,w in ogrp:
-            grp0[vn] = w
-
-        grp1 = []
-        for pvn,pdata in enumerate(mhFitting):
-            vnums,weights,_offsets = pdata
-            grp1 += [(pvn, weights[n]*grp0[vn]) for n,vn in enumerate(vnums)]
-        grp1.sort()
-
-        ngrp = []
-        if len(grp1) > 0:
-            vn0 = grp1[0][0]
-            wsum = 0.0
-            for vn,w in grp1:
-                if vn == vn0:
-                    wsum += w
-                else:
-                    if wsum > 1e-4:
-                        ngrp.append((vn0,wsum))
-                    vn0 = vn
-                    wsum = w
-            if wsum > 1e-4:
-                ngrp.append((vn0,wsum))
-            if len(ngrp) > 0:
-                ngrps[gname] = ngrp
-    return ngrps
+    return getFittingMatrix(mhProxy).transferGroups(vgrps)
+
+# ---------------------------------------------------------------------
+#   Sparse fitting matrix.
+#   Each proxy vertex is a weighted sum of three human vertices, so the
+#   fitting is a sparse P x N matrix with three entries per row. Vertex
+#   groups are transferred all at once by multiplying it with the N x G
+#   matrix of group weights. The product is done with scipy.sparse if it
+#   is available, and with numpy otherwise. Matrices are cached by a hash
+#   of the fitting data, so edited proxies with the same uuid do not share
+#   a matrix. Only the MaxFittingMatrices most recently used are kept.
+# ---------------------------------------------------------------------
+
+try:
+    import scipy.sparse
+except ImportError:
+    scipy = None
+
+MinProxyWeight = 1e-4
+
+MaxFittingMatrices = 8
+
+theFittingMatrices = OrderedDict()
+
+def getFittingMatrix(*mhProxies):
+    """
+    Return the fitting matrix of one proxy, or of several proxies stacked
+    in the given order.
+    """
+    arrays = [getFittingArrays(mhProxy["fitting"]) for mhProxy in mhProxies]
+    key = getFittingKey(arrays)
+    if key in theFittingMatrices.keys():
+        theFittingMatrices.move_to_end(key)
+        return theFittingMatrices[key]
+    vnums = np.concatenate([array[0] for array in arrays]).reshape(-1,3)
+    weights = np.concatenate([array[1] for array in arrays]).reshape(-1,3)
+    matrix = FittingMatrix(vnums, weights)
+    theFittingMatrices[key] = matrix
+    while len(theFittingMatrices) > MaxFittingMatrices:
+        theFittingMatrices.popitem(last=False)
+    return matrix
+
+
+def getFittingKey(arrays):
+    sha = hashlib.sha1()
+    for vnums,weights,offsets in arrays:
+        sha.update(b"%d;" % len(vnums))
+        sha.update(np.ascontiguousarray(vnums, dtype="<i4").tobytes())
+        sha.update(np.ascontiguousarray(weights, dtype="<f8").tobytes())
+        sha.update(np.ascontiguousarray(offsets, dtype="<f8").tobytes())
+    return sha.hexdigest()
+
+
+def clearFittingMatrices():
+    theFittingMatrices.clear()
+
+
+class FittingMatrix:
+
+    def __init__(self, vnums, weights):
+        self.vnums = vnums
+        self.weights = weights
+        self.nrows = len(vnums)
+        self.ncols = max(NTotalVerts, int(vnums.max())+1 if self.nrows else 0)
+        rows = np.repeat(np.arange(self.nrows, dtype=np.int32), 3)
+        cols = vnums.reshape(-1).astype(np.int32)
+        values = weights.reshape(-1).astype(np.float64)
+        if scipy:
+            self.matrix = scipy.sparse.csr_matrix((values, (rows, cols)), shape=(self.nrows, self.ncols))
+        else:
+            # Entries sorted by human vertex, i.e. the CSR form of the transpose.
+            order = np.argsort(cols, kind="stable")
+            self.rows = rows[order]
+            self.values = values[order]
+            self.starts = np.searchsorted(cols[order], np.arange(self.ncols+1))
+
+
+    def transferValues(self, values):
+        """
+        Return the product with a vector of values at the human vertices.
+        Each row has three terms, which are added in increasing order like
+        the old pair list code did, so results on thresholds are unchanged.
+        """
+        terms = self.weights * np.asarray(values, dtype=np.float64)[self.vnums]
+        terms.sort(axis=1)
+        return (terms[:,0] + terms[:,1]) + terms[:,2]
+
+
+    def transferGroups(self, vgrps):
+        """
+        Return the proxy vertex groups as PairType arrays, sorted by vertex
+        and without weights below MinProxyWeight.
+        """
+        from .load_json import getPairArrays, makePairArray
+        gnames = []
+        gvnums = []
+        gweights = []
+        for gname,data in vgrps.items():
+            vnums,weights = getPairArrays(data)
+            # A repeated vertex keeps its last weight.
+            vnums,last = np.unique(vnums[::-1], return_index=True)
+            gnames.append(gname)
+            gvnums.append(vnums)
+            gweights.append(np.asarray(weights, dtype=np.float64)[::-1][last])
+        if not gnames:
+            return {}
+        counts = [len(vnums) for vnums in gvnums]
+        gidxs = np.repeat(np.arange(len(gnames)), counts)
+        gvnums = np.concatenate(gvnums)
+        gweights = np.concatenate(gweights)
+        valid = (gvnums < self.ncols)
+        gidxs,pvnums,pweights = self.multiply(gidxs[valid], gvnums[valid], gweights[valid], len(gnames))
+
+        keep = (pweights > MinProxyWeight)
+        gidxs = gidxs[keep]
+        pvnums = pvnums[keep]
+        pweights = pweights[keep]
+        bounds = np.searchsorted(gidxs, np.arange(len(gnames)+1))
+        ngrps = {}
+        for n,gname in enumerate(gnames):
+            first,last = bounds[n],bounds[n+1]
+            if last > first:
+                ngrps[gname] = makePairArray(pvnums[first:last], pweights[first:last])
+        return ngrps
+
+
+    def transferTargets(self, targets):
+        """
+        Return the target names and a P x T x 3 array with the deltas of
+        all targets at all proxy vertices. The three components of each
+        target are transferred as three columns.
+        """
+        from .load_json import getTargetArrays
+        tnames = []
+        gidxs = []
+        gvnums = []
+        gdeltas = []
+        for tname,data in targets.items():
+            vnums,deltas = getTargetArrays(data)
+            vnums,last = np.unique(vnums[::-1], return_index=True)
+            deltas = np.asarray(deltas, dtype=np.float64)[::-1][last]
+            valid = (vnums < self.ncols)
+            n = len(tnames)
+            tnames.append(tname)
+            gidxs.append(np.repeat([3*n, 3*n+1, 3*n+2], valid.sum()))
+            gvnums.append(np.tile(vnums[valid], 3))
+            gdeltas.append(deltas[valid].T.reshape(-1))
+        result = np.zeros((self.nrows, 3*len(tnames)), dtype=np.float32)
+        if tnames:
+            cols,rows,values = self.multiply(np.concatenate(gidxs), np.concatenate(gvnums),
+                                             np.concatenate(gdeltas), 3*len(tnames))
+            result[rows,cols] = values
+        return tnames, result.reshape(self.nrows, len(tnames), 3)
+
+
+    def multiply(self, gidxs, gvnums, gweights, ngroups):
+        """
+        Multiply with the sparse N x G matrix given by its entries, and
+        return the entries of the product sorted by group and proxy vertex.
+        """
+        if scipy:
+            groups = scipy.sparse.csr_matrix((gweights, (gvnums, gidxs)), shape=(self.ncols, ngroups))
+            product = (self.matrix @ groups).tocoo()
+            order = np.lexsort((product.row, product.col))
+            return product.col[order], product.row[order], product.data[order]
+
+        counts = self.starts[gvnums+1] - self.starts[gvnums]
+        entries = np.repeat(self.starts[gvnums] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        keys = np.repeat(gidxs.astype(np.int64), counts)*self.nrows + self.rows[entries]
+        keys,inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse.reshape(-1), weights=self.values[entries]*np.repeat(gweights, counts))
+        return keys // self.nrows, keys % self.nrows, sums
 
 # ---------------------------------------------------------------------
 #   For proxies with own bone weights
@@ -247,35 +399,28 @@ MHBones = {
 # ---------------------------------------------------------------------
 
 def proxifyTargets(mhProxy, targets):
-    mhFitting = mhProxy["fitting"]
-    ntrgs = {}
-    for tname,otrg in targets.items():
-        trg0 = dict([(vn,Vector()) for vn in range(NTotalVerts)])
-        for vn,delta in otrg:
-            trg0[vn] = Vector(delta)
-
-        trg1 = []
-        for pvn,pdata in enumerate(mhFitting):
-            vnums,weights,_offsets = pdata
-            trg1 += [(pvn, weights[n]*trg0[vn]) for n,vn in enumerate(vnums)]
-        trg1.sort()
-
-        ntrg = []
-        if len(trg1) > 0:
-            vn0 = trg1[0][0]
-            dsum = Vector()
-            for vn,delta in trg1:
-                if vn == vn0:
-                    dsum += delta
-                else:
-                    if dsum.length > 1e-3:
-                        ntrg.append((vn0,dsum))
-                    vn0 = vn
-                    dsum = delta
-            if dsum > 1e-4:
-                ntrg.append((vn0,dsum))
-            if len(ntrg) > 0:
-                ntrgs[tname] = ntrg
+    return proxifyAllTargets([mhProxy], targets)[0]
+
+
+def proxifyAllTargets(mhProxies, targets):
+    """
+    Transfer shape targets to several proxies in one pass. Returns one dict
+    of TargetType arrays per proxy, without deltas of length 1e-3 or less.
+    """
+    from .load_json import makeTargetArray
+    tnames,deltas = getFittingMatrix(*mhProxies).transferTargets(targets)
+    lengths = np.sqrt(np.sum(deltas*deltas, axis=2))
+    ntrgs = []
+    first = 0
+    for mhProxy in mhProxies:
+        last = first + len(mhProxy["fitting"])
+        ntrg = {}
+        for n,tname in enumerate(tnames):
+            pvnums = np.flatnonzero(lengths[first:last,n] > 1e-3)
+            if len(pvnums) > 0:
+                ntrg[tname] = makeTargetArray(pvnums, deltas[first+pvnums,n])
+        ntrgs.append(ntrg)
+        first = last
     return ntrgs
 
 # ---------------------------------------------------------------------
@@ -283,18 +428,18 @@ def proxifyTargets(mhProxy, targets):
 # ---------------------------------------------------------------------
 
 def getProxyCoordinates(mhHuman, filepath):
-    from .load_json import loadJson
+    from .load_json import loadAsset
 
-    mhGeo = loadJson(filepath)
+    mhGeo = loadAsset(filepath)
 
     if isHairStruct(mhGeo):
         from .hair import getHairCoords
         return getHairCoords(mhHuman, mhGeo)
     else:
-        offset = Vector(zup(mhHuman["offset"]))
+        offset = zup(mhHuman["offset"])
         mhProxy = mhGeo["proxy"]
         pverts,scales = fitProxy(mhHuman, mhProxy["fitting"], mhProxy["bounding_box"])
-        coords = [Vector(zup(v)) + offset for v in pverts]
+        coords = transformCoords(pverts, offset=offset)
         return mhGeo,coords,scales
 
 
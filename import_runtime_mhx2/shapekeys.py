@@ -22,10 +22,10 @@
 
 import os
 import bpy
+import numpy as np
 from mathutils import Vector
 
 from .drivers import *
-from .utils import zup2
 if bpy.app.version < (2,80,0):
     from .buttons27 import FilenameString
 else:
@@ -37,7 +37,7 @@ else:
 
 def addShapeKeys(human, filename, mhHuman, proxies=[], proxyTypes=[]):
     from .load_json import loadJsonRelative
-    from .proxy import proxifyTargets
+    from .proxy import proxifyAllTargets
 
     print("Setting up shapekeys")
     struct = loadJsonRelative(filename)
@@ -48,34 +48,44 @@ def addShapeKeys(human, filename, mhHuman, proxies=[], proxyTypes=[]):
         if human.parent and human.parent.type == 'ARMATURE':
             human.parent.MhxHasFaceShapes = True
 
-    for mhGeo,ob in proxies:
-        mhProxy = mhGeo["proxy"]
-        if mhProxy["type"] in proxyTypes:
-            ptargets = proxifyTargets(mhProxy, struct["targets"])
-            addTargets(ob, ptargets, scales)
+    proxies = [(mhGeo,ob) for mhGeo,ob in proxies if mhGeo["proxy"]["type"] in proxyTypes]
+    if proxies:
+        mhProxies = [mhGeo["proxy"] for mhGeo,_ob in proxies]
+        ptargets = proxifyAllTargets(mhProxies, struct["targets"])
+        for (_mhGeo,ob),ptrgs in zip(proxies, ptargets):
+            addTargets(ob, ptrgs, scales)
             ob.MhxHasFaceShapes = True
 
 
 def addTargets(ob, targets, scales):
+    from .load_json import getTargetArrays
     targets = list(targets.items())
-    targets.sort()
+    targets.sort(key=lambda target: target[0])
     if not ob.data.shape_keys:
         basic = ob.shape_key_add(name="Basis")
     else:
         basic = ob.data.shape_keys.key_blocks[0]
 
+    nVerts = len(ob.data.vertices)
+    coords = np.empty(3*nVerts, dtype=np.float32)
+    ob.data.vertices.foreach_get("co", coords)
+    coords = coords.reshape(-1,3)
+    # Scale in double precision and add in single precision, as zup2 does.
+    scales = np.array([scales[0], -scales[2], scales[1]], dtype=np.float64)
     for tname,data in targets:
         skey = ob.shape_key_add(name=tname)
         skey.value = 0
         skey.slider_min = -0.5
         skey.slider_max = 1.5
-        for v in ob.data.vertices:
-            skey.data[v.index].co = v.co
-        nVerts = len(ob.data.vertices)
-        for vn,delta in data[:nVerts]:
-            if vn >= nVerts:
-                break
-            skey.data[vn].co += zup2(delta, scales)
+        vnums,deltas = getTargetArrays(data)
+        vnums = vnums[:nVerts]
+        outside = np.flatnonzero(vnums >= nVerts)
+        if len(outside) > 0:
+            vnums = vnums[:outside[0]]
+        deltas = np.asarray(deltas, dtype=np.float64)[:len(vnums)][:,[0,2,1]]
+        skeyCoords = coords.copy()
+        np.add.at(skeyCoords, vnums, (scales*deltas).astype(np.float32))
+        skey.data.foreach_set("co", skeyCoords.reshape(-1))
 
 
 def getScales(human, struct, mhHuman):
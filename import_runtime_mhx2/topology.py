@@ -0,0 +1,184 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  Authors:             Thomas Larsson
+#  Script Copyright (C) Thomas Larsson 2014 - 2020
+#  Script Copyright (C) MakeHuman Community 2020
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import hashlib
+import numpy as np
+from itertools import chain
+from collections import OrderedDict
+
+#------------------------------------------------------------------------
+#   Mesh topology.
+#   Vertex, edge and face adjacency of a mesh as CSR arrays: for each
+#   vertex, edge or face, an index into a flat array of its neighbours.
+#   Topologies are cached by a hash of the face array, so the seed mesh
+#   of the base mesh is only indexed once.
+#------------------------------------------------------------------------
+
+MaxTopologyCacheSize = 8
+
+theTopologies = OrderedDict()
+
+def getMeshTopology(faces, edges=None):
+    """
+    Return the topology of the faces, given as an index array or a list
+    of faces of varying length. If edges are given, edge numbers refer to
+    them, otherwise to the sorted unique edges of the faces.
+    """
+    loopVerts,_loopStarts,loopTotals = getFaceLoops(faces)
+    return getLoopTopology(loopVerts, loopTotals, edges)
+
+
+def getLoopTopology(loopVerts, loopTotals, edges=None):
+    sha = hashlib.sha1(loopVerts.tobytes())
+    sha.update(loopTotals.tobytes())
+    if edges is not None:
+        edges = np.asarray(edges, dtype=np.int32).reshape(-1,2)
+        sha.update(edges.tobytes())
+    key = sha.hexdigest()
+    if key in theTopologies.keys():
+        theTopologies.move_to_end(key)
+        return theTopologies[key]
+    loopStarts = np.zeros(len(loopTotals), dtype=np.int32)
+    np.cumsum(loopTotals[:-1], out=loopStarts[1:])
+    topo = MeshTopology(loopVerts, loopStarts, loopTotals, edges)
+    theTopologies[key] = topo
+    while len(theTopologies) > MaxTopologyCacheSize:
+        theTopologies.popitem(last=False)
+    return topo
+
+
+def getObjectTopology(me):
+    """
+    Return the topology of a Blender mesh, with edge numbers referring to
+    the edges of the mesh.
+    """
+    loopVerts = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get("vertex_index", loopVerts)
+    loopTotals = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get("loop_total", loopTotals)
+    edges = np.empty(2*len(me.edges), dtype=np.int32)
+    me.edges.foreach_get("vertices", edges)
+    return getLoopTopology(loopVerts, loopTotals, edges)
+
+
+def clearTopologies():
+    theTopologies.clear()
+
+
+def getFaceLoops(faces):
+    """
+    Return the vertex of each loop, and the first loop and number of
+    loops of each face, for an array of faces or a list of faces of
+    varying length.
+    """
+    if isinstance(faces, np.ndarray) and faces.ndim == 2:
+        nfaces,nverts = faces.shape
+        loopTotals = np.full(nfaces, nverts, dtype=np.int32)
+        loopVerts = faces.astype(np.int32).reshape(-1)
+    else:
+        loopTotals = np.fromiter(map(len, faces), dtype=np.int32, count=len(faces))
+        loopVerts = np.fromiter(chain.from_iterable(faces), dtype=np.int32, count=int(loopTotals.sum()))
+    loopStarts = np.zeros(len(loopTotals), dtype=np.int32)
+    np.cumsum(loopTotals[:-1], out=loopStarts[1:])
+    return loopVerts, loopStarts, loopTotals
+
+
+class CsrLists:
+    """
+    Read-only lists of neighbours, indexed like the dicts of lists
+    they replace.
+    """
+
+    def __init__(self, starts, values):
+        self.starts = starts
+        self.values = values
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def __getitem__(self, n):
+        return self.values[self.starts[n]:self.starts[n+1]].tolist()
+
+    def counts(self):
+        return np.diff(self.starts)
+
+
+def makeCsrLists(keys, values, nkeys):
+    order = np.argsort(keys, kind="stable")
+    starts = np.searchsorted(keys[order], np.arange(nkeys+1)).astype(np.int32)
+    return CsrLists(starts, values[order])
+
+
+class MeshTopology:
+
+    def __init__(self, loopVerts, loopStarts, loopTotals, edges=None):
+        self.nfaces = len(loopTotals)
+        self.nverts = int(loopVerts.max())+1 if len(loopVerts) else 0
+        if edges is not None and len(edges) > 0:
+            self.nverts = max(self.nverts, int(edges.max())+1)
+        self.faceValence = loopTotals
+        self.loopFaces = loopFaces = np.repeat(np.arange(self.nfaces, dtype=np.int32), loopTotals)
+        self.faceVerts = CsrLists(np.append(loopStarts, len(loopVerts)).astype(np.int32), loopVerts)
+        self.vertFaces = makeCsrLists(loopVerts, loopFaces, self.nverts)
+
+        # The edge from each loop to the next one in its face.
+        nextLoops = np.arange(1, len(loopVerts)+1, dtype=np.int32)
+        if self.nfaces:
+            nextLoops[loopStarts + loopTotals - 1] = loopStarts
+        loopEdges = np.sort(np.stack([loopVerts, loopVerts[nextLoops]], axis=1), axis=1)
+        loopKeys = loopEdges[:,0].astype(np.int64) << 32 | loopEdges[:,1]
+        if edges is None:
+            edgeKeys,loopEdgeNums = np.unique(loopKeys, return_inverse=True)
+            self.edges = np.stack([edgeKeys >> 32, edgeKeys & 0xffffffff], axis=1).astype(np.int32)
+            found = np.ones(len(loopKeys), dtype=bool)
+        else:
+            self.edges = edges
+            sortedEdges = np.sort(edges, axis=1)
+            edgeKeys = sortedEdges[:,0].astype(np.int64) << 32 | sortedEdges[:,1]
+            order = np.argsort(edgeKeys, kind="stable")
+            pos = np.searchsorted(edgeKeys[order], loopKeys)
+            pos = np.minimum(pos, max(len(order)-1, 0))
+            found = (edgeKeys[order][pos] == loopKeys) if len(order) else np.zeros(len(loopKeys), dtype=bool)
+            loopEdgeNums = order[pos] if len(order) else pos
+        loopEdgeNums = loopEdgeNums.reshape(-1).astype(np.int32)
+        self.nedges = len(self.edges)
+        self.faceEdges = makeCsrLists(loopFaces[found], loopEdgeNums[found], self.nfaces)
+        self.edgeFaces = makeCsrLists(loopEdgeNums[found], loopFaces[found], self.nedges)
+        self.edgeValence = self.edgeFaces.counts()
+        edgeVerts = self.edges.reshape(-1)
+        self.vertEdges = makeCsrLists(edgeVerts, np.repeat(np.arange(self.nedges, dtype=np.int32), 2), self.nverts)
+
+
+    def getBoundaryEdges(self):
+        """
+        Edges that belong to exactly one face.
+        """
+        return np.flatnonzero(self.edgeValence == 1)
+
+
+    def countFaceVerts(self, vmask):
+        """
+        Return the number of loops of each face whose vertex is in vmask.
+        """
+        vmask = np.asarray(vmask, dtype=np.float64)
+        counts = np.bincount(self.loopFaces, weights=vmask[self.faceVerts.values], minlength=self.nfaces)
+        return counts.astype(np.int32)
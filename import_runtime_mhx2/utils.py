@@ -21,6 +21,7 @@
 # ##### END GPL LICENSE BLOCK #####
 
 import bpy
+import numpy as np
 from mathutils import Vector
 from .error import MhxError
 
@@ -167,6 +168,23 @@ def zup2(co, s):
     return Vector((s[0]*co[0], -s[2]*co[2], s[1]*co[1]))
 
 
+def transformCoords(coords, scale=1, offset=None, useZup=True):
+    """
+    Return scale*zup(co) + offset for all rows of coords as an N x 3
+    float32 array. The arithmetic is done in float32 in the same order
+    as with Vectors, so the result is identical.
+    """
+    coords = np.asarray(coords, dtype=np.float32).reshape(-1,3)
+    if useZup:
+        coords = coords[:,[0,2,1]]
+        coords[:,1] *= -1
+    if scale != 1:
+        coords = coords * np.float32(scale)
+    if offset is not None:
+        coords = coords + np.asarray(offset, dtype=np.float32)
+    return coords
+
+
 def multiply(list1, list2):
     [(list1[n] and list2[n]) for n in range(len(list1))]
 
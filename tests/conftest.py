@@ -0,0 +1,204 @@
+#
+#   Test setup.
+#   The add-on modules import bpy and mathutils, which only exist inside
+#   Blender. For tests of the pure python and numpy code, minimal stand-ins
+#   are installed here, and the add-on packages are registered without
+#   running their __init__ files, which register Blender classes. The
+#   exporter modules import MakeHuman's log module, which gets a stand-in
+#   too.
+#
+
+import os
+import sys
+import math
+import types
+import importlib.util
+import numpy as np
+
+Root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AddonFolder = os.path.join(Root, "import_runtime_mhx2")
+ExporterFolder = os.path.join(Root, "9_export_mhx2")
+
+
+class StubModule(types.ModuleType):
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return type(name, (), {})
+
+
+class Vector:
+    def __init__(self, seq=(0.0, 0.0, 0.0)):
+        self.v = np.array(list(seq), dtype=np.float64)
+
+    @staticmethod
+    def _array(other):
+        return other.v if isinstance(other, Vector) else np.asarray(other, dtype=np.float64)
+
+    def __add__(self, other):
+        return Vector(self.v + Vector._array(other))
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return Vector(self.v - Vector._array(other))
+
+    def __rsub__(self, other):
+        return Vector(Vector._array(other) - self.v)
+
+    def __neg__(self):
+        return Vector(-self.v)
+
+    def __mul__(self, k):
+        return Vector(self.v*k)
+    __rmul__ = __mul__
+
+    def __truediv__(self, k):
+        return Vector(self.v/k)
+
+    def __getitem__(self, n):
+        return self.v[n]
+
+    def __setitem__(self, n, x):
+        self.v[n] = x
+
+    def __iter__(self):
+        return iter(self.v.tolist())
+
+    def __len__(self):
+        return len(self.v)
+
+    def __eq__(self, other):
+        return isinstance(other, Vector) and np.array_equal(self.v, other.v)
+
+    def __repr__(self):
+        return "Vector(%s)" % self.v.tolist()
+
+    def copy(self):
+        return Vector(self.v)
+
+    def dot(self, other):
+        return float(self.v @ Vector._array(other))
+
+    def cross(self, other):
+        return Vector(np.cross(self.v, Vector._array(other)))
+
+    def normalized(self):
+        return Vector(self.v/np.linalg.norm(self.v))
+
+    def normalize(self):
+        self.v = self.v/np.linalg.norm(self.v)
+
+    @property
+    def length(self):
+        return float(np.linalg.norm(self.v))
+
+
+class Matrix:
+    def __init__(self, rows=None):
+        if rows is None:
+            self.m = np.eye(4)
+        else:
+            self.m = np.array([list(row) for row in rows], dtype=np.float64)
+
+    @staticmethod
+    def Identity(n):
+        return Matrix(np.eye(n))
+
+    @staticmethod
+    def Rotation(angle, n, axis):
+        if isinstance(axis, str):
+            axis = {'X' : (1,0,0), 'Y' : (0,1,0), 'Z' : (0,0,1)}[axis]
+        a = np.asarray(list(axis), dtype=np.float64)
+        a = a/np.linalg.norm(a)
+        k = np.array([[0,-a[2],a[1]], [a[2],0,-a[0]], [-a[1],a[0],0]])
+        rot = np.eye(3) + math.sin(angle)*k + (1-math.cos(angle))*(k @ k)
+        if n == 4:
+            mat = np.eye(4)
+            mat[:3,:3] = rot
+            rot = mat
+        return Matrix(rot)
+
+    def __getitem__(self, n):
+        return self.m[n]
+
+    def __matmul__(self, other):
+        if isinstance(other, Matrix):
+            return Matrix(self.m @ other.m)
+        return Vector(self.m @ Vector._array(other))
+
+    def __sub__(self, other):
+        return Matrix(self.m - other.m)
+
+    def transposed(self):
+        return Matrix(self.m.T)
+
+    def to_quaternion(self):
+        m = self.m
+        trace = m[0,0] + m[1,1] + m[2,2]
+        if trace > 0:
+            s = 2*math.sqrt(trace + 1)
+            return (s/4, (m[2,1]-m[1,2])/s, (m[0,2]-m[2,0])/s, (m[1,0]-m[0,1])/s)
+        i = int(np.argmax([m[0,0], m[1,1], m[2,2]]))
+        j,k = (i+1)%3, (i+2)%3
+        s = 2*math.sqrt(1 + m[i,i] - m[j,j] - m[k,k])
+        quat = [0.0, 0.0, 0.0, 0.0]
+        quat[0] = (m[k,j] - m[j,k])/s
+        quat[i+1] = s/4
+        quat[j+1] = (m[j,i] + m[i,j])/s
+        quat[k+1] = (m[k,i] + m[i,k])/s
+        return tuple(quat)
+
+    def to_3x3(self):
+        return Matrix(self.m[:3,:3])
+
+
+def installStubs():
+    bpy = StubModule("bpy")
+    bpy.app = types.SimpleNamespace(version=(2,90,0))
+    for name in ["types", "props", "utils"]:
+        module = StubModule("bpy.%s" % name)
+        setattr(bpy, name, module)
+        sys.modules["bpy.%s" % name] = module
+    for name in ["BoolProperty", "IntProperty", "FloatProperty", "StringProperty",
+                 "EnumProperty", "FloatVectorProperty", "IntVectorProperty",
+                 "PointerProperty", "CollectionProperty"]:
+        setattr(bpy.props, name, lambda *args, **kwargs: None)
+    sys.modules["bpy"] = bpy
+
+    extras = StubModule("bpy_extras")
+    extras.io_utils = StubModule("bpy_extras.io_utils")
+    sys.modules["bpy_extras"] = extras
+    sys.modules["bpy_extras.io_utils"] = extras.io_utils
+
+    mathutils = types.ModuleType("mathutils")
+    mathutils.Vector = Vector
+    mathutils.Matrix = Matrix
+    mathutils.Euler = mathutils.Quaternion = lambda *args, **kwargs: None
+    sys.modules["mathutils"] = mathutils
+
+    log = types.ModuleType("log")
+    log.debug = log.message = log.notice = log.warning = log.error = lambda *args, **kwargs: None
+    sys.modules["log"] = log
+
+    for name,folder in [("import_runtime_mhx2", AddonFolder),
+                        ("import_runtime_mhx2.armature", os.path.join(AddonFolder, "armature"))]:
+        package = types.ModuleType(name)
+        package.__path__ = [folder]
+        sys.modules[name] = package
+
+
+def loadExporterModule(name):
+    """
+    Import a module of the exporter plugin, whose folder name is not a
+    valid package name.
+    """
+    if name not in sys.modules.keys():
+        spec = importlib.util.spec_from_file_location(name, os.path.join(ExporterFolder, name + ".py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+
+if "bpy" not in sys.modules.keys():
+    installStubs()
@@ -0,0 +1,89 @@
+#
+#   The operator calls of buildRig, counted by the import profiler with a
+#   recording stand-in for the Blender data and operators.
+#
+
+from collections import Counter
+import bpy
+import pytest
+
+from test_jointplan import getConfig, getHumans
+from import_runtime_mhx2 import profiler
+from import_runtime_mhx2.armature import parser as rigparser
+from import_runtime_mhx2.armature.build import buildRig
+
+
+class FakeData:
+    """
+    Accepts any attribute, item, call or assignment. Collections are empty.
+    """
+
+    def __init__(self):
+        object.__setattr__(self, "_attrs", {})
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return self._attrs.setdefault(name, FakeData())
+
+    def __setattr__(self, name, value):
+        self._attrs[name] = value
+
+    def __call__(self, *args, **kwargs):
+        return FakeData()
+
+    def __getitem__(self, key):
+        return self._attrs.setdefault(("item", key), FakeData())
+
+    def __setitem__(self, key, value):
+        self._attrs[("item", key)] = value
+
+    def __contains__(self, key):
+        return True
+
+    def __iter__(self):
+        return iter([])
+
+    def __len__(self):
+        return 0
+
+    def keys(self):
+        return self
+
+
+class FakeOps:
+    def __init__(self, calls, path=""):
+        self.calls = calls
+        self.path = path
+
+    def __getattr__(self, name):
+        return FakeOps(self.calls, "%s.%s" % (self.path, name) if self.path else name)
+
+    def __call__(self, **kwargs):
+        self.calls[self.path] += 1
+        return {'FINISHED'}
+
+
+@pytest.mark.parametrize("rigType", ["MHX", "GAME"])
+def test_build_rig_operators(rigType, monkeypatch):
+    calls = Counter()
+    monkeypatch.setattr(bpy, "ops", FakeOps(calls), raising=False)
+    monkeypatch.setattr(bpy, "data", FakeData(), raising=False)
+    monkeypatch.setattr(bpy.types, "Object", FakeData(), raising=False)
+    cfg = getConfig(rigType)
+    rigparser.clearRigTemplates()
+    prof = profiler.ImportProfiler()
+    prof.start()
+    try:
+        with prof.phase("rig"):
+            buildRig(getHumans(1)[0], None, cfg, FakeData())
+    finally:
+        prof.stop()
+        rigparser.clearRigTemplates()
+    record = prof.phases[0]
+    # One edit session and back to object mode. Bone groups are created
+    # through the data API, not with pose.group_add.
+    assert record["mode_sets"] == 2
+    assert record["operators"] == 2
+    assert calls == {"object.mode_set" : 2}
+    assert prof.getReport()["operators"] == 2
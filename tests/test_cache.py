@@ -0,0 +1,129 @@
+#
+#   The parse cache: hits and misses return the same arrays, entries are
+#   evicted least recently used first, and missing or locked entry files
+#   are handled.
+#
+
+import os
+import json
+import numpy as np
+import pytest
+
+from test_load_json import makeStruct, toPlain, assertSameStruct, writeJson
+from import_runtime_mhx2 import cache
+from import_runtime_mhx2.load_json import loadJson, loadJsonStream
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(os, "name", "posix")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setitem(cache.theCacheStats, "hits", 0)
+    monkeypatch.setitem(cache.theCacheStats, "misses", 0)
+    return str(tmp_path)
+
+
+def getTypes(struct):
+    if isinstance(struct, dict):
+        return dict([(key, getTypes(value)) for key,value in struct.items()])
+    elif isinstance(struct, list):
+        return [getTypes(value) for value in struct]
+    elif isinstance(struct, np.ndarray):
+        return (np.ndarray, struct.dtype, struct.shape)
+    else:
+        return type(struct)
+
+
+def getEntries():
+    index = cache.loadIndex(cache.getCacheFolder())
+    return index["entries"], index["files"]
+
+
+@pytest.mark.parametrize("loader", [loadJson, loadJsonStream])
+def test_hit_and_miss(folder, loader):
+    ref = makeStruct()
+    filepath = writeJson(folder, ref)
+    miss = cache.loadCachedJson(filepath, loader)
+    hit = cache.loadCachedJson(filepath, loader)
+    assert cache.getCacheStats() == (1, 1)
+    assert getTypes(hit) == getTypes(miss)
+    assertSameStruct(toPlain(hit), ref)
+    assertSameStruct(toPlain(miss), ref)
+    entries,files = getEntries()
+    assert len(entries) == 1 and list(files.keys()) == [os.path.realpath(filepath)]
+
+    # A changed file is a miss, and its old entry stays until evicted.
+    writeJson(folder, makeStruct(seed=1))
+    os.utime(filepath, ns=(1, 1))
+    assertSameStruct(toPlain(cache.loadCachedJson(filepath, loader)), makeStruct(seed=1))
+    assert cache.getCacheStats() == (1, 2)
+    assert len(getEntries()[0]) == 2
+
+
+def test_unwritable(folder, monkeypatch):
+    ref = makeStruct()
+    filepath = writeJson(folder, ref)
+    hit = cache.loadCachedJson(filepath, loadJsonStream)
+    cachefolder = os.path.join(folder, "blocked")
+    with open(cachefolder, "w") as fp:
+        fp.write("not a folder")
+    monkeypatch.setattr(cache, "getCacheFolder", lambda: cachefolder)
+    struct = cache.loadCachedJson(filepath, loadJsonStream)
+    assert getTypes(struct) == getTypes(hit)
+    assertSameStruct(toPlain(struct), ref)
+
+
+def test_corrupt_entry(folder):
+    ref = makeStruct()
+    filepath = writeJson(folder, ref)
+    cache.loadCachedJson(filepath, loadJson)
+    digest = list(getEntries()[0].keys())[0]
+    with open(os.path.join(cache.getCacheFolder(), digest + ".mhx2c"), "wb") as fp:
+        fp.write(b"MHX2ARR\0" + bytes(8) + b"{")
+    assertSameStruct(toPlain(cache.loadCachedJson(filepath, loadJson)), ref)
+    assert cache.getCacheStats() == (0, 2)
+    assertSameStruct(toPlain(cache.loadCachedJson(filepath, loadJson)), ref)
+    assert cache.getCacheStats() == (1, 2)
+
+
+def test_eviction(folder, monkeypatch):
+    filepaths = [writeJson(folder, makeStruct(seed=n), "test%d.mhx2" % n) for n in range(4)]
+    for filepath in filepaths:
+        cache.loadCachedJson(filepath, loadJson)
+    entries,files = getEntries()
+    sizes = [entry["bytes"] for entry in entries.values()]
+    assert len(entries) == 4
+
+    # Use the first file again, so that the second is the oldest.
+    cache.loadCachedJson(filepaths[0], loadJson)
+    monkeypatch.setattr(cache, "MaxCacheSize", sum(sizes) - 1)
+    cache.loadCachedJson(filepaths[0], loadJson)
+    entries,files = getEntries()
+    assert len(entries) == 3
+    assert sorted(files.keys()) == sorted([os.path.realpath(filepaths[n]) for n in [0, 2, 3]])
+    names = sorted(os.listdir(cache.getCacheFolder()))
+    assert names == sorted(["index.json"] + [digest + ".mhx2c" for digest in entries.keys()])
+
+
+def test_clear_cache(folder, monkeypatch):
+    filepaths = [writeJson(folder, makeStruct(seed=n), "test%d.mhx2" % n) for n in range(3)]
+    for filepath in filepaths:
+        cache.loadCachedJson(filepath, loadJson)
+    entries,_files = getEntries()
+    digests = list(entries.keys())
+    cachefolder = cache.getCacheFolder()
+    # An entry whose file is already gone is dropped. One that cannot be
+    # removed is kept.
+    os.remove(os.path.join(cachefolder, digests[0] + ".mhx2c"))
+    locked = os.path.join(cachefolder, digests[1] + ".mhx2c")
+    remove = os.remove
+    def removeUnlocked(path):
+        if path == locked:
+            raise PermissionError(path)
+        remove(path)
+    monkeypatch.setattr(os, "remove", removeUnlocked)
+    cache.clearCache()
+    entries,files = getEntries()
+    assert list(entries.keys()) == [digests[1]]
+    assert [info["hash"] for info in files.values()] == [digests[1]]
+    assert sorted(os.listdir(cachefolder)) == sorted(["index.json", digests[1] + ".mhx2c"])
@@ -0,0 +1,186 @@
+#
+#   addMeshToScene against the mesh from_pydata built, addWeights against
+#   one add() call per pair, and getVertexGroupArrays and
+#   getVertexGroupMatrix against the per-group lists built from the
+#   vertices.
+#
+
+import bpy
+import numpy as np
+import pytest
+from types import SimpleNamespace
+
+from import_runtime_mhx2 import geometries
+from import_runtime_mhx2.geometries import addMeshToScene, addWeights, getVertexGroupArrays, getVertexGroupMatrix
+from import_runtime_mhx2.topology import getFaceLoops
+
+
+class FakeCollection:
+    """
+    Records the number of elements and the foreach_set arrays.
+    """
+
+    def __init__(self, size=0):
+        self.size = size
+        self.attrs = {}
+
+    def add(self, count):
+        self.size += count
+
+    def foreach_set(self, attr, values):
+        values = np.asarray(values).reshape(-1)
+        assert len(values) % max(self.size, 1) == 0
+        self.attrs[attr] = values
+
+
+class FakeMesh:
+    def __init__(self, name):
+        self.name = name
+        self.vertices = FakeCollection()
+        self.edges = FakeCollection()
+        self.loops = FakeCollection()
+        self.polygons = FakeCollection()
+        self.uv_layers = []
+        self.updated = False
+
+    def update(self, calc_edges=False):
+        self.updated = True
+
+
+def makeFakeUvloop(me):
+    me.uv_layers.append(SimpleNamespace(data=FakeCollection(me.loops.size)))
+    return me.uv_layers[0]
+
+
+@pytest.fixture
+def scene(monkeypatch):
+    linked = []
+    data = SimpleNamespace(
+        meshes = SimpleNamespace(new=FakeMesh),
+        objects = SimpleNamespace(new=lambda name,me: SimpleNamespace(name=name, data=me)))
+    monkeypatch.setattr(bpy, "data", data, raising=False)
+    monkeypatch.setattr(geometries, "makeNewUvloop", makeFakeUvloop)
+    coll = SimpleNamespace(objects=SimpleNamespace(link=linked.append))
+    return SimpleNamespace(scene={"MHCollection" : coll}), linked
+
+
+def getPydataLoops(faces, uvFaces, uvcoords):
+    """
+    The loops of from_pydata, and the uvs the per-loop code assigned.
+    """
+    loopVerts = [vn for f in faces for vn in f]
+    loopStarts = np.cumsum([0] + [len(f) for f in faces[:-1]]).tolist()
+    uvs = [uvcoords[vn] for f in uvFaces for vn in f]
+    return loopVerts, loopStarts, uvs
+
+
+@pytest.mark.parametrize("mixed", [False, True])
+def test_add_mesh(scene, mixed):
+    context,linked = scene
+    rng = np.random.default_rng(2)
+    verts = rng.random((30,3))
+    if mixed:
+        faces = [rng.choice(30, 3 + n % 2, replace=False).tolist() for n in range(20)]
+    else:
+        faces = rng.integers(0, 30, (20,4))
+    uvcoords = rng.random((40,2))
+    uvFaces = [[vn+5 for vn in f] for f in faces]
+    mhMesh = {"faces" : faces, "uv_faces" : uvFaces, "uv_coordinates" : uvcoords.tolist()}
+    ob = addMeshToScene(verts, "Test", mhMesh, context)
+    me = ob.data
+    assert linked == [ob] and me.updated
+    assert np.array_equal(me.vertices.attrs["co"], verts.astype(np.float32).reshape(-1))
+    loopVerts,loopStarts,uvs = getPydataLoops([list(f) for f in faces], uvFaces, uvcoords)
+    assert me.loops.attrs["vertex_index"].tolist() == loopVerts
+    assert me.polygons.attrs["loop_start"].tolist() == loopStarts
+    assert me.polygons.attrs["use_smooth"].all()
+    assert np.array_equal(me.uv_layers[0].data.attrs["uv"], np.array(uvs, dtype=np.float32).reshape(-1))
+
+
+def test_face_loops():
+    faces = [[0, 1, 2], [3, 4, 5, 6], [7, 8, 9]]
+    loopVerts,loopStarts,loopTotals = getFaceLoops(faces)
+    assert loopVerts.tolist() == list(range(10))
+    assert loopStarts.tolist() == [0, 3, 7]
+    assert loopTotals.tolist() == [3, 4, 3]
+    loopVerts,loopStarts,loopTotals = getFaceLoops(np.arange(8).reshape(2,4))
+    assert loopVerts.tolist() == list(range(8))
+    assert loopStarts.tolist() == [0, 4] and loopTotals.tolist() == [4, 4]
+
+
+class FakeVertexGroup:
+    def __init__(self):
+        self.weights = {}
+        self.ncalls = 0
+
+    def add(self, vnums, weight, mode):
+        assert mode == 'REPLACE'
+        assert isinstance(vnums, list) and isinstance(weight, float)
+        self.ncalls += 1
+        for vn in vnums:
+            self.weights[vn] = np.float32(weight)
+
+
+def test_add_weights():
+    rng = np.random.default_rng(7)
+    vnums = rng.integers(0, 500, 2000).astype(np.int32)
+    weights = rng.choice([0.0, 0.25, 0.5, 1.0, 1/3], len(vnums))
+    weights[::7] = rng.random(len(weights[::7]))
+    ref = FakeVertexGroup()
+    for vn,w in zip(vnums.tolist(), weights.tolist()):
+        ref.add([vn], w, 'REPLACE')
+    vgrp = FakeVertexGroup()
+    addWeights(vgrp, vnums, weights)
+    assert vgrp.weights == ref.weights
+    assert vgrp.ncalls == len(set(ref.weights.values()))
+    empty = FakeVertexGroup()
+    addWeights(empty, np.array([], dtype=np.int32), np.array([]))
+    assert empty.ncalls == 0
+
+
+def makeObject(nverts=200, ngroups=12, seed=3):
+    rng = np.random.default_rng(seed)
+    vertices = []
+    for vn in range(nverts):
+        gnums = rng.choice(ngroups, rng.integers(0, 5), replace=False)
+        groups = [SimpleNamespace(group=int(gn), weight=float(rng.random())) for gn in gnums]
+        vertices.append(SimpleNamespace(index=vn, groups=groups))
+    vgrps = [SimpleNamespace(index=gn, name="G%d" % gn) for gn in range(ngroups)]
+    return SimpleNamespace(data=SimpleNamespace(vertices=vertices), vertex_groups=vgrps)
+
+
+def getGroupLists(ob):
+    vgroups = dict([(vgrp.index,[]) for vgrp in ob.vertex_groups])
+    for v in ob.data.vertices:
+        for g in v.groups:
+            vgroups[g.group].append((v.index, g.weight))
+    return vgroups
+
+
+def test_vertex_group_arrays():
+    ob = makeObject()
+    vgrps = getVertexGroupArrays(ob)
+    vgroups = getGroupLists(ob)
+    assert list(vgrps.keys()) == [vgrp.name for vgrp in ob.vertex_groups]
+    for vgrp in ob.vertex_groups:
+        pairs = vgrps[vgrp.name]
+        assert [(int(vn),w) for vn,w in zip(pairs["index"], pairs["weight"])] == \
+            [(vn,np.float32(w)) for vn,w in vgroups[vgrp.index]]
+
+
+def test_vertex_group_matrix():
+    ob = makeObject()
+    dense = np.zeros((len(ob.data.vertices), len(ob.vertex_groups)))
+    for gn,pairs in getGroupLists(ob).items():
+        for vn,w in pairs:
+            dense[vn,gn] = w
+    matrix,names = getVertexGroupMatrix(ob)
+    assert names == [vgrp.name for vgrp in ob.vertex_groups]
+    if geometries.scipy:
+        assert matrix.shape == dense.shape
+        assert np.array_equal(matrix.toarray(), dense)
+    else:
+        rows,cols,values = matrix
+        result = np.zeros(dense.shape)
+        result[rows,cols] = values
+        assert np.array_equal(result, dense)
@@ -0,0 +1,132 @@
+#
+#   The compiled joint plan, as used by getParsers, against the symbolic
+#   evaluation in Parser.setupJoints and Parser.setupPlaneJoints.
+#
+
+import os
+import numpy as np
+import pytest
+
+from import_runtime_mhx2.config import Config, Attributes
+from import_runtime_mhx2.hm8 import NTotalVerts
+from import_runtime_mhx2.armature import parser as rigparser
+from import_runtime_mhx2.armature.parser import Parser, getParsers, fitJoints
+
+RigTypes = ["MHX", "RIGIFY", "BASE", "GAME", "DAZ", "HUMANIK", "SECOND_LIFE", "XONOTIC"]
+
+
+def getConfig(rigType):
+    cfg = Config()
+    for attr in Attributes:
+        if not hasattr(cfg, attr):
+            setattr(cfg, attr, False)
+    cfg.bones = {}
+    cfg.useOffset = True
+    cfg.useRig = True
+    cfg.rigType = rigType
+    cfg.loadPreset(os.path.join("armature/data/rigs", rigType.lower() + ".json"))
+    return cfg
+
+
+def getHumans(nhumans):
+    rng = np.random.default_rng(1)
+    base = rng.random((NTotalVerts,3))*2 - 1
+    return [{
+        "name" : "Human%d" % n,
+        "scale" : 0.1*(1 + 0.1*n),
+        "offset" : [0, 0.1*n, 0.5],
+        "seed_mesh" : {"vertices" : base + 0.05*rng.random(base.shape)},
+        } for n in range(nhumans)]
+
+
+def describe(value):
+    """
+    Plain data for comparing rig definitions. Constraints become their
+    class and attributes, without the Blender constraint and the parser.
+    """
+    if isinstance(value, dict):
+        return dict([(key, describe(item)) for key,item in value.items()])
+    elif isinstance(value, (list, tuple)):
+        return [describe(item) for item in value]
+    elif isinstance(value, float):
+        return round(value, 6)
+    elif hasattr(value, "__dict__"):
+        return (type(value).__name__,
+                dict([(key, describe(item)) for key,item in vars(value).items()
+                      if key not in ["constraint", "parser"]]))
+    else:
+        return value
+
+
+def getReference(mhHuman, cfg):
+    parser = Parser(mhHuman, None, cfg)
+    parser.setupLocations()
+    return parser
+
+
+@pytest.mark.parametrize("rigType", RigTypes)
+def test_fit_joints(rigType):
+    cfg = getConfig(rigType)
+    humans = getHumans(3)
+    parsers = [Parser(mhHuman, None, cfg) for mhHuman in humans]
+    fitJoints(parsers)
+    for mhHuman,parser in zip(humans, parsers):
+        ref = getReference(mhHuman, cfg)
+        assert set(parser.locations.keys()) == set(ref.locations.keys())
+        for key,loc in ref.locations.items():
+            assert np.allclose(list(parser.locations[key]), list(loc), rtol=0, atol=1e-5), key
+        assert set(parser.normals.keys()) == set(ref.normals.keys())
+        for key,normal in ref.normals.items():
+            if normal is None:
+                assert parser.normals[key] is None, key
+            else:
+                assert np.allclose(list(parser.normals[key]), list(normal), rtol=0, atol=1e-5), key
+
+
+@pytest.mark.parametrize("rigType", ["MHX", "RIGIFY"])
+def test_fit_joints_batch(rigType):
+    cfg = getConfig(rigType)
+    humans = getHumans(4)
+    batch = [Parser(mhHuman, None, cfg) for mhHuman in humans]
+    fitJoints(batch)
+    for mhHuman,parser in zip(humans, batch):
+        single = Parser(mhHuman, None, cfg)
+        fitJoints([single])
+        assert list(parser.locations.keys()) == list(single.locations.keys())
+        for key,loc in single.locations.items():
+            assert np.allclose(list(parser.locations[key]), list(loc), rtol=0, atol=1e-12), key
+
+
+@pytest.mark.parametrize("rigType", ["MHX", "RIGIFY"])
+def test_get_parsers(rigType):
+    cfg = getConfig(rigType)
+    humans = getHumans(3)
+    rigparser.clearRigTemplates()
+    parsers = getParsers(humans[:1], cfg) + getParsers(humans[1:], cfg)
+    for mhHuman,parser in zip(humans, parsers):
+        ref = Parser(mhHuman, None, cfg)
+        ref.setup(mhHuman, None)
+        assert list(parser.bones.keys()) == list(ref.bones.keys())
+        for bname,bone in ref.bones.items():
+            assert np.allclose(list(parser.bones[bname].head), list(bone.head), rtol=0, atol=1e-5), bname
+            assert np.allclose(list(parser.bones[bname].tail), list(bone.tail), rtol=0, atol=1e-5), bname
+        assert list(parser.vertexGroups.keys()) == list(ref.vertexGroups.keys())
+        for vgname,vgroup in ref.vertexGroups.items():
+            pairs = np.array(parser.vertexGroups[vgname], dtype=np.float64).reshape(-1,2)
+            refpairs = np.array(vgroup, dtype=np.float64).reshape(-1,2)
+            assert np.array_equal(pairs[:,0], refpairs[:,0]), vgname
+            # Split weights scale with 1/length of the bone, and the random
+            # meshes have short bones.
+            assert np.allclose(pairs[:,1], refpairs[:,1], rtol=0, atol=1e-4), vgname
+        for attr in ["constraints", "customShapes", "drivers", "propDrivers", "lrPropDrivers", "boneDrivers"]:
+            assert describe(getattr(parser, attr)) == describe(getattr(ref, attr)), attr
+
+    # Building a rig stores the Blender constraints in the constraint
+    # objects, so the parsers must not share them.
+    owners = {}
+    for n,parser in enumerate(parsers):
+        for bname,cnslist in parser.constraints.items():
+            for cns in cnslist:
+                assert owners.setdefault(id(cns), n) == n, (bname, cns.name)
+    assert owners
+    rigparser.clearRigTemplates()
@@ -0,0 +1,361 @@
+#
+#   The .mhx2 loaders against json.load: the streaming loader, the array
+#   container, block-compressed files, the section index and quantised
+#   meshes.
+#
+
+import os
+import glob
+import bz2
+import json
+import numpy as np
+import pytest
+
+from conftest import AddonFolder, loadExporterModule
+from import_runtime_mhx2 import load_json
+from import_runtime_mhx2.load_json import (
+    loadJson, loadJsonStream, JsonStream, PairType, FittingType,
+    isArrayContainer, loadArrayContainer, writeArrayContainer)
+
+save_json = loadExporterModule("save_json")
+
+
+def makeStruct(seed=0, nverts=40, name="Human [test] {\"quoted\"}"):
+    rng = np.random.default_rng(seed)
+    verts = np.round(rng.normal(0, 1, (nverts,3)), 5)
+    faces = rng.integers(0, nverts, (nverts//2,4))
+    return {
+        "mhx2_version" : "0.27",
+        "name" : name,
+        "materials" : [{"name" : "Skin", "diffuse_color" : [0.8, 0.6, 0.5], "shadeless" : False}],
+        "geometries" : [{
+            "name" : "Human:Body",
+            "human" : True,
+            "offset" : [0, 0, 8.5],
+            "scale" : 0.1,
+            "license" : {"author" : "[x]", "homepage" : None},
+            "mesh" : {
+                "vertices" : verts.tolist(),
+                "faces" : faces.tolist(),
+                "uv_coordinates" : np.round(rng.random((nverts,2)), 5).tolist(),
+                "uv_faces" : faces.tolist(),
+                "weights" : {
+                    "spine" : [[int(vn), round(float(w), 5)] for vn,w in
+                               zip(rng.choice(nverts, 10, replace=False), rng.random(10))],
+                    "empty" : [],
+                },
+            },
+            "proxy" : {
+                "fitting" : [[rng.integers(0, nverts, 3).tolist(),
+                              np.round(rng.random(3), 5).tolist(),
+                              np.round(rng.normal(0, 1e-3, 3), 6).tolist()]
+                             for n in range(nverts//4)],
+            },
+        }],
+        "empty" : {},
+        "nested" : [[1, [2, 3]], [], [[]], [True, None, -1.5e-3]],
+    }
+
+
+def toPlain(value):
+    """
+    Convert the typed arrays of the streaming loaders back to lists.
+    """
+    if isinstance(value, dict):
+        return dict([(key, toPlain(data)) for key,data in value.items()])
+    elif isinstance(value, list):
+        return [toPlain(data) for data in value]
+    elif isinstance(value, np.ndarray):
+        if value.dtype == PairType:
+            return [[int(vn), float(w)] for vn,w in zip(value["index"], value["weight"])]
+        elif value.dtype == FittingType:
+            return [[row["vnums"].tolist(), row["weights"].tolist(), row["offsets"].tolist()]
+                    for row in value]
+        else:
+            return value.tolist()
+    else:
+        return value
+
+
+def assertSameStruct(struct, ref, path="", rtol=1e-6):
+    if isinstance(ref, dict):
+        assert isinstance(struct, dict), path
+        assert list(struct.keys()) == list(ref.keys()), path
+        for key in ref.keys():
+            assertSameStruct(struct[key], ref[key], "%s/%s" % (path, key), rtol)
+    elif isinstance(ref, list):
+        assert isinstance(struct, list) and len(struct) == len(ref), path
+        for n,(data,refdata) in enumerate(zip(struct, ref)):
+            assertSameStruct(data, refdata, "%s/%d" % (path, n), rtol)
+    elif isinstance(ref, float) or isinstance(struct, float):
+        # Typed arrays are float32, and weights may be written as ints.
+        assert np.isclose(struct, ref, rtol=rtol, atol=1e-6), path
+    else:
+        assert struct == ref and type(struct) == type(ref), path
+
+
+def writeJson(folder, struct, name="test.mhx2", indent=None):
+    filepath = os.path.join(folder, name)
+    with open(filepath, "w", encoding="utf-8") as fp:
+        json.dump(struct, fp, indent=indent)
+    return filepath
+
+#------------------------------------------------------------------------
+#   Streaming loader
+#------------------------------------------------------------------------
+
+@pytest.mark.parametrize("chunkSize", [3, 17, 256, 1 << 20])
+@pytest.mark.parametrize("indent", [None, 1])
+def test_stream(tmp_path, monkeypatch, chunkSize, indent):
+    monkeypatch.setattr(JsonStream, "ChunkSize", chunkSize)
+    ref = makeStruct()
+    filepath = writeJson(str(tmp_path), ref, indent=indent)
+    struct = loadJsonStream(filepath)
+    mhMesh = struct["geometries"][0]["mesh"]
+    assert mhMesh["vertices"].dtype == np.float32 and mhMesh["vertices"].shape == (40,3)
+    assert mhMesh["faces"].dtype == np.int32 and mhMesh["faces"].shape == (20,4)
+    assert mhMesh["uv_coordinates"].dtype == np.float32
+    assert mhMesh["weights"]["spine"].dtype == PairType
+    assert struct["geometries"][0]["proxy"]["fitting"].dtype == FittingType
+    assertSameStruct(toPlain(struct), ref)
+
+
+def test_stream_errors(tmp_path):
+    for string in ['{"a" : [1, 2', '{"a" : 1} x', '{"a" 1}', '[1, 2,]']:
+        filepath = os.path.join(str(tmp_path), "bad.mhx2")
+        with open(filepath, "w") as fp:
+            fp.write(string)
+        with pytest.raises(ValueError):
+            loadJsonStream(filepath)
+
+
+def test_stream_not_numeric(tmp_path):
+    ref = {"vertices" : [[1, 2, 3], [4, 5]], "faces" : [[1, True, 2]], "uv_faces" : [[]]}
+    filepath = writeJson(str(tmp_path), ref)
+    assert loadJsonStream(filepath) == ref
+
+
+def getBundledFiles():
+    return sorted(glob.glob(os.path.join(AddonFolder, "data", "hm8", "*", "*.mxa")))[:6]
+
+
+@pytest.mark.parametrize("filepath", getBundledFiles(), ids=os.path.basename)
+def test_stream_bundled(filepath):
+    assertSameStruct(toPlain(loadJsonStream(filepath)), loadJson(filepath))
+
+#------------------------------------------------------------------------
+#   Array container
+#------------------------------------------------------------------------
+
+def assertTypedArrays(struct):
+    mhMesh = struct["geometries"][0]["mesh"]
+    assert mhMesh["vertices"].dtype == np.float32
+    assert mhMesh["faces"].dtype == np.int32
+    assert mhMesh["weights"]["spine"].dtype == PairType
+    assert struct["geometries"][0]["proxy"]["fitting"].dtype == FittingType
+
+
+# The exporter does not escape strings and writes floats with %.5g.
+ExportName = "Human [test] {x}"
+ExportTolerance = 1e-4
+
+def test_container_export(tmp_path):
+    ref = makeStruct(name=ExportName)
+    filepath = os.path.join(str(tmp_path), "test.mhx2")
+    save_json.saveJson(ref, filepath, arrays=True)
+    assert isArrayContainer(filepath)
+    for loader in [loadJson, loadJsonStream, loadArrayContainer]:
+        struct = loader(filepath)
+        assertTypedArrays(struct)
+        assertSameStruct(toPlain(struct), ref, rtol=ExportTolerance)
+    # Blocks are mapped copy-on-write, so the importer may change them.
+    struct = loadJson(filepath)
+    struct["geometries"][0]["mesh"]["vertices"][0] = 0
+    assertSameStruct(toPlain(loadJson(filepath)), ref, rtol=ExportTolerance)
+
+
+def test_container_roundtrip(tmp_path):
+    ref = makeStruct(seed=1)
+    struct = loadJsonStream(writeJson(str(tmp_path), ref))
+    filepath = os.path.join(str(tmp_path), "test.mhx2c")
+    with open(filepath, "wb") as fp:
+        writeArrayContainer(struct, fp)
+    assert os.path.getsize(filepath) % load_json.BlockAlign == 0
+    result = loadArrayContainer(filepath)
+    assertTypedArrays(result)
+    mhMesh,refMesh = result["geometries"][0]["mesh"],struct["geometries"][0]["mesh"]
+    for key in ["vertices", "faces", "uv_coordinates", "uv_faces"]:
+        assert np.array_equal(mhMesh[key], refMesh[key]), key
+    assert np.array_equal(mhMesh["weights"]["spine"], refMesh["weights"]["spine"])
+    assert mhMesh["weights"]["empty"] == []
+    assertSameStruct(toPlain(result), ref)
+
+
+def test_container_no_blocks(tmp_path):
+    ref = {"mhx2_version" : "0.27", "name" : "x", "vertices" : [], "nested" : [[], {}]}
+    filepath = os.path.join(str(tmp_path), "test.mhx2")
+    save_json.saveJson(ref, filepath, arrays=True)
+    assert loadJson(filepath) == ref
+
+#------------------------------------------------------------------------
+#   Block-compressed files
+#------------------------------------------------------------------------
+
+def writeCompressed(folder, struct, codec, blockSize, monkeypatch):
+    monkeypatch.setattr(save_json.BlockCompressor, "BlockSize", blockSize)
+    filepath = os.path.join(folder, "test.mhx2")
+    save_json.saveJson(struct, filepath, binary=True, codec=codec, level=6)
+    return filepath
+
+
+@pytest.mark.parametrize("codec", ["gzip", "lzma", "bz2"])
+@pytest.mark.parametrize("blockSize", [512, 1 << 20])
+def test_block_compressed(tmp_path, monkeypatch, codec, blockSize):
+    ref = makeStruct(name=ExportName, nverts=200)
+    filepath = writeCompressed(str(tmp_path), ref, codec, blockSize, monkeypatch)
+    assert load_json.getCodec(filepath) == codec
+    with open(filepath, "rb") as fp:
+        data = fp.read()
+    text = load_json.CodecModules[codec].decompress(data)
+    if codec == "gzip":
+        members = load_json.splitGzipMembers(data)
+    elif codec == "lzma":
+        members = load_json.splitXzStreams(data)
+    else:
+        members = None
+    if members is not None:
+        assert len(members) == (len(text) + blockSize - 1) // blockSize
+    assert load_json.readCompressed(filepath, codec) == text
+    struct = json.loads(text)
+    assertSameStruct(loadJson(filepath), struct)
+    assertSameStruct(toPlain(loadJsonStream(filepath)), struct)
+    del struct["section_index"], struct["section_index_offset"]
+    assertSameStruct(struct, ref, rtol=ExportTolerance)
+
+
+@pytest.mark.parametrize("codec", ["gzip", "lzma", "bz2"])
+def test_plain_compressed(tmp_path, codec):
+    """
+    Files compressed in one piece by other tools.
+    """
+    ref = makeStruct()
+    text = json.dumps(ref).encode("utf-8")
+    module = load_json.CodecModules[codec]
+    data = module.compress(text[:1000]) + module.compress(text[1000:])
+    filepath = os.path.join(str(tmp_path), "test.mhx2")
+    with open(filepath, "wb") as fp:
+        fp.write(data)
+    assert load_json.readCompressed(filepath, codec) == text
+    assert loadJson(filepath) == ref
+
+
+def test_bz2_streams():
+    parts = [b"abc" * 1000, b"BZh91AY&SY" * 100, b"", b"xyz"]
+    data = b"".join([bz2.compress(part) for part in parts])
+    assert load_json.decompressBz2Streams(data) == b"".join(parts)
+    # A truncated stream is not accepted as a member, and fails in full.
+    member = bz2.compress(parts[0])
+    assert load_json.decompressBz2Member(member[:-5]) is None
+    assert load_json.decompressBz2Member(member + member) is None
+    with pytest.raises(EOFError):
+        load_json.decompressBz2Streams(data[:-5])
+
+#------------------------------------------------------------------------
+#   Section index
+#------------------------------------------------------------------------
+
+def makeSectionStruct(ngeos=4):
+    struct = makeStruct(name=ExportName)
+    mhGeo = struct["geometries"][0]
+    struct["skeleton"] = {"name" : "Skel", "bones" : [{"name" : "root", "head" : [0, 0, 1]}], "offset" : [0, 0, 0]}
+    struct["geometries"] = [mhGeo]
+    for n in range(1, ngeos):
+        proxy = makeStruct(seed=n, nverts=12, name=ExportName)["geometries"][0]
+        proxy["name"] = "Proxy%d" % n
+        proxy["human"] = (n % 3 == 0)
+        proxy["proxy"]["type"] = ["Clothes", "Eyes", "Proxymeshes"][n % 3]
+        struct["geometries"].append(proxy)
+    return struct
+
+
+Selections = [
+    (["mhx2_version", "materials"], None, None),
+    (["skeleton.bones", "nested"], None, None),
+    (["skeleton", "missing", "missing.bones"], None, None),
+    (["geometries"], None, None),
+    (["geometries"], lambda info: info["human"], None),
+    (["geometries"], lambda info: info["type"] == "Clothes", ["name", "mesh"]),
+    (["materials", "geometries"], None, ["name", "uuid", "material", "mesh", "missing"]),
+]
+
+@pytest.mark.parametrize("codec", [None, "gzip", "lzma"])
+@pytest.mark.parametrize("ngeos", [4, 100])
+def test_sections(tmp_path, monkeypatch, codec, ngeos):
+    ref = makeSectionStruct(ngeos)
+    if codec:
+        filepath = writeCompressed(str(tmp_path), ref, codec, 4096, monkeypatch)
+    else:
+        filepath = os.path.join(str(tmp_path), "test.mhx2")
+        save_json.saveJson(ref, filepath)
+    reader = load_json.RangeReader(filepath)
+    if codec == "gzip":
+        assert len(reader.members) > 1
+    index = reader.getSectionIndex()
+    assert index is not None and len(index["geometries"]) == ngeos
+    if ngeos > 4:
+        # The index spans several compressed blocks.
+        assert len(json.dumps(index)) > 4*4096
+    full = loadJson(filepath)
+    text = reader.read(0, reader.size)
+    for start,end in [(0, 10), (4000, 4200), (reader.size-100, reader.size+5)]:
+        assert reader.read(start, end) == text[start:end]
+    for sections,geometries,geometryKeys in Selections:
+        expected = load_json.selectSections(full, sections, geometries, geometryKeys)
+        assert load_json.loadJsonSections(filepath, sections, geometries, geometryKeys) == expected
+        struct = load_json.loadJsonSections(filepath, sections, geometries, geometryKeys, useStreaming=True)
+        assertSameStruct(toPlain(struct), expected)
+
+
+def test_sections_without_index(tmp_path):
+    ref = makeSectionStruct()
+    filepath = writeJson(str(tmp_path), ref)
+    assert load_json.RangeReader(filepath).getSectionIndex() is None
+    for sections,geometries,geometryKeys in Selections:
+        expected = load_json.selectSections(ref, sections, geometries, geometryKeys)
+        assert load_json.loadJsonSections(filepath, sections, geometries, geometryKeys) == expected
+
+#------------------------------------------------------------------------
+#   Quantised meshes
+#------------------------------------------------------------------------
+
+@pytest.mark.parametrize("bits", [16, 32])
+@pytest.mark.parametrize("format", ["text", "gzip", "container"])
+def test_quantised(tmp_path, bits, format):
+    rng = np.random.default_rng(bits)
+    verts = rng.normal(0, 5, (500,3))
+    verts[:,1] = 2.5
+    uvs = rng.random((600,2))
+    ref = makeStruct(name=ExportName)
+    mhMesh = ref["geometries"][0]["mesh"]
+    mhMesh["vertices"] = save_json.quantiseArray(verts, bits)
+    mhMesh["uv_coordinates"] = save_json.quantiseArray(uvs, bits)
+    ref["geometries"][0]["seed_mesh"] = {"vertices" : save_json.quantiseArray(verts, bits)}
+    filepath = os.path.join(str(tmp_path), "test.mhx2")
+    save_json.saveJson(ref, filepath, binary=(format == "gzip"), arrays=(format == "container"))
+
+    for loader in [loadJson, loadJsonStream]:
+        struct = loader(filepath)
+        load_json.dequantiseMeshes(struct)
+        mhGeo = struct["geometries"][0]
+        for mhMesh in [mhGeo["mesh"], mhGeo["seed_mesh"]]:
+            for key,values in [("vertices", verts), ("uv_coordinates", uvs)]:
+                if key not in mhMesh.keys():
+                    continue
+                array = mhMesh[key]
+                assert array.dtype == np.float32 and array.shape == values.shape
+                scale = (values.max(axis=0) - values.min(axis=0)) / ((1 << bits) - 1)
+                # Within half a quantisation step, plus the float32 rounding.
+                bound = scale/2 + np.abs(values).max(axis=0)*2**-23
+                assert np.all(np.abs(array - values) <= bound), key
+        assert np.all(mhGeo["mesh"]["vertices"][:,1] == np.float32(2.5))
+        assertSameStruct(toPlain(mhGeo["mesh"]["faces"]), ref["geometries"][0]["mesh"]["faces"])
@@ -0,0 +1,85 @@
+#
+#   proxifyMask against the per-face loop it replaced, on the bundled
+#   quad-mesh proxies.
+#
+
+import os
+import glob
+import numpy as np
+import pytest
+
+from conftest import AddonFolder
+from import_runtime_mhx2.hm8 import NTotalVerts
+from import_runtime_mhx2.load_json import loadJson
+from import_runtime_mhx2.masks import proxifyMask, getPaddedFaces
+
+
+def getQuadProxies():
+    proxies = []
+    for filepath in sorted(glob.glob(os.path.join(AddonFolder, "data", "hm8", "*", "*.mxa"))):
+        mhGeo = loadJson(filepath)
+        if ("proxy" in mhGeo.keys() and "mesh" in mhGeo.keys() and
+            len(mhGeo["mesh"]["faces"][0]) == 4):
+            proxies.append(filepath)
+    return proxies
+
+
+def transferMask(mhFitting, vnums):
+    """
+    The weight transfer of proxifyVertexGroups before the fitting matrix.
+    """
+    grp0 = dict([(vn,0.0) for vn in range(NTotalVerts)])
+    for vn in vnums:
+        grp0[vn] = 1.0
+    grp1 = []
+    for pvn,pdata in enumerate(mhFitting):
+        fvnums,weights,_offsets = pdata
+        grp1 += [(pvn, weights[n]*grp0[vn]) for n,vn in enumerate(fvnums)]
+    grp1.sort()
+
+    ngrp = []
+    vn0 = grp1[0][0]
+    wsum = 0.0
+    for vn,w in grp1:
+        if vn == vn0:
+            wsum += w
+        else:
+            if wsum > 1e-4:
+                ngrp.append((vn0,wsum))
+            vn0 = vn
+            wsum = w
+    if wsum > 1e-4:
+        ngrp.append((vn0,wsum))
+    return ngrp
+
+
+def proxifyMaskPerFace(mhProxy, mhMesh, vnums):
+    ngrp = transferMask(mhProxy["fitting"], vnums)
+    if not ngrp:
+        return []
+    nverts = len(mhMesh["vertices"])
+    vmask = dict([(vn,0) for vn in range(nverts)])
+    for vn,w in ngrp:
+        vmask[vn] = w
+    vclear = dict([(vn,False) for vn in range(nverts)])
+    for f in mhMesh["faces"]:
+        if vmask[f[0]]*vmask[f[1]]*vmask[f[2]]*vmask[f[3]] < 0.5:
+            vclear[f[0]] = vclear[f[1]] = vclear[f[2]] = vclear[f[3]] = True
+    return sorted([vn for vn,test in vclear.items() if not test])
+
+
+@pytest.mark.parametrize("filepath", getQuadProxies(), ids=os.path.basename)
+def test_proxify_mask(filepath):
+    mhGeo = loadJson(filepath)
+    mhProxy = mhGeo["proxy"]
+    mhMesh = mhGeo["mesh"]
+    fitted = np.unique([row[0] for row in mhProxy["fitting"]])
+    rng = np.random.default_rng(5)
+    for nparts in [1, 2, 4]:
+        vnums = np.unique(rng.choice(fitted, len(fitted)//nparts)).tolist()
+        assert proxifyMask(mhProxy, mhMesh, vnums) == proxifyMaskPerFace(mhProxy, mhMesh, vnums)
+
+
+def test_padded_faces():
+    faces = getPaddedFaces([[0,1,2], [2,3,4,1]], 5)
+    assert faces.tolist() == [[0,1,2,5], [2,3,4,1]]
@@ -0,0 +1,189 @@
+#
+#   The sparse fitting matrix against the per-group and per-target loops
+#   of proxifyVertexGroups and proxifyTargets that it replaced, on bundled
+#   proxies.
+#
+
+import os
+import glob
+import numpy as np
+import pytest
+
+from conftest import AddonFolder
+from import_runtime_mhx2.hm8 import NTotalVerts
+from import_runtime_mhx2.load_json import loadJson, makePairArray
+from import_runtime_mhx2 import proxy
+from import_runtime_mhx2.proxy import getFittingMatrix, clearFittingMatrices
+
+
+def getProxyFiles():
+    filepaths = sorted(glob.glob(os.path.join(AddonFolder, "data", "hm8", "*", "*.mxa")))
+    return [filepath for filepath in filepaths if "proxy" in loadJson(filepath).keys()][:5]
+
+
+def getProxy(filepath):
+    return loadJson(filepath)["proxy"]
+
+
+def makeGroups(mhProxy, ngroups=6, seed=0):
+    rng = np.random.default_rng(seed)
+    fitted = np.unique([vn for row in mhProxy["fitting"] for vn in row[0]])
+    vgrps = {}
+    for n in range(ngroups):
+        vnums = rng.choice(fitted, len(fitted)//(n+1))
+        weights = rng.random(len(vnums))
+        weights[::5] = 1e-5
+        vgrps["group%d" % n] = list(zip(vnums.tolist(), weights.tolist()))
+    vgrps["empty"] = []
+    vgrps["unfitted"] = [(int(np.setdiff1d(np.arange(NTotalVerts), fitted)[0]), 1.0)]
+    return vgrps
+
+
+def transferGroup(mhFitting, ogrp):
+    """
+    The weight transfer of proxifyVertexGroups before the fitting matrix.
+    """
+    grp0 = dict([(vn,0.0) for vn in range(NTotalVerts)])
+    for vn,w in ogrp:
+        grp0[vn] = w
+    grp1 = []
+    for pvn,pdata in enumerate(mhFitting):
+        vnums,weights,_offsets = pdata
+        grp1 += [(pvn, weights[n]*grp0[vn]) for n,vn in enumerate(vnums)]
+    grp1.sort()
+
+    ngrp = []
+    if len(grp1) > 0:
+        vn0 = grp1[0][0]
+        wsum = 0.0
+        for vn,w in grp1:
+            if vn == vn0:
+                wsum += w
+            else:
+                if wsum > 1e-4:
+                    ngrp.append((vn0,wsum))
+                vn0 = vn
+                wsum = w
+        if wsum > 1e-4:
+            ngrp.append((vn0,wsum))
+    return ngrp
+
+
+@pytest.mark.parametrize("filepath", getProxyFiles(), ids=os.path.basename)
+def test_transfer_groups(filepath):
+    mhProxy = getProxy(filepath)
+    vgrps = makeGroups(mhProxy)
+    ngrps = getFittingMatrix(mhProxy).transferGroups(vgrps)
+    for gname,ogrp in vgrps.items():
+        ref = transferGroup(mhProxy["fitting"], ogrp)
+        if not ref:
+            assert gname not in ngrps.keys()
+            continue
+        pairs = ngrps[gname]
+        assert pairs["index"].tolist() == [vn for vn,w in ref], gname
+        assert np.allclose(pairs["weight"], [w for vn,w in ref], rtol=1e-6, atol=0), gname
+    # PairType arrays, with float32 weights, give the same groups.
+    arrays = dict([(gname, makePairArray(*map(np.array, zip(*ogrp)))) for gname,ogrp in vgrps.items() if ogrp])
+    for gname,pairs in getFittingMatrix(mhProxy).transferGroups(arrays).items():
+        assert np.array_equal(pairs["index"], ngrps[gname]["index"]), gname
+        assert np.allclose(pairs["weight"], ngrps[gname]["weight"], rtol=1e-6, atol=0), gname
+
+
+def test_fitting_key():
+    clearFittingMatrices()
+    mhProxy = getProxy(getProxyFiles()[0])
+    matrix = getFittingMatrix(mhProxy)
+    assert getFittingMatrix({"fitting" : [list(map(list, row)) for row in mhProxy["fitting"]]}) is matrix
+    # An edited proxy with the same uuid gets its own matrix.
+    edited = [[list(row[0]), list(row[1]), list(row[2])] for row in mhProxy["fitting"]]
+    edited[0][1] = [1.0, 0.0, 0.0]
+    assert getFittingMatrix({"fitting" : edited}) is not matrix
+    edited = [[list(row[0]), list(row[1]), list(row[2])] for row in mhProxy["fitting"]]
+    edited[0][2] = [0.0, 0.0, 0.5]
+    assert getFittingMatrix({"fitting" : edited}) is not matrix
+    clearFittingMatrices()
+
+
+def makeTargets(mhProxy, ntargets=4, seed=1):
+    rng = np.random.default_rng(seed)
+    fitted = np.unique([vn for row in mhProxy["fitting"] for vn in row[0]])
+    targets = {}
+    for n in range(ntargets):
+        vnums = rng.choice(fitted, len(fitted)//(n+2))
+        deltas = rng.normal(0, 0.01, (len(vnums),3))
+        deltas[::4] *= 1e-2
+        targets["target%d" % n] = list(zip(vnums.tolist(), deltas.tolist()))
+    targets["empty"] = []
+    return targets
+
+
+def transferTarget(mhFitting, otrg):
+    """
+    The delta transfer of proxifyTargets before the fitting matrix. The
+    old code compared the last vertex with "dsum > 1e-4", which fails for
+    vectors, so all vertices use the length threshold here.
+    """
+    trg0 = dict([(vn,np.zeros(3)) for vn in range(NTotalVerts)])
+    for vn,delta in otrg:
+        trg0[vn] = np.array(delta)
+    trg1 = []
+    for pvn,pdata in enumerate(mhFitting):
+        vnums,weights,_offsets = pdata
+        trg1 += [(pvn, weights[n]*trg0[vn]) for n,vn in enumerate(vnums)]
+    trg1.sort(key=lambda pair: pair[0])
+
+    ntrg = []
+    if len(trg1) > 0:
+        vn0 = trg1[0][0]
+        dsum = np.zeros(3)
+        for vn,delta in trg1:
+            if vn == vn0:
+                dsum = dsum + delta
+            else:
+                if np.linalg.norm(dsum) > 1e-3:
+                    ntrg.append((vn0,dsum))
+                vn0 = vn
+                dsum = delta
+        if np.linalg.norm(dsum) > 1e-3:
+            ntrg.append((vn0,dsum))
+    return ntrg
+
+
+@pytest.mark.parametrize("filepath", getProxyFiles(), ids=os.path.basename)
+def test_transfer_targets(filepath):
+    mhProxy = getProxy(filepath)
+    targets = makeTargets(mhProxy)
+    ntrgs = proxy.proxifyTargets(mhProxy, targets)
+    for tname,otrg in targets.items():
+        ref = transferTarget(mhProxy["fitting"], otrg)
+        if not ref:
+            assert tname not in ntrgs.keys()
+            continue
+        ntrg = ntrgs[tname]
+        assert ntrg["index"].tolist() == [vn for vn,delta in ref], tname
+        assert np.allclose(ntrg["delta"], [delta for vn,delta in ref], rtol=1e-5, atol=1e-8), tname
+
+
+def test_transfer_all_targets():
+    mhProxies = [getProxy(filepath) for filepath in getProxyFiles()[:3]]
+    targets = makeTargets(mhProxies[0])
+    for mhProxy,ntrgs in zip(mhProxies, proxy.proxifyAllTargets(mhProxies, targets)):
+        single = proxy.proxifyTargets(mhProxy, targets)
+        assert list(ntrgs.keys()) == list(single.keys())
+        for tname,ntrg in single.items():
+            assert np.array_equal(ntrgs[tname], ntrg), tname
+
+
+def test_fitting_matrix_lru(monkeypatch):
+    monkeypatch.setattr(proxy, "MaxFittingMatrices", 3)
+    clearFittingMatrices()
+    mhProxies = [getProxy(filepath) for filepath in getProxyFiles()[:4]]
+    matrices = [getFittingMatrix(mhProxy) for mhProxy in mhProxies[:3]]
+    # Using the first again makes the second the least recently used.
+    assert getFittingMatrix(mhProxies[0]) is matrices[0]
+    getFittingMatrix(mhProxies[3])
+    assert len(proxy.theFittingMatrices) == 3
+    assert getFittingMatrix(mhProxies[0]) is matrices[0]
+    assert getFittingMatrix(mhProxies[2]) is matrices[2]
+    assert getFittingMatrix(mhProxies[1]) is not matrices[1]
+    clearFittingMatrices()
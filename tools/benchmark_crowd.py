@@ -0,0 +1,95 @@
+#
+#   Time importCrowd on copies of one character. The files are given on
+#   the command line, or a synthetic character is written: a body-sized
+#   quad mesh with one untextured material.
+#       python tools/benchmark_crowd.py [ncopies] [file.mhx2]
+#
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchutils import *
+
+import bpy
+registerAddon()
+from bpy.props import StringProperty
+from import_runtime_mhx2.hm8 import NBodyVerts
+from import_runtime_mhx2.crowd import importCrowd
+
+
+def writeSyntheticCharacter(filepath):
+    mhMesh = makeSyntheticMesh(NBodyVerts)
+    struct = {
+        "mhx2_version" : "0.27",
+        "materials" : [{
+            "name" : "Skin",
+            "diffuse_color" : [0.8, 0.6, 0.5],
+            "specular_color" : [0.1, 0.1, 0.1],
+            "shininess" : 0.2,
+            "opacity" : 1.0,
+            }],
+        "geometries" : [{
+            "name" : "Human:Body",
+            "uuid" : "00000000-0000-0000-0000-000000000000",
+            "human" : True,
+            "offset" : [0, 0, 8.5],
+            "scale" : 0.1,
+            "material" : "Skin",
+            "mesh" : dict([(key, value.tolist()) for key,value in mhMesh.items()]),
+            }],
+        }
+    with open(filepath, "w", encoding="utf-8") as fp:
+        json.dump(struct, fp)
+
+
+def removeCharacters(characters):
+    for obs in characters:
+        for ob in obs:
+            me = ob.data
+            bpy.data.objects.remove(ob)
+            bpy.data.meshes.remove(me)
+    for mat in list(bpy.data.materials):
+        if mat.users == 0:
+            bpy.data.materials.remove(mat)
+
+
+def benchmarkCrowd(ncopies, source):
+    bpy.types.Object.MhxUuid = StringProperty(default="")
+    folder = tempfile.mkdtemp()
+    try:
+        if source is None:
+            source = os.path.join(folder, "synthetic.mhx2")
+            writeSyntheticCharacter(source)
+        filepaths = []
+        for n in range(ncopies):
+            filepath = os.path.join(folder, "copy%03d.mhx2" % n)
+            shutil.copyfile(source, filepath)
+            filepaths.append(filepath)
+        print(getBlenderVersion())
+        print("%d copies of %s, %d bytes" % (ncopies, os.path.basename(source), os.path.getsize(source)))
+        # Keep the parse cache out of the user cache folder.
+        os.environ["XDG_CACHE_HOME"] = os.path.join(folder, "cache")
+        for label,options in [
+            ("json loader", {}),
+            ("streaming loader", {"useStreaming" : True}),
+            ("parse cache, cold", {"useCache" : True}),
+            ("parse cache, warm", {"useCache" : True}),
+            ("unshared materials", {"useSharedMaterials" : False}),
+            ]:
+            coll = bpy.data.collections.new("Crowd")
+            bpy.context.scene.collection.children.link(coll)
+            time1 = time.perf_counter()
+            characters = importCrowd(filepaths, bpy.context, collection=coll, **options)
+            time2 = time.perf_counter()
+            removeCharacters(characters)
+            bpy.data.collections.remove(coll)
+            print("%-20s %.2f s, %.1f characters/s" % (label, time2-time1, ncopies/(time2-time1)))
+    finally:
+        shutil.rmtree(folder)
+
+
+args = getArguments()
+benchmarkCrowd(int(args[0]) if args else 20, args[1] if len(args) > 1 else None)
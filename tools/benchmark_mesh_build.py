@@ -0,0 +1,83 @@
+#
+#   Time addMeshToScene, which fills the mesh with foreach_set, against the
+#   from_pydata construction it replaced. The meshes of an .mhx2 file are
+#   used if one is given, and a synthetic mesh with as many vertices as the
+#   MakeHuman body otherwise.
+#
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchutils import *
+
+import bpy
+registerAddon()
+from import_runtime_mhx2.hm8 import NBodyVerts
+from import_runtime_mhx2.geometries import addMeshToScene, makeNewUvloop
+from import_runtime_mhx2.utils import getCollection
+
+
+def addMeshFromPydata(verts, gname, mhMesh, context):
+    """
+    The mesh construction before addMeshToScene.
+    """
+    me = bpy.data.meshes.new(gname)
+    faces = mhMesh["faces"]
+    if hasattr(faces, "tolist"):
+        faces = faces.tolist()
+    me.from_pydata(verts, [], faces)
+
+    for f in me.polygons:
+        f.use_smooth = True
+
+    uvlayer = makeNewUvloop(me)
+    uvcoords = mhMesh["uv_coordinates"]
+    n = 0
+    for f in mhMesh["uv_faces"]:
+        for vn in f:
+            uvlayer.data[n].uv = uvcoords[vn]
+            n += 1
+
+    ob = bpy.data.objects.new(gname, me)
+    coll = getCollection(context)
+    coll.objects.link(ob)
+    return ob
+
+
+def removeObject(ob):
+    me = ob.data
+    bpy.data.objects.remove(ob)
+    bpy.data.meshes.remove(me)
+
+
+def getMeshes(args):
+    if args:
+        from import_runtime_mhx2.importer import importMhx2Json
+        struct,_time = importMhx2Json(args[0])
+        return [(mhGeo["name"], mhGeo["mesh"]) for mhGeo in struct["geometries"]
+                if "mesh" in mhGeo.keys() and "faces" in mhGeo["mesh"].keys()]
+    else:
+        return [("Synthetic body", makeSyntheticMesh(NBodyVerts))]
+
+
+def benchmarkMeshBuild(meshes, repeat=5):
+    context = bpy.context
+    coll = bpy.data.collections.new("Benchmark")
+    context.scene.collection.children.link(coll)
+    context.scene['MHCollection'] = coll
+    print(getBlenderVersion())
+    for gname,mhMesh in meshes:
+        verts = mhMesh["vertices"]
+        times = {}
+        for builder in [addMeshFromPydata, addMeshToScene]:
+            times[builder.__name__] = bestTime(
+                lambda: builder(verts, gname, mhMesh, context), repeat, removeObject)
+        print("%-30s %6d verts %6d faces: from_pydata %.4f s, foreach_set %.4f s, x%.1f" %
+              (gname, len(verts), len(mhMesh["faces"]),
+               times["addMeshFromPydata"], times["addMeshToScene"],
+               times["addMeshFromPydata"]/times["addMeshToScene"]))
+    del context.scene['MHCollection']
+    bpy.data.collections.remove(coll)
+
+
+benchmarkMeshBuild(getMeshes(getArguments()))
@@ -0,0 +1,83 @@
+#
+#   Time the vertex groups of a rig, assigned with addWeights in buckets of
+#   equal weight, against one vgrp.add() call per (vertex, weight) pair.
+#   The groups come from the rig parser for a synthetic seed mesh, with
+#   helpers, so only the weights of split bones depend on the mesh.
+#       python tools/benchmark_vertex_groups.py [rigType]
+#
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchutils import *
+
+import bpy
+registerAddon()
+from import_runtime_mhx2.hm8 import NTotalVerts
+from import_runtime_mhx2.config import Config, Attributes
+from import_runtime_mhx2.armature.parser import getParser
+from import_runtime_mhx2.geometries import addWeights
+from import_runtime_mhx2.load_json import getPairArrays
+
+
+def getConfig(rigType):
+    cfg = Config()
+    for attr in Attributes:
+        if not hasattr(cfg, attr):
+            setattr(cfg, attr, False)
+    cfg.bones = {}
+    cfg.useOffset = True
+    cfg.useHelpers = True
+    cfg.useRig = True
+    cfg.rigType = rigType
+    cfg.loadPreset(os.path.join("armature/data/rigs", rigType.lower() + ".json"))
+    return cfg
+
+
+def getHuman():
+    mhMesh = makeSyntheticMesh(NTotalVerts)
+    return {
+        "name" : "Human",
+        "scale" : 0.1,
+        "offset" : [0, 0, 0],
+        "seed_mesh" : mhMesh,
+        }, mhMesh
+
+
+def addWeightsPerPair(vgrp, vnums, weights):
+    """
+    The assignment before addWeights.
+    """
+    for vn,w in zip(vnums.tolist(), weights.tolist()):
+        vgrp.add([vn], w, 'REPLACE')
+
+
+def benchmarkVertexGroups(rigType, repeat=10):
+    mhHuman,mhMesh = getHuman()
+    parser = getParser(mhHuman, None, getConfig(rigType))
+    vgroups = [(vgname, getPairArrays(data)) for vgname,data in parser.vertexGroups.items()]
+    me = bpy.data.meshes.new("Benchmark")
+    me.vertices.add(len(mhMesh["vertices"]))
+    ob = bpy.data.objects.new("Benchmark", me)
+
+    def assignGroups(assign):
+        ob.vertex_groups.clear()
+        for vgname,(vnums,weights) in vgroups:
+            vgrp = ob.vertex_groups.new(name=vgname)
+            assign(vgrp, vnums, weights)
+
+    npairs = sum([len(vnums) for _vgname,(vnums,_weights) in vgroups])
+    ncalls = sum([len(np.unique(np.asarray(weights, dtype=np.float32)))
+                  for _vgname,(_vnums,weights) in vgroups])
+    print(getBlenderVersion())
+    print("%s rig, %d verts: %d groups, %d pairs, %d distinct weights per group in total" %
+          (rigType, len(mhMesh["vertices"]), len(vgroups), npairs, ncalls))
+    for assign in [addWeightsPerPair, addWeights]:
+        print("%-20s %.4f s" % (assign.__name__, bestTime(lambda: assignGroups(assign), repeat)))
+
+    bpy.data.objects.remove(ob)
+    bpy.data.meshes.remove(me)
+
+
+args = getArguments()
+benchmarkVertexGroups(args[0] if args else "MHX")
@@ -0,0 +1,87 @@
+#
+#   Helpers for the benchmark scripts. They run in Blender, or in a Python
+#   with the bpy module, e.g.
+#       blender -b --python tools/benchmark_mesh_build.py -- [file.mhx2]
+#       python tools/benchmark_mesh_build.py [file.mhx2]
+#   The add-on is imported from this tree without running its __init__,
+#   so it need not be installed or registered.
+#
+
+import os
+import sys
+import time
+import types
+import numpy as np
+
+Root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AddonFolder = os.path.join(Root, "import_runtime_mhx2")
+
+
+def registerAddon():
+    for name,folder in [("import_runtime_mhx2", AddonFolder),
+                        ("import_runtime_mhx2.armature", os.path.join(AddonFolder, "armature"))]:
+        if name not in sys.modules.keys():
+            package = types.ModuleType(name)
+            package.__path__ = [folder]
+            sys.modules[name] = package
+
+
+def getArguments():
+    """
+    The script arguments, after "--" when run by blender.
+    """
+    if "--" in sys.argv:
+        return sys.argv[sys.argv.index("--")+1:]
+    elif os.path.basename(sys.argv[0]).startswith("blender"):
+        return []
+    else:
+        return sys.argv[1:]
+
+
+def getBlenderVersion():
+    import bpy
+    return "Blender %d.%d.%d" % tuple(bpy.app.version)
+
+
+def makeSyntheticMesh(nverts, seed=0):
+    """
+    A closed quad grid, wrapped around a cylinder, with nverts vertices
+    and one uv coordinate per vertex, like a MakeHuman mesh section.
+    The vertices that do not fit in the grid are left loose at the end.
+    """
+    nu = int(np.sqrt(nverts/2))
+    nv = nverts//nu
+    u,v = np.meshgrid(np.arange(nu), np.arange(nv), indexing="ij")
+    angle = 2*np.pi*u/nu
+    rng = np.random.default_rng(seed)
+    verts = np.stack([np.cos(angle), np.sin(angle), v/nv], axis=-1).reshape(-1,3)
+    verts = np.concatenate([verts, rng.random((nverts-len(verts),3))])
+    verts += rng.normal(0, 1e-3, verts.shape)
+    vnums = np.arange(nu*nv).reshape(nu,nv)
+    nxt = np.roll(vnums, -1, axis=0)
+    faces = np.stack([vnums[:,:-1], nxt[:,:-1], nxt[:,1:], vnums[:,1:]], axis=-1).reshape(-1,4)
+    return {
+        "vertices" : verts.astype(np.float32),
+        "faces" : faces.astype(np.int32),
+        "uv_coordinates" : np.concatenate([
+            np.stack([u/nu, v/nv], axis=-1).reshape(-1,2),
+            np.zeros((nverts-nu*nv,2))]).astype(np.float32),
+        "uv_faces" : faces.astype(np.int32),
+    }
+
+
+def bestTime(func, repeat=5, cleanup=None):
+    """
+    Return the best of repeat timings of func(), calling cleanup on the
+    result after each run.
+    """
+    best = None
+    for n in range(repeat):
+        time1 = time.perf_counter()
+        result = func()
+        time2 = time.perf_counter()
+        if cleanup:
+            cleanup(result)
+        if best is None or time2-time1 < best:
+            best = time2-time1
+    return best